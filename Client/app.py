@@ -2,7 +2,7 @@ import streamlit as st
 from components.upload import render_uploader
 from components.history_download import render_history_download
 from components.chatUI import render_chat
-from utils.patient_history_store import load_all_histories, save_history, get_history
+from utils.patient_history_store import list_profiles, save_history, get_history
 import datetime
 
 st.set_page_config(page_title="AI Pocket MDT", layout="wide")
@@ -17,8 +17,7 @@ page = st.sidebar.radio(
 # --- Patient History Page ---
 def patient_history_page():
     st.header("Patient History Intake")
-    all_histories = load_all_histories()
-    profile_names = list(all_histories.keys())
+    profile_names = list_profiles()
     selected_profile = st.selectbox(
         "Select your profile",
         ["New Profile"] + profile_names,
@@ -202,8 +201,9 @@ def patient_history_page():
                     "health_goals": health_goals if health_goals else None,
                     "symptoms": symptoms
                 }
-                print(f"Saving profile data for {profile_id}: {data}")
                 save_history(profile_id, data)
+                # The server copy is re-synced with the next question
+                st.session_state.setdefault("profile_versions", {}).pop(profile_id, None)
                 st.success(f"Profile '{profile_id}' saved!")
 
 # --- Main App Routing ---
@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.api import ask_question
+from utils.api import get_client
 from utils.patient_history_store import get_history
 
 
@@ -42,7 +42,15 @@ def render_chat():
                 print(f"Warning: Patient history for {user_id} is not a dictionary: {type(patient_history)}")
                 patient_history = None
 
-        response = ask_question(user_input, user_id, patient_history)
+        profile_version = sync_profile(user_id, patient_history) if patient_history else None
+        response = get_client().ask_question(user_input, user_id, patient_history if profile_version is None else None,
+                                profile_version=profile_version)
+        if response.status_code == 409 and profile_version is not None:
+            # The server lost its copy (deleted or reset); store it again, or send it inline
+            st.session_state["profile_versions"].pop(user_id, None)
+            profile_version = sync_profile(user_id, patient_history)
+            response = get_client().ask_question(user_input, user_id, patient_history if profile_version is None else None,
+                                    profile_version=profile_version)
         if response.status_code == 200:
             data = response.json()
             answer = (
@@ -64,4 +72,23 @@ def render_chat():
             #         st.markdown(f"- `{src}`")
             st.session_state.messages.append({"role": "assistant", "content": answer})
         else:
-            st.error(f"Error: {response.text}")
\ No newline at end of file
+            st.error(f"Error: {response.text}")
+
+def sync_profile(user_id, patient_history):
+    """
+    Version of the server's copy of the profile, uploading it once per
+    session (and again after it is edited); None if the server could not
+    store it, in which case the history is sent inline with the question
+    """
+    versions = st.session_state.setdefault("profile_versions", {})
+    if user_id not in versions:
+        try:
+            response = get_client().save_profile(user_id, patient_history)
+            if response.status_code != 200:
+                print(f"Warning: could not store profile for {user_id}: {response.status_code}")
+                return None
+            versions[user_id] = response.json()["version"]
+        except Exception as e:
+            print(f"Warning: could not store profile for {user_id}: {e}")
+            return None
+    return versions[user_id]
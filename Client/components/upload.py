@@ -1,5 +1,43 @@
+import time
 import streamlit as st
-from utils.api import upload_pdfs_api
+from utils.api import get_client
+
+JOB_POLL_SECONDS = 1.0
+
+
+def wait_for_upload_job(job_id, user_id):
+    """Poll a background ingestion job and show per-file progress until it finishes"""
+    bar = st.sidebar.progress(0.0, text="Queued...")
+    details = st.sidebar.empty()
+    while True:
+        response = get_client().get_upload_job(job_id, user_id)
+        if response.status_code != 200:
+            bar.empty()
+            return None
+        job = response.json()
+        total = job["chunks_total"]
+        fraction = job["chunks_done"] / total if total else 0.0
+        if job["status"] in ("succeeded", "failed"):
+            fraction = 1.0
+        bar.progress(min(fraction, 1.0), text=f"{job['status'].capitalize()}: {job['chunks_done']}/{total} chunks")
+        details.caption("\n".join(
+            f"{f['filename']}: {f['stage']}" + (f" ({f['chunks_done']}/{f['chunks_total']})" if f.get("chunks_total") else "")
+            for f in job["files"]
+        ))
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(JOB_POLL_SECONDS)
+
+
+def render_upload_progress(placeholder):
+    """Per-file upload progress callback drawing into a sidebar placeholder"""
+    def on_progress(files):
+        with placeholder.container():
+            for f in files:
+                fraction = f["sent"] / f["size"] if f["size"] else 1.0
+                label = f"{f['sent'] // 1024}/{f['size'] // 1024} KB" if f["needed"] else "already on server"
+                st.progress(min(fraction, 1.0), text=f"{f['filename']}: {label}")
+    return on_progress
 
 
 def render_uploader():
@@ -15,8 +53,21 @@ def render_uploader():
         return
     
     if st.sidebar.button("Upload DB") and uploaded_files and user_id:
-        response = upload_pdfs_api(uploaded_files, user_id)
-        if response.status_code == 200:
+        client = get_client()
+        progress = st.sidebar.empty()
+        # Only files the server lacks are sent, in resumable chunks
+        response = client.upload_documents(uploaded_files, user_id, on_progress=render_upload_progress(progress))
+        if response.status_code == 404:
+            # Server without resumable uploads
+            response = client.upload_pdfs(uploaded_files, user_id)
+        progress.empty()
+        if response.status_code == 202:
+            job = wait_for_upload_job(response.json()["job_id"], user_id)
+            if job and job["status"] == "succeeded":
+                st.sidebar.success(f"Uploaded successfully for {user_id}")
+            else:
+                st.sidebar.error(f"Error: {job['error'] if job else 'upload job not found'}")
+        elif response.status_code == 200:
             st.sidebar.success(f"Uploaded successfully for {user_id}")
         else:
             st.sidebar.error(f"Error: {response.text}")
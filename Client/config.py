@@ -1,2 +1,11 @@
 #API_URL="http://127.0.0.1:8000"
-API_URL="https://pocketmdt.onrender.com"
\ No newline at end of file
+API_URL="https://pocketmdt.onrender.com"
+
+# API client: seconds to connect / wait for a response, retries on 429, 5xx and
+# connection errors, and keep-alive connections per client
+API_CONNECT_TIMEOUT=5.0
+API_READ_TIMEOUT=180.0
+API_MAX_RETRIES=3
+API_MAX_CONNECTIONS=10
+# Files sent at once in a resumable upload
+UPLOAD_CONCURRENCY=3
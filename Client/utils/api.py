@@ -1,27 +1,345 @@
-import requests
+"""
+PocketMDT API client.
+
+Sync and async clients over one persistent httpx connection pool each, so
+chat turns reuse a keep-alive TLS connection instead of opening a new one.
+Requests have connect/read timeouts and are retried with exponential
+backoff (honouring Retry-After). Idempotent requests are retried on 429,
+5xx and connection errors. POSTs such as /ask/ are only retried when the
+server cannot have run them: connection failures before the request was
+sent, 429, 503, or another retryable status that carries Retry-After.
+Responses are gzip-compressed by the server and decoded transparently.
+
+Documents go up through resumable upload sessions: the client sends the
+hashes of the document set, uploads only the files the server lacks, in
+chunks and several files at a time, and resumes each file from the offset
+the server reports after a failure.
+
+The Streamlit components share one sync client across reruns through
+get_client().
+"""
+
 import json
-from config import API_URL
-
-
-def upload_pdfs_api(files, user_id):
-    files_payload = [("files", (f.name, f.read(), "application/pdf")) for f in files]
-    data = {"user_id": user_id}
-    return requests.post(f"{API_URL}/upload_pdfs/", files=files_payload, data=data)
-
-def ask_question(question, user_id, patient_history=None):
-    data = {"question": question, "user_id": user_id}
-    print(f"API call - user_id: {user_id}, patient_history type: {type(patient_history)}")
-    
-    # Enhanced validation
-    if patient_history and isinstance(patient_history, dict) and patient_history:
-        # Additional validation to ensure it's a proper patient history object
-        if "name" in patient_history and "dob" in patient_history:
-            # Convert dictionary to JSON string for form submission
-            data["patient_history"] = json.dumps(patient_history)
-            print(f"API call - sending patient_history: {data['patient_history'][:100]}...")
-        else:
-            print(f"API call - patient_history missing required fields: {list(patient_history.keys())}")
-    else:
-        print(f"API call - no patient_history sent (value: {patient_history})")
-    
-    return requests.post(f"{API_URL}/ask/", data=data)
\ No newline at end of file
+import time
+import random
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import httpx
+import streamlit as st
+
+from config import (
+    API_URL, API_CONNECT_TIMEOUT, API_READ_TIMEOUT, API_MAX_RETRIES, API_MAX_CONNECTIONS, UPLOAD_CONCURRENCY
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Statuses meaning the request was turned away before it was handled
+REJECTED_STATUSES = {429, 503}
+# Transport errors raised before the request reached the server
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+# Times one file's upload re-syncs its offset with the server before giving up
+MAX_UPLOAD_RESUMES = 5
+
+
+def _retry_delay(attempt, response=None):
+    """Seconds to wait before retry number `attempt` (0-based)"""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** attempt, BACKOFF_MAX_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class _ClientBase:
+    def __init__(self, base_url=API_URL, connect_timeout=API_CONNECT_TIMEOUT, read_timeout=API_READ_TIMEOUT,
+                 max_retries=API_MAX_RETRIES, max_connections=API_MAX_CONNECTIONS):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self._options = {
+            "base_url": self.base_url,
+            "timeout": httpx.Timeout(read_timeout, connect=connect_timeout),
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            "headers": {"Accept-Encoding": "gzip"},
+        }
+
+    def _should_retry(self, method, attempt, response=None, error=None):
+        if attempt >= self.max_retries:
+            return False
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        if error is not None:
+            return isinstance(error, httpx.TransportError if idempotent else UNSENT_ERRORS)
+        if response.status_code not in RETRY_STATUSES:
+            return False
+        # A POST that failed with 500 or a gateway error may already have run (an /ask/ LLM call)
+        return idempotent or response.status_code in REJECTED_STATUSES or "Retry-After" in response.headers
+
+    @staticmethod
+    def _document_set(files):
+        """(file list for the session, {sha256: bytes}) for uploaded file objects"""
+        listed, contents = [], {}
+        for f in files:
+            data = f.getvalue() if hasattr(f, "getvalue") else f.read()
+            file_hash = hashlib.sha256(data).hexdigest()
+            listed.append({"filename": f.name, "sha256": file_hash, "size": len(data)})
+            contents[file_hash] = data
+        return listed, contents
+
+    @staticmethod
+    def _progress(status, sent):
+        """Per-file {filename, size, sent, needed} from a session status and the bytes confirmed since"""
+        return [{"filename": f["filename"], "size": f["size"], "sent": sent.get(f["sha256"], f["received"]),
+                 "needed": f["needed"]} for f in status["files"]]
+
+    @staticmethod
+    def _upload_payload(files, user_id):
+        return {
+            "files": [("files", (f.name, f.getvalue() if hasattr(f, "getvalue") else f.read(), "application/pdf"))
+                      for f in files],
+            "data": {"user_id": user_id},
+        }
+
+    @staticmethod
+    def _ask_payload(question, user_id, patient_history=None, profile_version=None):
+        data = {"question": question, "user_id": user_id}
+        if profile_version is not None:
+            # The server formats its stored copy of the profile; no need to send it
+            data["profile_version"] = profile_version
+        elif patient_history and isinstance(patient_history, dict):
+            if "name" in patient_history and "dob" in patient_history:
+                data["patient_history"] = json.dumps(patient_history)
+        return {"data": data}
+
+
+class PocketMDTClient(_ClientBase):
+    """Blocking client with a keep-alive connection pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = httpx.Client(**self._options)
+
+    def request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(method, attempt, error=e):
+                    raise
+                delay = _retry_delay(attempt)
+            else:
+                if not self._should_retry(method, attempt, response=response):
+                    return response
+                delay = _retry_delay(attempt, response)
+            print(f"API {method} {path} failed (attempt {attempt + 1}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def upload_pdfs(self, files, user_id):
+        return self.request("POST", "/upload_pdfs/", **self._upload_payload(files, user_id))
+
+    def _send_file(self, session_id, user_id, file_hash, data, offset, chunk_size, sent):
+        """Upload one file from `offset`, re-syncing with the server after failures; returns an error response or None"""
+        path = f"/upload_sessions/{session_id}/files/{file_hash}"
+        resumes = 0
+        while offset < len(data):
+            try:
+                response = self.request("PUT", path, params={"user_id": user_id, "offset": offset},
+                                        content=data[offset:offset + chunk_size])
+            except httpx.TransportError:
+                if resumes >= MAX_UPLOAD_RESUMES:
+                    raise
+                resumes += 1
+                offset = self._received(session_id, user_id, file_hash, offset)
+                continue
+            if response.status_code == 409 and resumes < MAX_UPLOAD_RESUMES:
+                # Part of an earlier attempt arrived; continue from what the server has
+                resumes += 1
+                offset = response.json()["received"]
+                continue
+            if response.status_code != 200:
+                return response
+            offset = response.json()["received"]
+            sent[file_hash] = offset
+        return None
+
+    def _received(self, session_id, user_id, file_hash, fallback):
+        try:
+            status = self.get_upload_session(session_id, user_id).json()
+        except (httpx.HTTPError, ValueError):
+            return fallback
+        return next((f["received"] for f in status.get("files", []) if f["sha256"] == file_hash), fallback)
+
+    def get_upload_session(self, session_id, user_id):
+        return self.request("GET", f"/upload_sessions/{session_id}", params={"user_id": user_id})
+
+    def upload_documents(self, files, user_id, clear_existing=False, on_progress=None, concurrency=UPLOAD_CONCURRENCY):
+        """
+        Upload a document set through a resumable session: only files the
+        server lacks are sent, `concurrency` at a time. `on_progress` is
+        called from this thread with per-file progress. Returns the commit
+        response (202 with the ingestion job), or the first failed response.
+        """
+        listed, contents = self._document_set(files)
+        response = self.request("POST", "/upload_sessions/",
+                                json={"user_id": user_id, "files": listed, "clear_existing": clear_existing})
+        if response.status_code != 201:
+            return response
+        status = response.json()
+        session_id, sent = status["session_id"], {}
+        pending = [f for f in status["files"] if not f["complete"]]
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [
+                pool.submit(self._send_file, session_id, user_id, f["sha256"], contents[f["sha256"]],
+                            f["received"], status["chunk_size"], sent)
+                for f in pending
+            ]
+            while True:
+                done, not_done = wait(futures, timeout=0.25)
+                if on_progress:
+                    on_progress(self._progress(status, sent))
+                if not not_done:
+                    break
+        for future in futures:
+            failed = future.result()
+            if failed is not None:
+                return failed
+        return self.request("POST", f"/upload_sessions/{session_id}/commit", params={"user_id": user_id})
+
+    def get_upload_job(self, job_id, user_id):
+        return self.request("GET", f"/upload_jobs/{job_id}", params={"user_id": user_id})
+
+    def ask_question(self, question, user_id, patient_history=None, profile_version=None):
+        return self.request("POST", "/ask/", **self._ask_payload(question, user_id, patient_history, profile_version))
+
+    def save_profile(self, user_id, patient_history):
+        """Store the patient history on the server; the response carries its version"""
+        return self.request("PUT", f"/profiles/{user_id}", json=patient_history)
+
+    def close(self):
+        self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncPocketMDTClient(_ClientBase):
+    """asyncio client with a keep-alive connection pool; requests can run concurrently"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = httpx.AsyncClient(**self._options)
+
+    async def request(self, method, path, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                response = await self._http.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self._should_retry(method, attempt, error=e):
+                    raise
+                delay = _retry_delay(attempt)
+            else:
+                if not self._should_retry(method, attempt, response=response):
+                    return response
+                delay = _retry_delay(attempt, response)
+            print(f"API {method} {path} failed (attempt {attempt + 1}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def upload_pdfs(self, files, user_id):
+        return await self.request("POST", "/upload_pdfs/", **self._upload_payload(files, user_id))
+
+    async def _send_file(self, session_id, user_id, file_hash, data, offset, chunk_size, sent):
+        """Upload one file from `offset`, re-syncing with the server after failures; returns an error response or None"""
+        path = f"/upload_sessions/{session_id}/files/{file_hash}"
+        resumes = 0
+        while offset < len(data):
+            try:
+                response = await self.request("PUT", path, params={"user_id": user_id, "offset": offset},
+                                              content=data[offset:offset + chunk_size])
+            except httpx.TransportError:
+                if resumes >= MAX_UPLOAD_RESUMES:
+                    raise
+                resumes += 1
+                offset = await self._received(session_id, user_id, file_hash, offset)
+                continue
+            if response.status_code == 409 and resumes < MAX_UPLOAD_RESUMES:
+                # Part of an earlier attempt arrived; continue from what the server has
+                resumes += 1
+                offset = response.json()["received"]
+                continue
+            if response.status_code != 200:
+                return response
+            offset = response.json()["received"]
+            sent[file_hash] = offset
+        return None
+
+    async def _received(self, session_id, user_id, file_hash, fallback):
+        try:
+            status = (await self.get_upload_session(session_id, user_id)).json()
+        except (httpx.HTTPError, ValueError):
+            return fallback
+        return next((f["received"] for f in status.get("files", []) if f["sha256"] == file_hash), fallback)
+
+    async def get_upload_session(self, session_id, user_id):
+        return await self.request("GET", f"/upload_sessions/{session_id}", params={"user_id": user_id})
+
+    async def upload_documents(self, files, user_id, clear_existing=False, on_progress=None,
+                               concurrency=UPLOAD_CONCURRENCY):
+        """Async counterpart of PocketMDTClient.upload_documents"""
+        listed, contents = self._document_set(files)
+        response = await self.request("POST", "/upload_sessions/",
+                                      json={"user_id": user_id, "files": listed, "clear_existing": clear_existing})
+        if response.status_code != 201:
+            return response
+        status = response.json()
+        session_id, sent = status["session_id"], {}
+        limit = asyncio.Semaphore(max(1, concurrency))
+
+        async def send(f):
+            async with limit:
+                failed = await self._send_file(session_id, user_id, f["sha256"], contents[f["sha256"]],
+                                               f["received"], status["chunk_size"], sent)
+            if on_progress:
+                on_progress(self._progress(status, sent))
+            return failed
+
+        results = await asyncio.gather(*(send(f) for f in status["files"] if not f["complete"]))
+        failed = next((r for r in results if r is not None), None)
+        if failed is not None:
+            return failed
+        return await self.request("POST", f"/upload_sessions/{session_id}/commit", params={"user_id": user_id})
+
+    async def get_upload_job(self, job_id, user_id):
+        return await self.request("GET", f"/upload_jobs/{job_id}", params={"user_id": user_id})
+
+    async def ask_question(self, question, user_id, patient_history=None, profile_version=None):
+        return await self.request("POST", "/ask/", **self._ask_payload(question, user_id, patient_history, profile_version))
+
+    async def save_profile(self, user_id, patient_history):
+        """Store the patient history on the server; the response carries its version"""
+        return await self.request("PUT", f"/profiles/{user_id}", json=patient_history)
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+@st.cache_resource
+def get_client():
+    """One pooled client per Streamlit server process, shared across sessions and reruns"""
+    return PocketMDTClient()
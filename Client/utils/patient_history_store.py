@@ -1,37 +1,164 @@
-import json
+"""
+Patient history store for the Streamlit client.
+
+Profiles live in a SQLite table, one row per profile holding its JSON, so
+reading or saving one profile does not touch the others. Writes are single
+upserts in their own transaction, safe under concurrent sessions and
+processes. Reads are served from an in-process cache that is dropped on
+every local write and whenever SQLite reports that another connection has
+committed (PRAGMA data_version), so Streamlit reruns do not hit the disk.
+
+Profiles from the old `patient_histories.json` file are imported the first
+time the database is created.
+"""
+
 import os
+import copy
+import json
+import sqlite3
+import threading
+from datetime import datetime
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), 'patient_histories.json')
+DB_PATH = os.getenv("PATIENT_HISTORY_DB", os.path.join(os.path.dirname(__file__), 'patient_histories.sqlite3'))
+
+
+class PatientHistoryStore:
+    def __init__(self, path=DB_PATH, legacy_json_path=DATA_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS patient_histories (
+                profile_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );"""
+        )
+        self._conn.commit()
+        self._profiles = {}
+        self._names = None
+        self._data_version = None
+        self.migrate_json(legacy_json_path)
+
+    def migrate_json(self, json_path):
+        """Import profiles from the legacy JSON file once; existing rows win"""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            histories = {}
+            if os.path.exists(json_path):
+                try:
+                    with open(json_path, 'r') as f:
+                        histories = json.load(f)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Error reading legacy patient histories for migration: {e}")
+                    return 0
+            now = datetime.now().isoformat()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO patient_histories (profile_id, data, updated_at) VALUES (?, ?, ?)",
+                    [(profile_id, json.dumps(data), now) for profile_id, data in histories.items() if isinstance(data, dict)]
+                )
+                self._conn.execute("INSERT OR IGNORE INTO store_meta VALUES ('json_migrated', ?)", (now,))
+            self._invalidate()
+        if histories:
+            print(f"Migrated {len(histories)} patient histories from {json_path}")
+        return len(histories)
+
+    def _invalidate(self):
+        self._profiles.clear()
+        self._names = None
+
+    def _check_external_writes(self):
+        """Drop the cache if another connection committed since it was filled; call with the lock held"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._invalidate()
+            self._data_version = data_version
+
+    def profile_ids(self):
+        with self._lock:
+            self._check_external_writes()
+            if self._names is None:
+                self._names = [row[0] for row in self._conn.execute(
+                    "SELECT profile_id FROM patient_histories ORDER BY rowid"
+                )]
+            return list(self._names)
+
+    def get(self, profile_id):
+        with self._lock:
+            self._check_external_writes()
+            if profile_id not in self._profiles:
+                row = self._conn.execute(
+                    "SELECT data FROM patient_histories WHERE profile_id = ?", (profile_id,)
+                ).fetchone()
+                self._profiles[profile_id] = json.loads(row[0]) if row else None
+            data = self._profiles[profile_id]
+        # Callers edit the lists in place before saving
+        return copy.deepcopy(data)
+
+    def all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT profile_id, data FROM patient_histories ORDER BY rowid").fetchall()
+        return {profile_id: json.loads(data) for profile_id, data in rows}
+
+    def save(self, profile_id, data):
+        payload = json.dumps(data)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO patient_histories (profile_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(profile_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    (profile_id, payload, datetime.now().isoformat())
+                )
+            self._invalidate()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PatientHistoryStore()
+        return _store
+
+
+def list_profiles():
+    """Profile IDs in the order they were created"""
+    try:
+        return get_store().profile_ids()
+    except sqlite3.Error as e:
+        print(f"Error listing patient histories: {e}")
+        return []
 
 def load_all_histories():
-    if not os.path.exists(DATA_PATH):
-        return {}
     try:
-        with open(DATA_PATH, 'r') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError, IOError) as e:
+        return get_store().all()
+    except sqlite3.Error as e:
         print(f"Error loading patient histories: {e}")
         return {}
 
 def save_history(profile_id, data):
     try:
-        print(f"save_history called for {profile_id} with data type: {type(data)}")
-        histories = load_all_histories()
-        histories[profile_id] = data
-        print(f"Writing to {DATA_PATH}: {histories}")
-        with open(DATA_PATH, 'w') as f:
-            json.dump(histories, f, indent=2)
+        get_store().save(profile_id, data)
         print(f"Successfully saved profile {profile_id}")
-    except (IOError, TypeError) as e:
+    except (sqlite3.Error, TypeError) as e:
         print(f"Error saving patient history for {profile_id}: {e}")
 
 def get_history(profile_id):
     try:
-        print(f"get_history called for {profile_id}")
-        histories = load_all_histories()
-        print(f"All histories: {histories}")
-        history_data = histories.get(profile_id, {})
-        print(f"Retrieved data for {profile_id}: {type(history_data)} - {history_data}")
+        history_data = get_store().get(profile_id)
+        if history_data is None:
+            return {}
         # Ensure we always return a dictionary, not a string or other type
         if not isinstance(history_data, dict):
             print(f"Warning: Patient history for {profile_id} is not a dictionary: {type(history_data)}")
@@ -39,4 +166,4 @@ def get_history(profile_id):
         return history_data
     except Exception as e:
         print(f"Error getting patient history for {profile_id}: {e}")
-        return {} 
\ No newline at end of file
+        return {}
@@ -1,39 +1,186 @@
-import logging
+"""
+Logging
+
+Request threads only put records on an in-memory queue; a QueueListener
+thread formats them as JSON lines and writes them to the console and a
+size-rotated file, so disk and terminal I/O never block a request.
+
+Every record carries the ID of the request it was logged under (set by the
+request ID middleware), chatty levels can be sampled, and values that look
+like protected health information are redacted by default: fields such as
+`question` or `patient_history` passed via `extra`, and dates, emails,
+phone and SSN-shaped numbers in messages.
+"""
+
 import os
-from datetime import datetime
+import re
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_REDACT = os.getenv("LOG_REDACT", "1") != "0"
+# Fraction of records kept per level, e.g. "DEBUG=0.1,INFO=1"; WARNING and above are never sampled
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "DEBUG=0.1")
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Record attributes that are part of every LogRecord rather than caller-supplied extras
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+REDACTED = "[REDACTED]"
+PHI_FIELDS = {
+    "question", "patient_history", "patient_data", "history", "name", "dob", "date_of_birth",
+    "email", "phone", "address", "ssn", "conditions", "medications", "symptoms", "text", "content",
+}
+_PHI_PATTERNS = [
+    re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b"),  # email
+    re.compile(r"\b\d{3}-\d{2}-\d{4}\b"),  # SSN
+    re.compile(r"(?<!\d)(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]\d{3}[ .-]\d{4}(?!\d)"),  # phone
+    re.compile(r"\b(?:19|20)\d{2}-\d{2}-\d{2}\b"),  # ISO date
+    re.compile(r"\b\d{1,2}/\d{1,2}/(?:19|20)?\d{2}\b"),  # US date
+]
+
+
+def redact_text(text: str) -> str:
+    for pattern in _PHI_PATTERNS:
+        text = pattern.sub(REDACTED, text)
+    return text
+
+
+def _parse_sample_rates(spec: str):
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        level, _, rate = part.partition("=")
+        level_no = logging.getLevelName(level.strip().upper())
+        if isinstance(level_no, int) and level_no < logging.WARNING:
+            rates[level_no] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request ID; runs on the logging thread's caller"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at the configured chatty levels"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request ID, extras and, optionally, PHI redaction"""
+
+    def __init__(self, redact: bool = LOG_REDACT):
+        super().__init__()
+        self.redact = redact
+
+    def format(self, record):
+        message = record.getMessage()
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": redact_text(message) if self.redact else message,
+        }
+        for key, value in record.__dict__.items():
+            if key in _RESERVED or key.startswith("_"):
+                continue
+            if self.redact and key.lower() in PHI_FIELDS:
+                value = REDACTED
+            elif self.redact and isinstance(value, str):
+                value = redact_text(value)
+            entry[key] = value
+        if record.exc_text:
+            entry["exception"] = redact_text(record.exc_text) if self.redact else record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        """
+        Merge args and render the traceback on the caller's thread (they may
+        not survive the hand-off), but leave formatting to the listener
+        """
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+# One listener thread per logger set up here, keyed by logger name
+_listeners = {}
+
 
 def setup_logger(name="POCKET_MDT"):
     logger=logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    if logger.hasHandlers():
+        return logger
 
     # Create logs directory if it doesn't exist
-    logs_dir = "logs"
-    if not os.path.exists(logs_dir):
-        os.makedirs(logs_dir)
+    os.makedirs(LOG_DIR, exist_ok=True)
 
-    # Create a unique log file name with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_filename = f"{logs_dir}/pocket_mdt_{timestamp}.log"
+    formatter = JsonFormatter()
 
     # Console handler
     ch=logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-
-    # File handler for tracing
-    fh=logging.FileHandler(log_filename)
-    fh.setLevel(logging.DEBUG)
-
-    formatter=logging.Formatter("[%(asctime)s] [%(levelname)s] --- [%(message)s]")
     ch.setFormatter(formatter)
+
+    # Size-rotated file handler for tracing
+    fh=RotatingFileHandler(os.path.join(LOG_DIR, "pocket_mdt.log"), maxBytes=LOG_MAX_BYTES,
+                           backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
     fh.setFormatter(formatter)
 
-    if not logger.hasHandlers():
-        logger.addHandler(ch)
-        logger.addHandler(fh)
+    # Callers only enqueue; the listener thread formats and writes
+    log_queue = queue.SimpleQueue()
+    qh = _QueueHandler(log_queue)
+    qh.addFilter(SamplingFilter(_parse_sample_rates(LOG_SAMPLE_RATES)))
+    qh.addFilter(RequestContextFilter())
+    logger.addHandler(qh)
+
+    listener = QueueListener(log_queue, ch, fh, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
 
     return logger
 
 
+def stop_logging(name=None):
+    """Flush queued records and stop the listener thread of one logger, or of all of them"""
+    for key in [name] if name else list(_listeners):
+        listener = _listeners.pop(key, None)
+        if listener is not None:
+            listener.stop()
 
-logger=setup_logger()
 
+atexit.register(stop_logging)
+
+
+
+logger=setup_logger()
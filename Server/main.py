@@ -1,12 +1,36 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from middlewares.exception_handlers import catch_exception_middleware
+from middlewares.request_context import request_id_middleware
 from routes.upload_pdfs import router as upload_router
 from routes.ask_questions import router as ask_router
+from routes.metrics import router as metrics_router
+from routes.upload_jobs import router as upload_jobs_router
+from routes.health import router as health_router
+from routes.patient_profiles import router as profiles_router
+from routes.upload_sessions import router as upload_sessions_router
+from modules.ingest_jobs import get_job_manager
+from modules.pdf_extraction import shutdown_parse_pool
+from modules.warmup import warm_up
 
 
 
-app=FastAPI(title="Pocket MDT API",description="API for Pocket MDT Chatbot")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index verification and cache warm-up run in the background; /ready flips when done
+    warmup_task = asyncio.create_task(warm_up())
+    # Background ingestion workers resume any queued or interrupted jobs
+    await get_job_manager().start()
+    yield
+    warmup_task.cancel()
+    await get_job_manager().stop()
+    shutdown_parse_pool()
+
+
+app=FastAPI(title="Pocket MDT API",description="API for Pocket MDT Chatbot",lifespan=lifespan)
 
 # CORS Setup
 app.add_middleware(
@@ -18,12 +42,27 @@ app.add_middleware(
 )
 
 
+# Compress larger responses for clients that accept gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # middleware exception handlers
 app.middleware("http")(catch_exception_middleware)
+# request IDs and latency for every log line (outermost, so it also sees unhandled errors)
+app.middleware("http")(request_id_middleware)
 
 # routers
 
 # 1. upload pdfs documents
 app.include_router(upload_router)
 # 2. asking query
-app.include_router(ask_router)
\ No newline at end of file
+app.include_router(ask_router)
+# 3. operational metrics
+app.include_router(metrics_router)
+# 4. background upload job status
+app.include_router(upload_jobs_router)
+# 5. liveness and readiness
+app.include_router(health_router)
+# 6. stored patient profiles
+app.include_router(profiles_router)
+# 7. resumable uploads
+app.include_router(upload_sessions_router)
\ No newline at end of file
@@ -0,0 +1,27 @@
+import time
+import uuid
+from fastapi import Request
+from logger import logger, request_id_var
+
+
+async def request_id_middleware(request: Request, call_next):
+    """Tag everything logged during a request with its ID and log the request's latency"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+        response.headers["X-Request-ID"] = request_id
+        response.headers["Server-Timing"] = f"app;dur={duration_ms:.1f}"
+        # The route template, not the raw path, which can contain user IDs
+        route = request.scope.get("route")
+        logger.info("request completed", extra={
+            "method": request.method,
+            "route": getattr(route, "path", "unmatched"),
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 1),
+        })
+        return response
+    finally:
+        request_id_var.reset(token)
@@ -1,6 +1,6 @@
 import openai
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
 import os
 from dotenv import load_dotenv
@@ -18,11 +18,12 @@ logger = logging.getLogger(__name__)
 
 # Import the dynamic agent loader
 from .agent_loader import AgentLoader
+from modules.embedding_cache import get_embedding_model
+from modules.specialties import specialty_for_agent
 
 class CentralOrchestratorAgent:
     def __init__(self, model_name="gpt-4", temperature=0, config_path: str = "config/agent_registry.json"):
         self.model_name = model_name
-        self.embedding_model = "text-embedding-ada-002"
         self.max_attempts = 3
         self.conversation_history = []
         
@@ -36,6 +37,11 @@ class CentralOrchestratorAgent:
         # Initialize dynamic agent loader
         self.agent_loader = AgentLoader(config_path)
         
+        # Routing embeds in the same model space as document retrieval so the
+        # query embedding can be shared; descriptions are served from the cache
+        self.embedding_model = self.agent_loader.get_embedding_model()
+        self.embedder = get_embedding_model(self.embedding_model)
+        
         # Initialize configuration issues tracking
         self._configuration_issues = []
         
@@ -126,17 +132,27 @@ class CentralOrchestratorAgent:
         retry=retry_if_exception_type((openai.APIError, openai.RateLimitError))
     )
     def get_embedding(self, text: str) -> List[float]:
-        """Fetch embedding vector for a given text using OpenAI Embedding API"""
+        """Fetch embedding vector for a given text using the configured embedding model"""
         try:
-            response = self.openai_client.embeddings.create(
-                input=[text],
-                model=self.embedding_model
-            )
-            return response.data[0].embedding
+            return self.embedder.embed_query(text)
         except Exception as e:
             logger.error(f"Error getting embedding: {e}")
             raise
 
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_fixed(1),
+        retry=retry_if_exception_type((openai.APIError, openai.RateLimitError))
+    )
+    def get_description_embeddings(self, agent_names: List[str]) -> Dict[str, List[float]]:
+        """Embed agent descriptions in one batch; repeat requests are served from the embedding cache"""
+        descriptions = {name: self.agent_loader.get_agent_description(name) for name in agent_names}
+        descriptions = {name: text for name, text in descriptions.items() if text}
+        if not descriptions:
+            return {}
+        vectors = self.embedder.embed_documents(list(descriptions.values()))
+        return dict(zip(descriptions.keys(), vectors))
+
     def cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         """Compute cosine similarity between two vectors"""
         a, b = np.array(a), np.array(b)
@@ -193,8 +209,16 @@ Format as a JSON array of strings.
                 "Which part of your health are you most concerned about?"
             ]
 
-    def route_request_with_embeddings(self, user_input: str, context: dict) -> Tuple[List[str], float]:
-        """Determine most relevant agent(s) using semantic matching and cross-specialty correlation"""
+    def route_request_with_embeddings(self, user_input: str, context: dict,
+                                      query_embedding: Optional[List[float]] = None) -> Tuple[List[str], float]:
+        """
+        Determine most relevant agent(s) using semantic matching and cross-specialty correlation
+        
+        Args:
+            user_input: The user's question or request
+            context: Agent context for this request
+            query_embedding: Embedding of user_input already computed for retrieval, if any
+        """
         user_input_lower = user_input.lower()
         available_agents = list(self.agent_loader.get_enabled_agents().keys())
         
@@ -240,15 +264,11 @@ Format as a JSON array of strings.
         
         # Generate user input embedding
         try:
-            user_vector = self.get_embedding(user_input)
+            user_vector = query_embedding if query_embedding is not None else self.get_embedding(user_input)
+            description_vectors = self.get_description_embeddings(available_agents)
             similarities = []
 
-            for agent_name in available_agents:
-                description = self.agent_loader.get_agent_description(agent_name)
-                if not description:
-                    continue
-
-                agent_vector = self.get_embedding(description)
+            for agent_name, agent_vector in description_vectors.items():
                 score = self.cosine_similarity(np.array(user_vector), np.array(agent_vector))
                 similarities.append((agent_name, score))
 
@@ -258,14 +278,15 @@ Format as a JSON array of strings.
             top_agents = []
             max_agents = self.agent_loader.config.get("settings", {}).get("max_agents_per_request", 3)
             
+            similarity_threshold = self.agent_loader.get_routing_similarity_threshold()
             for agent_name, score in similarities[:max_agents]:
-                if score > 0.7:  # Lower threshold to allow multiple specialists
+                if score > similarity_threshold:  # Lower threshold to allow multiple specialists
                     top_agents.append(agent_name)
             
             top_score = similarities[0][1] if similarities else 0.0
 
             # If it's a general question and no specialist has high confidence, prefer GeneralistAgent
-            if is_general_question and top_score < 0.8:
+            if is_general_question and top_score < self.agent_loader.get_general_question_specialist_threshold():
                 generalist_score = next((score for name, score in similarities if name == "GeneralistAgent"), 0.0)
                 generalist_threshold = self.agent_loader.get_generalist_confidence_threshold()
                 if generalist_score > generalist_threshold:
@@ -277,18 +298,48 @@ Format as a JSON array of strings.
             logger.error(f"Error in semantic routing: {e}")
             return [], 0.0
 
-    def create_context(self, user_input: str, document_context: str = "", conversation_history: Optional[List[Dict]] = None) -> dict:
+    def create_context(self, user_input: str, document_context: str = "", conversation_history: Optional[List[Dict]] = None,
+                       specialty_digests: Optional[Dict[str, str]] = None,
+                       specialist_context: Optional[Callable[[str], Optional[str]]] = None) -> dict:
         """Create a standardized context object for agents"""
         return {
             "user_input": user_input,
             "document_context": document_context,
             "conversation_history": conversation_history if conversation_history is not None else [],
             "timestamp": datetime.now().isoformat(),
-            "agent_registry": self.agent_loader.load_all_enabled_agents()
+            "agent_registry": self.agent_loader.load_all_enabled_agents(),
+            "specialty_digests": specialty_digests or {},
+            "specialist_context": specialist_context
         }
 
+    def agent_context(self, context: dict, agent_name: str) -> dict:
+        """
+        The context for one agent: specialists get chunks retrieved from their
+        own specialty's documents, when there are enough, and their specialty
+        digest ahead of them
+        """
+        specialty = specialty_for_agent(agent_name)
+        if not specialty:
+            return context
+        document_context = context["document_context"]
+        if context.get("specialist_context"):
+            try:
+                document_context = context["specialist_context"](specialty) or document_context
+            except Exception as e:
+                logger.warning(f"Specialist retrieval failed for {agent_name}, using shared context: {e}")
+        digest = context["specialty_digests"].get(specialty)
+        if digest:
+            document_context = (
+                f"SPECIALTY DIGEST ({specialty}; precomputed from all uploaded documents):\n{digest}\n\n"
+                f"{document_context}"
+            )
+        return {**context, "document_context": document_context}
+
     @retry(stop=stop_after_attempt(3), wait=wait_fixed(1))
-    def orchestrate(self, user_input: str, document_context: str = "", conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+    def orchestrate(self, user_input: str, document_context: str = "", conversation_history: Optional[List[Dict]] = None,
+                    query_embedding: Optional[List[float]] = None,
+                    specialty_digests: Optional[Dict[str, str]] = None,
+                    specialist_context: Optional[Callable[[str], Optional[str]]] = None) -> Dict[str, Any]:
         """
         Main orchestration method that routes requests and manages agent execution
         
@@ -296,6 +347,10 @@ Format as a JSON array of strings.
             user_input: The user's question or request
             document_context: Document content from vector store for context
             conversation_history: Previous conversation turns
+            query_embedding: Embedding of user_input computed during retrieval, reused for routing
+            specialty_digests: Per-specialty document digests, keyed by specialty label
+            specialist_context: Builds a specialist's document context from its specialty's
+                chunks; returns None to keep the shared document_context
             
         Returns:
             Dict containing either agent results or clarification request
@@ -316,10 +371,11 @@ Format as a JSON array of strings.
             }
         
         # Create context
-        context = self.create_context(user_input, document_context, conversation_history)
+        context = self.create_context(user_input, document_context, conversation_history, specialty_digests,
+                                      specialist_context)
         
         # Route request to appropriate agents
-        agents_to_run, confidence_score = self.route_request_with_embeddings(user_input, context)
+        agents_to_run, confidence_score = self.route_request_with_embeddings(user_input, context, query_embedding)
         
         # Store conversation turn
         self.conversation_history.append({
@@ -386,7 +442,7 @@ Format as a JSON array of strings.
                 agent_class = self.agent_loader.load_agent_class(agent_name)
                 if agent_class:
                     agent = agent_class()
-                    agent_result = agent.run(context)
+                    agent_result = agent.run(self.agent_context(context, agent_name))
                     results[agent_name] = {
                         "status": "success",
                         "output": agent_result,
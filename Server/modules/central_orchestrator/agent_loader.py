@@ -126,10 +126,30 @@ class AgentLoader:
         """Get the default confidence threshold"""
         return self.config.get("settings", {}).get("default_confidence_threshold", 0.75)
     
+    def get_embedding_model(self) -> str:
+        """Get the embedding model shared by document retrieval and agent routing"""
+        return self.config.get("settings", {}).get("embedding_model", "text-embedding-3-large")
+    
+    def get_routing_similarity_threshold(self) -> float:
+        """Get the minimum description similarity for a specialist to be routed to"""
+        return self.config.get("settings", {}).get("routing_similarity_threshold", 0.7)
+    
+    def get_general_question_specialist_threshold(self) -> float:
+        """Get the specialist score below which general questions go to GeneralistAgent"""
+        return self.config.get("settings", {}).get("general_question_specialist_threshold", 0.8)
+    
     def get_generalist_confidence_threshold(self) -> float:
         """Get the confidence threshold for GeneralistAgent routing"""
         return self.config.get("settings", {}).get("generalist_confidence_threshold", 0.3)
     
+    def is_trend_analysis_enabled(self) -> bool:
+        """Whether agents get the precomputed lab trend table"""
+        return self.config.get("settings", {}).get("enable_trend_analysis", False)
+    
+    def get_cross_specialty_keywords(self) -> Dict[str, List[str]]:
+        """Get keywords that implicate several specialties, mapped to those specialties"""
+        return self.config.get("settings", {}).get("cross_specialty_keywords", {})
+
     def get_fallback_questions(self) -> List[str]:
         """Get fallback questions for clarification"""
         return self.config.get("settings", {}).get("fallback_questions", [
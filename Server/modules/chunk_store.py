@@ -0,0 +1,156 @@
+"""
+Chunk Store
+
+Local, compressed storage for chunk text and rich metadata keyed by vector
+ID. The vector index only keeps the minimal fields needed for filtering;
+retrieval hydrates the winning matches from here in one batch read.
+
+Payloads are compressed with zstd when the optional `zstandard` package is
+installed, otherwise with zlib. The codec is recorded per row so both can
+be read back regardless of which is available.
+"""
+
+import os
+import json
+import zlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Iterable, Tuple, Optional
+
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", "./cache/chunks.sqlite3")
+
+# Fields kept in vector index metadata; everything else lives in the chunk store
+INDEX_METADATA_FIELDS = ("user_id", "filename", "specialties")
+
+try:
+    import zstandard
+
+    _ZSTD_COMPRESSOR = zstandard.ZstdCompressor(level=6)
+    _ZSTD_DECOMPRESSOR = zstandard.ZstdDecompressor()
+except ImportError:
+    zstandard = None
+
+
+def compress_payload(data: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", _ZSTD_COMPRESSOR.compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress_payload(codec: str, payload: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Chunk was stored with zstd but the zstandard package is not installed")
+        return _ZSTD_DECOMPRESSOR.decompress(payload)
+    return zlib.decompress(payload)
+
+
+def index_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """The minimal metadata subset stored alongside a vector"""
+    return {field: metadata[field] for field in INDEX_METADATA_FIELDS if field in metadata}
+
+
+class ChunkStore:
+    """SQLite table of compressed {text, metadata} payloads keyed by vector ID"""
+
+    def __init__(self, path: str = CHUNK_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                payload BLOB NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_user ON chunks(user_id)")
+        self._conn.commit()
+
+    def put_many(self, user_id: str, records: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """Store (id, text, metadata) records for a user"""
+        rows = []
+        for chunk_id, text, metadata in records:
+            codec, payload = compress_payload(json.dumps({"text": text, "metadata": metadata}).encode("utf-8"))
+            rows.append((chunk_id, user_id, codec, payload))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, user_id, codec, payload) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch {id: {"text", "metadata"}} for the given IDs in one read"""
+        found = {}
+        unique_ids = list(dict.fromkeys(ids))
+        with self._lock:
+            for i in range(0, len(unique_ids), 500):
+                part = unique_ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT id, codec, payload FROM chunks WHERE id IN ({placeholders})", part
+                ).fetchall()
+                for chunk_id, codec, payload in rows:
+                    found[chunk_id] = json.loads(decompress_payload(codec, payload))
+        return found
+
+    def user_chunks(self, user_id: str) -> Dict[str, str]:
+        """All of a user's chunk texts as {id: text}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, codec, payload FROM chunks WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return {chunk_id: json.loads(decompress_payload(codec, payload))["text"] for chunk_id, codec, payload in rows}
+
+    def user_ids(self) -> List[str]:
+        """Users that have chunks stored"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT user_id FROM chunks")]
+
+    def delete(self, ids: Iterable[str]):
+        """Delete chunks by ID"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in ids])
+            self._conn.commit()
+
+    def delete_user(self, user_id: str):
+        """Delete every chunk belonging to a user"""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+
+def hydrate_matches(matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Fill each match's metadata with its chunk text and rich metadata from
+    the chunk store. Matches for vectors written before the chunk store
+    existed keep whatever metadata the index returned.
+    """
+    if not matches:
+        return matches
+    stored = get_chunk_store().get_many([match["id"] for match in matches])
+    for match in matches:
+        chunk = stored.get(match["id"])
+        if chunk:
+            metadata = dict(chunk["metadata"])
+            metadata.update(match.get("metadata") or {})
+            metadata["text"] = chunk["text"]
+            match["metadata"] = metadata
+    return matches
+
+
+_chunk_store: Optional[ChunkStore] = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkStore:
+    """Process-wide chunk store instance"""
+    global _chunk_store
+    with _chunk_store_lock:
+        if _chunk_store is None:
+            _chunk_store = ChunkStore()
+        return _chunk_store
@@ -0,0 +1,233 @@
+"""
+Context Assembler
+
+Turns retrieved chunk matches into the document context handed to the
+agents. Candidates are re-ranked with maximal marginal relevance (MMR)
+using their vectors, adjacent or overlapping chunks from the same page are
+merged back together, and the result is packed into a token budget for the
+target model, counted locally with tiktoken.
+
+tiktoken downloads its encoding files on first use. Offline deployments
+should pre-populate TIKTOKEN_CACHE_DIR; if the encoding cannot be loaded,
+a warning is logged and tokens are estimated as one per four characters,
+so the budget is then approximate rather than exact.
+"""
+
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from logger import logger
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+CHUNK_SEPARATOR = "\n\n"
+# Used only when the tiktoken encoding cannot be loaded
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+_encoders: Dict[str, Any] = {}
+_encoders_lock = threading.Lock()
+
+
+def _get_encoder(model_name: str):
+    """tiktoken encoder for a model, or None if tiktoken cannot be loaded"""
+    with _encoders_lock:
+        if model_name not in _encoders:
+            try:
+                import tiktoken
+                try:
+                    _encoders[model_name] = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    _encoders[model_name] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(
+                    f"tiktoken encoding for {model_name} could not be loaded ({e}); token budgets are estimated "
+                    f"at {CHARS_PER_TOKEN_ESTIMATE} characters per token and may be exceeded. "
+                    f"Set TIKTOKEN_CACHE_DIR to a local copy of the encoding for exact counts"
+                )
+                _encoders[model_name] = None
+        return _encoders[model_name]
+
+
+def count_tokens(text: str, model_name: str = "gpt-4") -> int:
+    """Number of tokens `text` occupies for `model_name`; an estimate if tiktoken is unavailable"""
+    encoder = _get_encoder(model_name)
+    if encoder is None:
+        return -(-len(text) // CHARS_PER_TOKEN_ESTIMATE)
+    return len(encoder.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: List[str], model_name: str = "gpt-4") -> List[int]:
+    """Token counts for many texts in one tokenizer call"""
+    encoder = _get_encoder(model_name)
+    if encoder is None:
+        return [-(-len(text) // CHARS_PER_TOKEN_ESTIMATE) for text in texts]
+    return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = "gpt-4") -> str:
+    """Longest prefix of `text` that fits in `max_tokens`"""
+    if max_tokens <= 0:
+        return ""
+    encoder = _get_encoder(model_name)
+    if encoder is None:
+        return text[:max_tokens * CHARS_PER_TOKEN_ESTIMATE]
+    tokens = encoder.encode_ordinary(text)
+    return text if len(tokens) <= max_tokens else encoder.decode(tokens[:max_tokens])
+
+
+def mmr_order(query_vector: Optional[Sequence[float]], matches: List[Dict[str, Any]],
+              lambda_mult: float = MMR_LAMBDA) -> List[Dict[str, Any]]:
+    """
+    Order matches by maximal marginal relevance. Matches without vectors (or
+    a missing query vector) keep their retrieval order.
+    """
+    with_values = [match for match in matches if match.get("values")]
+    if query_vector is None or len(with_values) < 2:
+        return list(matches)
+
+    matrix = np.asarray([match["values"] for match in with_values], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = matrix @ query
+    pairwise = matrix @ matrix.T
+    selected: List[int] = []
+    remaining = list(range(len(with_values)))
+    while remaining:
+        if selected:
+            redundancy = pairwise[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = lambda_mult * relevance[remaining] - (1 - lambda_mult) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        selected.append(best)
+        remaining.remove(best)
+
+    ordered = [with_values[i] for i in selected]
+    return ordered + [match for match in matches if not match.get("values")]
+
+
+@dataclass
+class _Passage:
+    filename: str
+    page: Any
+    start: Optional[int]
+    text: str
+    rank: int
+    ids: List[str] = field(default_factory=list)
+    heading_chars: int = 0  # leading heading repeated from earlier on the page
+    previous_end: Optional[int] = None
+    end: Optional[int] = None
+
+    def __post_init__(self):
+        if self.start is not None and self.end is None:
+            self.end = self.start + len(self.text) - self.heading_chars
+
+
+def _merge_adjacent(matches: List[Dict[str, Any]]) -> List[_Passage]:
+    """
+    Merge chunks from the same file and page whose character ranges overlap
+    or touch, or that follow each other with only blank lines between them,
+    dropping the duplicated overlap and repeated headings. Passages keep the
+    best rank of the chunks they contain.
+    """
+    groups: Dict[tuple, List[_Passage]] = {}
+    for rank, match in enumerate(matches):
+        metadata = match.get("metadata", {})
+        text = metadata.get("text") or metadata.get("page_content") or ""
+        if not text.strip():
+            continue
+        passage = _Passage(
+            filename=metadata.get("filename", "unknown"),
+            page=metadata.get("page"),
+            start=metadata.get("start_index"),
+            text=text,
+            rank=rank,
+            ids=[match.get("id")],
+            heading_chars=metadata.get("heading_chars", 0),
+            previous_end=metadata.get("previous_end"),
+        )
+        groups.setdefault((passage.filename, passage.page), []).append(passage)
+
+    merged: List[_Passage] = []
+    for passages in groups.values():
+        positioned = sorted((p for p in passages if p.start is not None), key=lambda p: p.start)
+        merged.extend(p for p in passages if p.start is None)
+        current = None
+        for passage in positioned:
+            body = passage.text[passage.heading_chars:]
+            if current is not None and passage.start <= current.end:
+                current.text += body[current.end - passage.start:]
+            elif current is not None and passage.previous_end == current.end:
+                current.text += "\n" + body
+            else:
+                if current is not None:
+                    merged.append(current)
+                current = passage
+                continue
+            current.end = max(current.end, passage.end)
+            current.rank = min(current.rank, passage.rank)
+            current.ids.extend(passage.ids)
+        if current is not None:
+            merged.append(current)
+
+    return sorted(merged, key=lambda p: p.rank)
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens: int
+    chunk_ids: List[str]
+    filenames: List[str]
+
+
+def assemble_context(matches: List[Dict[str, Any]], query_vector: Optional[Sequence[float]] = None,
+                     model_name: str = "gpt-4", token_budget: int = CONTEXT_TOKEN_BUDGET) -> AssembledContext:
+    """
+    Build document context from retrieved matches within `token_budget` tokens
+    (exact with tiktoken, estimated from length without it)
+
+    Args:
+        matches: Hydrated match dicts; `values` enables MMR re-ranking
+        query_vector: The query embedding, if one was computed
+        model_name: Model whose tokenizer counts the budget
+        token_budget: Maximum tokens of document context
+
+    Returns:
+        AssembledContext with the joined text and what went into it
+    """
+    passages = _merge_adjacent(mmr_order(query_vector, matches))
+    separator_tokens = count_tokens(CHUNK_SEPARATOR, model_name)
+
+    parts, chunk_ids, filenames = [], [], []
+    used = 0
+    for passage in passages:
+        cost = count_tokens(passage.text, model_name) + (separator_tokens if parts else 0)
+        remaining = token_budget - used
+        if cost > remaining:
+            # Fill the rest of the budget with a truncated passage, then stop
+            room = remaining - (separator_tokens if parts else 0)
+            if room > 32:
+                text = truncate_to_tokens(passage.text, room, model_name)
+                parts.append(text)
+                used += count_tokens(text, model_name) + (separator_tokens if len(parts) > 1 else 0)
+                chunk_ids.extend(passage.ids)
+                filenames.append(passage.filename)
+            break
+        parts.append(passage.text)
+        used += cost
+        chunk_ids.extend(passage.ids)
+        filenames.append(passage.filename)
+
+    return AssembledContext(
+        text=CHUNK_SEPARATOR.join(parts),
+        tokens=used,
+        chunk_ids=chunk_ids,
+        filenames=list(dict.fromkeys(filenames)),
+    )
@@ -0,0 +1,231 @@
+"""
+Persistent Embedding Cache
+
+A disk-backed cache of embedding vectors keyed by (model, dimensions, text
+hash), stored as compact float32 blobs in SQLite with size-based LRU
+eviction. `CachedEmbeddings` wraps any LangChain embeddings object so it
+can be used anywhere the code embeds text.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from modules.embedding_profile import AGENT_REGISTRY_PATH, NATIVE_DIMENSIONS, get_embedding_profile
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+
+def _cache_key(model: str, dimensions: Optional[int], text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{dimensions or 0}:{digest}"
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with LRU eviction by total blob size"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def get_many(self, model: str, dimensions: Optional[int], texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts; missing entries are returned as None"""
+        keys = [_cache_key(model, dimensions, text) for text in texts]
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    self.bytes_saved += len(blob)
+                    results.append(np.frombuffer(blob, dtype=np.float32).tolist())
+            return results
+
+    def put_many(self, model: str, dimensions: Optional[int], texts: List[str], vectors: List[List[float]]):
+        """Store embeddings for texts, evicting least recently used entries if over budget"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((_cache_key(model, dimensions, text), blob, len(blob), now))
+        with self._lock:
+            for key, _, nbytes, _ in rows:
+                existing = self._conn.execute("SELECT nbytes FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if existing:
+                    self._total_bytes -= existing[0]
+                self._total_bytes += nbytes
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its budget"""
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, nbytes FROM embeddings ORDER BY last_used ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            removed = []
+            for key, nbytes in rows:
+                removed.append((key,))
+                self._total_bytes -= nbytes
+                if self._total_bytes <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+            self.evictions += len(removed)
+        self._conn.commit()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Hit rate and size counters for monitoring"""
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "entries": entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that consults the persistent cache first"""
+
+    def __init__(self, embeddings: Embeddings, model: str, dimensions: Optional[int] = None,
+                 cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.dimensions = dimensions
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results = self.cache.get_many(self.model, self.dimensions, texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            # Embed each distinct missing text once
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = self.embeddings.embed_documents(missing_texts)
+            self.cache.put_many(self.model, self.dimensions, missing_texts, vectors)
+            by_text = dict(zip(missing_texts, vectors))
+            for i in missing:
+                results[i] = by_text[texts[i]]
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many(self.model, self.dimensions, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model, self.dimensions, [text], [vector])
+        return vector
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache instance"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+
+@lru_cache(maxsize=1)
+def configured_embedding_model() -> str:
+    """The registry's `settings.embedding_model`, the single source of truth for embeddings"""
+    from modules.central_orchestrator.agent_loader import AgentLoader
+
+    return AgentLoader(AGENT_REGISTRY_PATH).get_embedding_model()
+
+
+_models: Dict[Tuple[str, Optional[int]], CachedEmbeddings] = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(model: Optional[str] = None, dimensions: Optional[int] = None) -> CachedEmbeddings:
+    """
+    OpenAI embeddings for `model` (default: the registry setting), served
+    through the persistent cache. `dimensions` defaults to the active
+    embedding profile's shortened size; asking for the model's native size
+    is the same as not shortening at all. One client is kept per (model,
+    dimensions), so its HTTP connections are reused across requests.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    model = model or configured_embedding_model()
+    if dimensions is None:
+        dimensions = get_embedding_profile().request_dimensions(model)
+    elif dimensions >= NATIVE_DIMENSIONS.get(model, dimensions + 1):
+        dimensions = None
+    with _models_lock:
+        embeddings = _models.get((model, dimensions))
+        if embeddings is None:
+            if dimensions:
+                base = OpenAIEmbeddings(model=model, dimensions=dimensions)
+            else:
+                base = OpenAIEmbeddings(model=model)
+            embeddings = _models[(model, dimensions)] = CachedEmbeddings(base, model, dimensions)
+        return embeddings
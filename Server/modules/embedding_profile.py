@@ -0,0 +1,69 @@
+"""
+Embedding Profiles
+
+An embedding profile fixes how many dimensions are requested from the
+text-embedding-3 models and how vectors are encoded in local indexes. The
+active profile is selected by the registry's `settings.embedding_profile`;
+`utils/evaluate_embedding_profiles.py` reports the recall vs memory and
+latency trade-off of each profile on our own corpus.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Dict
+
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+
+@dataclass(frozen=True)
+class EmbeddingProfile:
+    name: str
+    dimensions: Optional[int] = None  # None keeps the model's native size
+    quantization: str = "float32"  # float32 | int8 | binary, for local indexes
+    keep_full_precision: bool = False  # also store float32 vectors to rescore quantized hits
+
+    def supports_dimensions(self, model: str) -> bool:
+        """Only the text-embedding-3 family accepts a `dimensions` parameter"""
+        return model.startswith("text-embedding-3")
+
+    def request_dimensions(self, model: str) -> Optional[int]:
+        """The `dimensions` to request from the API for `model`, if any"""
+        if self.dimensions and self.supports_dimensions(model) and self.dimensions < NATIVE_DIMENSIONS.get(model, 0):
+            return self.dimensions
+        return None
+
+    def vector_dimension(self, model: str) -> int:
+        """Length of the vectors this profile produces for `model`"""
+        return self.request_dimensions(model) or NATIVE_DIMENSIONS.get(model, 3072)
+
+
+PROFILES: Dict[str, EmbeddingProfile] = {
+    profile.name: profile for profile in [
+        EmbeddingProfile("full"),
+        EmbeddingProfile("d1536", dimensions=1536),
+        EmbeddingProfile("d1024-int8", dimensions=1024, quantization="int8"),
+        EmbeddingProfile("d1024-int8-rescore", dimensions=1024, quantization="int8", keep_full_precision=True),
+        EmbeddingProfile("d512-int8", dimensions=512, quantization="int8"),
+        EmbeddingProfile("d3072-binary-rescore", quantization="binary", keep_full_precision=True),
+        EmbeddingProfile("d1024-binary-rescore", dimensions=1024, quantization="binary", keep_full_precision=True),
+        EmbeddingProfile("d256-int8", dimensions=256, quantization="int8"),
+    ]
+}
+
+AGENT_REGISTRY_PATH = "config/agent_registry.json"
+
+
+@lru_cache(maxsize=1)
+def get_embedding_profile() -> EmbeddingProfile:
+    """The profile named by the registry's `settings.embedding_profile` (default: full)"""
+    from modules.central_orchestrator.agent_loader import AgentLoader
+
+    name = AgentLoader(AGENT_REGISTRY_PATH).config.get("settings", {}).get("embedding_profile", "full")
+    if name not in PROFILES:
+        print(f"⚠️  Unknown embedding profile '{name}', using 'full'")
+        name = "full"
+    return PROFILES[name]
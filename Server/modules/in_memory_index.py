@@ -0,0 +1,118 @@
+"""
+In-Memory Index
+
+A minimal in-process stand-in for a Pinecone `Index`, implementing the
+subset of its API used by the vector store and the namespace migration
+(upsert, query, fetch, delete, list_paginated, describe_index_stats).
+Useful for exercising those code paths without a Pinecone account.
+"""
+
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+def _matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    if not filter:
+        return True
+    for key, expected in filter.items():
+        if isinstance(expected, dict):
+            if "$eq" in expected and metadata.get(key) != expected["$eq"]:
+                return False
+            if "$in" in expected:
+                # Like Pinecone, a list field matches when any of its values is listed
+                value = metadata.get(key)
+                values = value if isinstance(value, list) else [value]
+                if not any(item in expected["$in"] for item in values):
+                    return False
+        elif metadata.get(key) != expected:
+            return False
+    return True
+
+
+class InMemoryIndex:
+    """Dict-of-namespaces vector index with exact cosine search"""
+
+    def __init__(self):
+        self.namespaces: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def upsert(self, vectors, namespace: str = ""):
+        records = self.namespaces.setdefault(namespace, {})
+        for vector in vectors:
+            if isinstance(vector, dict):
+                vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata", {})
+            else:
+                vector_id, values, metadata = (list(vector) + [{}])[:3]
+            records[vector_id] = {"id": vector_id, "values": list(values), "metadata": dict(metadata or {})}
+        return {"upserted_count": len(vectors)}
+
+    def query(self, vector, top_k: int = 10, namespace: str = "", filter=None,
+              include_metadata: bool = False, include_values: bool = False):
+        records = [
+            record for record in self.namespaces.get(namespace, {}).values()
+            if _matches_filter(record["metadata"], filter)
+        ]
+        if not records:
+            return {"matches": [], "namespace": namespace}
+        query = np.asarray(vector, dtype=np.float32)
+        matrix = np.asarray([record["values"] for record in records], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        norms[norms == 0] = 1.0
+        scores = matrix @ query / norms
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for row in order:
+            record = records[row]
+            match = {"id": record["id"], "score": float(scores[row])}
+            if include_metadata:
+                match["metadata"] = record["metadata"]
+            if include_values:
+                match["values"] = record["values"]
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace}
+
+    def fetch(self, ids: List[str], namespace: str = ""):
+        records = self.namespaces.get(namespace, {})
+        vectors = {
+            vector_id: SimpleNamespace(id=vector_id, values=records[vector_id]["values"],
+                                       metadata=records[vector_id]["metadata"])
+            for vector_id in ids if vector_id in records
+        }
+        return SimpleNamespace(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: bool = False,
+               namespace: str = "", filter=None):
+        if delete_all:
+            if namespace not in self.namespaces:
+                raise KeyError(f"Namespace not found: {namespace}")
+            del self.namespaces[namespace]
+            return {}
+        records = self.namespaces.get(namespace, {})
+        if ids is not None:
+            for vector_id in ids:
+                records.pop(vector_id, None)
+        elif filter:
+            for vector_id in [vid for vid, rec in records.items() if _matches_filter(rec["metadata"], filter)]:
+                del records[vector_id]
+        return {}
+
+    def list_paginated(self, namespace: str = "", limit: int = 100, pagination_token: Optional[str] = None,
+                       prefix: Optional[str] = None):
+        # Cursor-style token (the last ID returned), so deletes between pages are safe
+        ids = sorted(vid for vid in self.namespaces.get(namespace, {}) if not prefix or vid.startswith(prefix))
+        if pagination_token:
+            ids = [vector_id for vector_id in ids if vector_id > pagination_token]
+        page = ids[:limit]
+        next_token = page[-1] if len(ids) > limit else None
+        return SimpleNamespace(
+            vectors=[SimpleNamespace(id=vector_id) for vector_id in page],
+            pagination=SimpleNamespace(next=next_token) if next_token else None,
+            namespace=namespace
+        )
+
+    def describe_index_stats(self):
+        return {
+            "namespaces": {name: {"vector_count": len(records)} for name, records in self.namespaces.items()},
+            "total_vector_count": sum(len(records) for records in self.namespaces.values()),
+        }
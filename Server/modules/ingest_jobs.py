@@ -0,0 +1,342 @@
+"""
+Background Ingestion Jobs
+
+Uploads are accepted as soon as their files are on disk and ingested by a
+background job. Jobs live in a SQLite queue, so queued and interrupted jobs
+resume after a restart. A bounded pool of INGEST_WORKERS workers takes jobs
+in arrival order but runs at most one job per user at a time. This keeps a
+user's manifest consistent and stops one user's backlog from starving
+everyone else. Per-file stage and chunk progress is persisted as it happens
+and served by /upload_jobs/{id}. Once a job has published the new document
+set, the specialty digests it touched are rebuilt before the job completes.
+
+The queue is shared by every server process using the same database. A job
+is claimed by a single conditional UPDATE, so two processes never run the
+same job, and a user with a running job anywhere gets no second one. Running
+jobs carry a heartbeat; jobs whose process stopped beating are requeued by
+any live process. All SQLite writes run off the event loop. The files a job
+writes (manifest, staged IDs, lexical index, local vectors) are reloaded by
+the other processes when they change and are written under an fcntl lock;
+where fcntl is unavailable (Windows), run a single server process.
+"""
+
+import os
+import copy
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+from modules.pdf_handlers import SavedUpload
+from modules.load_vectorstore import load_vectorstore, IngestProgress
+from modules.specialty_digest import refresh_digests
+
+INGEST_JOB_DB_PATH = os.getenv("INGEST_JOB_DB_PATH", "./cache/ingest_jobs.sqlite3")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_JOB_RETENTION_DAYS = int(os.getenv("INGEST_JOB_RETENTION_DAYS", "7"))
+PROGRESS_FLUSH_SECONDS = 0.5
+# Running jobs are re-stamped this often; a job not stamped for JOB_STALE_SECONDS is requeued
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "90"))
+
+JOB_FIELDS = ("id", "user_id", "status", "clear_existing", "uploads", "files", "stats", "error",
+              "created_at", "started_at", "finished_at")
+_JSON_FIELDS = ("uploads", "files", "stats")
+
+
+class JobStore:
+    """Durable job queue and status table"""
+
+    def __init__(self, path: str = INGEST_JOB_DB_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                clear_existing INTEGER NOT NULL,
+                uploads TEXT NOT NULL,
+                files TEXT NOT NULL,
+                stats TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT,
+                heartbeat_at REAL
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "heartbeat_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(JOB_FIELDS, row))
+        for field in _JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        job["clear_existing"] = bool(job["clear_existing"])
+        return job
+
+    def create(self, user_id: str, uploads: List[SavedUpload], clear_existing: bool) -> Dict[str, Any]:
+        files = {
+            upload.sha256: {"filename": upload.filename, "stage": "queued", "chunks_total": None,
+                            "chunks_done": 0, "errors": []}
+            for upload in uploads
+        }
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, user_id, status, clear_existing, uploads, files, created_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, user_id, int(clear_existing), json.dumps([asdict(u) for u in uploads]),
+                 json.dumps(files), datetime.now().isoformat())
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Mark the oldest queued job whose user has no running job as running
+        and return it. One statement, so concurrent processes cannot claim
+        the same job or two jobs of one user.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"""UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?
+                WHERE status = 'queued' AND id = (
+                    SELECT id FROM jobs WHERE status = 'queued'
+                    AND user_id NOT IN (SELECT user_id FROM jobs WHERE status = 'running')
+                    ORDER BY created_at LIMIT 1
+                )
+                RETURNING {', '.join(JOB_FIELDS)}""",
+                (datetime.now().isoformat(), time.time())
+            ).fetchone()
+            self._conn.commit()
+        return self._row_to_job(row) if row else None
+
+    def heartbeat(self, job_ids: List[str]):
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+            self._conn.commit()
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = [json.dumps(v) if name in _JSON_FIELDS else v for name, v in fields.items()]
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+            self._conn.commit()
+
+    def recover(self):
+        """Requeue running jobs whose process stopped heartbeating and drop old finished jobs"""
+        cutoff = (datetime.now() - timedelta(days=INGEST_JOB_RETENTION_DAYS)).isoformat()
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL "
+                "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (time.time() - JOB_STALE_SECONDS,)
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (cutoff,)
+            )
+            self._conn.commit()
+        return requeued
+
+
+class JobProgress(IngestProgress):
+    """
+    Records per-file progress on the job row, flushing at most every
+    PROGRESS_FLUSH_SECONDS. Callbacks run on the event loop; one writer task
+    saves the latest snapshot in a thread, so the loop never waits on SQLite.
+    """
+
+    def __init__(self, store: JobStore, job: Dict[str, Any]):
+        self.store = store
+        self.job_id = job["id"]
+        self.files = job["files"]
+        self._last_flush = 0.0
+        self._pending = False
+        self._writer: Optional[asyncio.Task] = None
+
+    def flush(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._last_flush >= PROGRESS_FLUSH_SECONDS:
+            self._last_flush = now
+            self._pending = True
+            if self._writer is None or self._writer.done():
+                self._writer = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self):
+        while self._pending:
+            self._pending = False
+            # Snapshot on the loop; the callbacks keep mutating self.files
+            await asyncio.to_thread(self.store.update, self.job_id, files=copy.deepcopy(self.files))
+
+    async def drain(self):
+        """Write any progress not yet saved and wait for it"""
+        self.flush(force=True)
+        if self._writer is not None:
+            await self._writer
+
+    def stage(self, file_hash: str, stage: str, **fields):
+        entry = self.files.setdefault(file_hash, {"filename": None, "chunks_done": 0, "errors": []})
+        entry["stage"] = stage
+        entry.update(fields)
+        self.flush(force=True)
+
+    def advance(self, file_hash: str, chunks: int):
+        self.files[file_hash]["chunks_done"] = self.files[file_hash].get("chunks_done", 0) + chunks
+        self.flush()
+
+    def error(self, file_hash: str, message: str):
+        self.files[file_hash].setdefault("errors", []).append(message)
+        self.flush(force=True)
+
+
+class JobManager:
+    """Bounded worker pool draining the job queue fairly across users"""
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = INGEST_WORKERS):
+        self.store = store or JobStore()
+        self.workers = workers
+        self._running = set()
+        self._tasks: List[asyncio.Task] = []
+        self._condition: Optional[asyncio.Condition] = None
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._condition = asyncio.Condition()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        # Running jobs stay 'running' in the store and are requeued once their heartbeat goes stale
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: str, uploads: List[SavedUpload], clear_existing: bool = False) -> Dict[str, Any]:
+        job = await asyncio.to_thread(self.store.create, user_id, uploads, clear_existing)
+        await self._notify()
+        return job
+
+    async def _notify(self):
+        if self._condition is not None:
+            async with self._condition:
+                self._condition.notify_all()
+
+    async def _recover(self):
+        requeued = await asyncio.to_thread(self.store.recover)
+        if requeued:
+            print(f"🔁 Requeued {requeued} ingestion job(s) whose worker stopped")
+            await self._notify()
+
+    async def _heartbeat(self):
+        """Stamp this process's running jobs and requeue those of processes that died"""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, list(self._running))
+                await self._recover()
+            except sqlite3.Error as e:
+                print(f"⚠️  Ingestion job heartbeat failed: {e}")
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                job = await asyncio.to_thread(self.store.claim)
+                while job is None:
+                    # Other processes submit to the same queue without notifying this one
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), JOB_HEARTBEAT_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    job = await asyncio.to_thread(self.store.claim)
+            self._running.add(job["id"])
+            try:
+                await self._run(job)
+            finally:
+                self._running.discard(job["id"])
+                await self._notify()
+
+    async def _run(self, job: Dict[str, Any]):
+        user_id = job["user_id"]
+        progress = JobProgress(self.store, job)
+        uploads = [SavedUpload(**upload) for upload in job["uploads"]]
+        print(f"🚚 Running ingestion job {job['id']} for user {user_id} ({len(uploads)} files)")
+        try:
+            # The previous document set keeps serving until the new one is published
+            stats = await load_vectorstore(uploads, user_id, progress, rebuild=job["clear_existing"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ingestion job {job['id']} failed for user {user_id}: {e}")
+            await progress.drain()
+            await asyncio.to_thread(self.store.update, job["id"], status="failed", error=str(e),
+                                    finished_at=datetime.now().isoformat())
+            return
+        # Digests follow the published set; a failure here leaves the previous digests in use
+        try:
+            stats["digests"] = await asyncio.to_thread(refresh_digests, user_id)
+        except Exception as e:
+            print(f"⚠️  Could not refresh specialty digests for user {user_id}: {e}")
+            stats["digests"] = {"error": str(e)}
+        await progress.drain()
+        await asyncio.to_thread(self.store.update, job["id"], status="succeeded", stats=stats,
+                                finished_at=datetime.now().isoformat())
+
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job: overall status, per-file stages and chunk totals"""
+    files = [{"file_hash": file_hash, **entry} for file_hash, entry in (job["files"] or {}).items()]
+    chunks_total = sum(entry.get("chunks_total") or 0 for entry in files)
+    chunks_done = sum(entry.get("chunks_done") or 0 for entry in files)
+    return {
+        "job_id": job["id"],
+        "user_id": job["user_id"],
+        "status": job["status"],
+        "files": files,
+        "chunks_done": chunks_done,
+        "chunks_total": chunks_total,
+        "stats": job["stats"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide ingestion job manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
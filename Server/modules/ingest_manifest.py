@@ -0,0 +1,284 @@
+"""
+Ingestion Manifest
+
+Tracks, per user, which uploaded files (by content hash) and which chunks
+(by stable content-derived vector ID) are currently in the vector store so
+that re-uploads only embed what actually changed.
+
+The manifest is also the pointer to the user's published document set.
+A new version is staged alongside the current one and published by
+atomically replacing the manifest file. Readers only ever see chunks of
+the published version. Users whose vectors predate manifests have no
+published chunk list; their stored vectors are served as they are, minus
+any chunks staged or abandoned by an ingest, until their first upload
+publishes a set.
+
+Server processes sharing these directories see each other's changes: the
+published manifest and the set being staged are files, and in-memory
+copies are reloaded when the file changes on disk.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterable, Set, Optional, Tuple, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single server process
+    fcntl = None
+
+MANIFEST_DIR = os.getenv("MANIFEST_DIR", "./manifests")
+os.makedirs(MANIFEST_DIR, exist_ok=True)
+
+
+def sha256_bytes(data: bytes) -> str:
+    """Hex SHA-256 of raw bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_text(text: str) -> str:
+    """Hex SHA-256 of a UTF-8 string"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def user_storage_key(user_id: str) -> str:
+    """Filesystem-safe, collision-free key for a user's local files"""
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", user_id)[:48]
+    return f"{safe}_{sha256_text(user_id)[:8]}"
+
+
+def file_version(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Identity of a file's current contents for cache invalidation, or None
+    if it does not exist. Atomic replacement changes the inode.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock, across server processes, for a read-modify-write of `path`"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def chunk_vector_id(user_id: str, text: str) -> str:
+    """
+    Stable vector ID for a chunk: the same text uploaded again by the same
+    user always maps to the same ID, so it never needs re-embedding.
+    """
+    return f"{user_id}_{sha256_text(text)[:32]}"
+
+
+def _manifest_path(user_id: str) -> str:
+    return os.path.join(MANIFEST_DIR, f"{user_storage_key(user_id)}.json")
+
+
+def empty_manifest(user_id: str) -> Dict[str, Any]:
+    return {"user_id": user_id, "version": None, "updated_at": None, "files": {}, "garbage": []}
+
+
+def load_manifest(user_id: str) -> Dict[str, Any]:
+    """Load a user's manifest, returning an empty one if none exists"""
+    path = _manifest_path(user_id)
+    if not os.path.exists(path):
+        return empty_manifest(user_id)
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        manifest.setdefault("files", {})
+        manifest.setdefault("version", None)
+        manifest.setdefault("garbage", [])
+        return manifest
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"⚠️  Could not read manifest for user {user_id}, starting fresh: {e}")
+        return empty_manifest(user_id)
+
+
+def save_manifest(user_id: str, manifest: Dict[str, Any]):
+    """Atomically write a user's manifest, publishing its document set to readers"""
+    manifest["updated_at"] = datetime.now().isoformat()
+    path = _manifest_path(user_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def delete_manifest(user_id: str):
+    """Forget everything recorded for a user"""
+    path = _manifest_path(user_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def manifest_chunk_ids(manifest: Dict[str, Any]) -> Set[str]:
+    """All chunk IDs currently recorded in a manifest"""
+    ids: Set[str] = set()
+    for entry in manifest.get("files", {}).values():
+        ids.update(entry.get("chunk_ids", []))
+    return ids
+
+
+def record_file(manifest: Dict[str, Any], file_hash: str, filename: str, chunk_ids: Iterable[str]):
+    """Record (or replace) the chunks belonging to a file"""
+    manifest.setdefault("files", {})[file_hash] = {
+        "filename": filename,
+        "chunk_ids": list(chunk_ids),
+    }
+
+
+_published: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+_published_lock = threading.Lock()
+
+
+def _published_entry(user_id: str) -> Dict[str, Any]:
+    """The published manifest and its chunk ID set, reloaded only when the file changes"""
+    key = file_version(_manifest_path(user_id))
+    with _published_lock:
+        cached = _published.get(user_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    manifest = load_manifest(user_id) if key is not None else empty_manifest(user_id)
+    entry = {"manifest": manifest, "chunk_ids": frozenset(manifest_chunk_ids(manifest))}
+    with _published_lock:
+        _published[user_id] = (key, entry)
+    return entry
+
+
+def published_chunk_ids(user_id: str) -> frozenset:
+    """Chunk IDs of the user's published document set"""
+    return _published_entry(user_id)["chunk_ids"]
+
+
+def published_set(user_id: str) -> Tuple[Optional[str], Optional[frozenset]]:
+    """
+    Version and chunk IDs of the user's published document set, read
+    together. The IDs are None when no set has been published: the user's
+    vectors were stored before manifests existed, are reached through the
+    legacy namespace fallback or were moved by utils/migrate_namespaces.py,
+    and everything stored is served except unpublished_chunk_ids().
+    """
+    entry = _published_entry(user_id)
+    if not entry["manifest"]["files"]:
+        return entry["manifest"].get("version"), None
+    return entry["manifest"].get("version"), entry["chunk_ids"]
+
+
+def unpublished_chunk_ids(user_id: str) -> frozenset:
+    """Chunks stored for the user but not to be served: being staged, or abandoned and awaiting collection"""
+    with _staging_lock:
+        staged = frozenset().union(*_staging.get(user_id, ()))
+    return staged | _staged_on_disk(user_id) | frozenset(_published_entry(user_id)["manifest"]["garbage"])
+
+
+def published_file_hashes(user_id: str) -> Set[str]:
+    """File hashes of the user's published document set"""
+    return set(_published_entry(user_id)["manifest"]["files"])
+
+
+def published_version(user_id: str) -> Optional[str]:
+    """Version of the user's published document set, or None before the first upload"""
+    return _published_entry(user_id)["manifest"].get("version")
+
+
+_staging: Dict[str, List[Set[str]]] = {}
+_staging_lock = threading.Lock()
+_staged_files: Dict[str, Tuple[Tuple[int, int, int], frozenset]] = {}
+
+
+def _staging_path(user_id: str) -> str:
+    return os.path.join(MANIFEST_DIR, f"{user_storage_key(user_id)}.staging.json")
+
+
+def _write_staging(user_id: str, ids: List[str]):
+    path = _staging_path(user_id)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(ids, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _staged_on_disk(user_id: str) -> frozenset:
+    """Chunk IDs staged by any server process, reloaded only when the file changes"""
+    path = _staging_path(user_id)
+    key = file_version(path)
+    if key is None:
+        return frozenset()
+    with _staging_lock:
+        cached = _staged_files.get(user_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    try:
+        with open(path, "r") as f:
+            ids = frozenset(json.load(f))
+    except (json.JSONDecodeError, IOError):
+        # Mid-replace on platforms without atomic rename; the next read retries
+        return frozenset()
+    with _staging_lock:
+        _staged_files[user_id] = (key, ids)
+    return ids
+
+
+@contextmanager
+def staging(user_id: str, staged_ids: Optional[Set[str]] = None):
+    """
+    Mark a new version of the user's document set as being built. The
+    builder adds the chunk IDs it writes to `staged_ids` as it goes and
+    calls record_staged() before writing them, so other processes hide
+    them too.
+    """
+    staged_ids = staged_ids if staged_ids is not None else set()
+    with _staging_lock:
+        _staging.setdefault(user_id, []).append(staged_ids)
+    _write_staging(user_id, [])
+    try:
+        yield staged_ids
+    finally:
+        with _staging_lock:
+            _staging[user_id] = [ids for ids in _staging[user_id] if ids is not staged_ids]
+            if not _staging[user_id]:
+                del _staging[user_id]
+        try:
+            os.remove(_staging_path(user_id))
+        except FileNotFoundError:
+            pass
+
+
+def record_staged(user_id: str, staged_ids: Iterable[str]):
+    """Publish the IDs being staged to the other server processes"""
+    _write_staging(user_id, sorted(staged_ids))
+
+
+def abandoned_staged_ids(user_id: str) -> Set[str]:
+    """
+    IDs left staged by an ingest that stopped without cleaning up (its
+    process died). Only meaningful when no ingest for the user is running.
+    """
+    with _staging_lock:
+        if user_id in _staging:
+            return set()
+    return set(_staged_on_disk(user_id))
+
+
+def is_staging(user_id: str) -> bool:
+    """True while unpublished chunks for the user may be in the stores"""
+    with _staging_lock:
+        if user_id in _staging:
+            return True
+    return os.path.exists(_staging_path(user_id))
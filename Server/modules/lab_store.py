@@ -0,0 +1,471 @@
+"""
+Structured Lab Results
+
+Ingestion extracts lab analytes, values, units, reference ranges and
+collection dates from each page of a report. Values are converted to one
+canonical unit per analyte and stored per user in SQLite, one row per
+result. Trends are computed locally with NumPy: the latest value, the
+change since the previous result, the slope per year and out-of-range
+flags. Agents then get a compact, precomputed lab table instead of
+inferring trends from raw text chunks.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+from modules.ingest_manifest import published_file_hashes
+
+LAB_STORE_PATH = os.getenv("LAB_STORE_PATH", "./cache/labs.sqlite3")
+LAB_TABLE_MAX_ROWS = int(os.getenv("LAB_TABLE_MAX_ROWS", "40"))
+
+
+@dataclass(frozen=True)
+class Analyte:
+    name: str
+    aliases: Tuple[str, ...]
+    unit: str  # canonical unit
+    conversions: Dict[str, Tuple[float, float]]  # normalized unit -> (scale, offset) into the canonical unit
+    reference: Tuple[Optional[float], Optional[float]]  # default range in the canonical unit
+    plausible: Tuple[float, float]  # canonical values outside this are extraction errors
+
+
+def _analytes() -> List[Analyte]:
+    mg_dl_glucose = {"mg/dl": (1.0, 0.0), "mmol/l": (18.016, 0.0)}
+    mg_dl_lipid = {"mg/dl": (1.0, 0.0), "mmol/l": (38.67, 0.0)}
+    return [
+        Analyte("Glucose", ("fasting glucose", "glucose, fasting", "glucose", "fasting plasma glucose", "fpg"),
+                "mg/dL", mg_dl_glucose, (70, 99), (10, 1500)),
+        Analyte("HbA1c", ("hemoglobin a1c", "haemoglobin a1c", "hba1c", "a1c", "glycated hemoglobin", "glycosylated hemoglobin"),
+                "%", {"%": (1.0, 0.0), "mmol/mol": (0.09148, 2.152)}, (4.0, 5.6), (3, 20)),
+        Analyte("Total cholesterol", ("total cholesterol", "cholesterol, total", "cholesterol total", "cholesterol"),
+                "mg/dL", mg_dl_lipid, (None, 200), (50, 1000)),
+        Analyte("LDL cholesterol", ("ldl cholesterol", "ldl-c", "ldl chol", "ldl", "cholesterol, ldl", "ldl calculated"),
+                "mg/dL", mg_dl_lipid, (None, 100), (5, 600)),
+        Analyte("HDL cholesterol", ("hdl cholesterol", "hdl-c", "hdl chol", "hdl", "cholesterol, hdl"),
+                "mg/dL", mg_dl_lipid, (40, None), (5, 200)),
+        Analyte("Non-HDL cholesterol", ("non-hdl cholesterol", "non-hdl-c", "non hdl cholesterol", "non-hdl"),
+                "mg/dL", mg_dl_lipid, (None, 130), (10, 800)),
+        Analyte("Triglycerides", ("triglycerides", "triglyceride", "trig"),
+                "mg/dL", {"mg/dl": (1.0, 0.0), "mmol/l": (88.57, 0.0)}, (None, 150), (10, 10000)),
+        Analyte("Creatinine", ("creatinine, serum", "serum creatinine", "creatinine"),
+                "mg/dL", {"mg/dl": (1.0, 0.0), "umol/l": (1 / 88.4, 0.0)}, (0.6, 1.3), (0.1, 25)),
+        Analyte("eGFR", ("egfr", "estimated gfr", "gfr, estimated"),
+                "mL/min/1.73m2", {"ml/min/1.73m2": (1.0, 0.0), "ml/min/1.73m^2": (1.0, 0.0), "ml/min": (1.0, 0.0)},
+                (60, None), (1, 200)),
+        Analyte("BUN", ("blood urea nitrogen", "urea nitrogen", "bun"),
+                "mg/dL", {"mg/dl": (1.0, 0.0), "mmol/l": (2.801, 0.0)}, (7, 20), (1, 300)),
+        Analyte("Urine albumin/creatinine ratio", ("albumin/creatinine ratio", "albumin creatinine ratio", "uacr", "acr"),
+                "mg/g", {"mg/g": (1.0, 0.0), "mg/mmol": (8.84, 0.0)}, (None, 30), (0, 10000)),
+        Analyte("Potassium", ("potassium", "k+"),
+                "mmol/L", {"mmol/l": (1.0, 0.0), "meq/l": (1.0, 0.0)}, (3.5, 5.1), (1, 10)),
+        Analyte("Sodium", ("sodium", "na+"),
+                "mmol/L", {"mmol/l": (1.0, 0.0), "meq/l": (1.0, 0.0)}, (135, 145), (100, 180)),
+        Analyte("TSH", ("thyroid stimulating hormone", "tsh"),
+                "mIU/L", {"miu/l": (1.0, 0.0), "uiu/ml": (1.0, 0.0), "mu/l": (1.0, 0.0)}, (0.4, 4.0), (0.001, 200)),
+        Analyte("Free T4", ("free t4", "ft4", "free thyroxine", "t4, free"),
+                "ng/dL", {"ng/dl": (1.0, 0.0), "pmol/l": (1 / 12.87, 0.0)}, (0.8, 1.8), (0.05, 10)),
+        Analyte("ALT", ("alanine aminotransferase", "alt", "sgpt"),
+                "U/L", {"u/l": (1.0, 0.0), "iu/l": (1.0, 0.0)}, (None, 40), (1, 10000)),
+        Analyte("AST", ("aspartate aminotransferase", "ast", "sgot"),
+                "U/L", {"u/l": (1.0, 0.0), "iu/l": (1.0, 0.0)}, (None, 40), (1, 10000)),
+        Analyte("Hemoglobin", ("hemoglobin", "haemoglobin", "hgb", "hb"),
+                "g/dL", {"g/dl": (1.0, 0.0), "g/l": (0.1, 0.0), "mmol/l": (1.611, 0.0)}, (12.0, 17.5), (2, 25)),
+        Analyte("Platelets", ("platelet count", "platelets", "plt"),
+                "10^9/L", {"10^9/l": (1.0, 0.0), "x10^9/l": (1.0, 0.0), "k/ul": (1.0, 0.0), "x10^3/ul": (1.0, 0.0),
+                           "10^3/ul": (1.0, 0.0), "thou/ul": (1.0, 0.0)}, (150, 400), (1, 2000)),
+        Analyte("WBC", ("white blood cell count", "white blood cells", "wbc"),
+                "10^9/L", {"10^9/l": (1.0, 0.0), "x10^9/l": (1.0, 0.0), "k/ul": (1.0, 0.0), "x10^3/ul": (1.0, 0.0),
+                           "10^3/ul": (1.0, 0.0), "thou/ul": (1.0, 0.0)}, (4.0, 11.0), (0.1, 500)),
+        Analyte("Vitamin D", ("25-hydroxyvitamin d", "25-oh vitamin d", "vitamin d, 25-hydroxy", "vitamin d"),
+                "ng/mL", {"ng/ml": (1.0, 0.0), "nmol/l": (1 / 2.496, 0.0)}, (30, 100), (1, 300)),
+        Analyte("Vitamin B12", ("vitamin b12", "b12", "cobalamin"),
+                "pg/mL", {"pg/ml": (1.0, 0.0), "pmol/l": (1.355, 0.0)}, (200, 900), (10, 10000)),
+        Analyte("Ferritin", ("ferritin",),
+                "ng/mL", {"ng/ml": (1.0, 0.0), "ug/l": (1.0, 0.0)}, (30, 300), (1, 20000)),
+        Analyte("CRP", ("hs-crp", "high sensitivity crp", "c-reactive protein", "crp"),
+                "mg/L", {"mg/l": (1.0, 0.0), "mg/dl": (10.0, 0.0)}, (None, 3.0), (0, 500)),
+        Analyte("Uric acid", ("uric acid", "urate"),
+                "mg/dL", {"mg/dl": (1.0, 0.0), "umol/l": (1 / 59.48, 0.0)}, (3.5, 7.2), (0.5, 30)),
+        Analyte("Albumin", ("albumin, serum", "serum albumin", "albumin"),
+                "g/dL", {"g/dl": (1.0, 0.0), "g/l": (0.1, 0.0)}, (3.5, 5.0), (0.5, 10)),
+    ]
+
+
+ANALYTES = {analyte.name: analyte for analyte in _analytes()}
+
+# One alternation over every alias, longest first so "ldl cholesterol" wins over "cholesterol"
+_ALIASES = sorted(
+    ((alias, analyte.name) for analyte in ANALYTES.values() for alias in analyte.aliases),
+    key=lambda pair: -len(pair[0])
+)
+_ALIAS_TO_ANALYTE = {alias: name for alias, name in _ALIASES}
+_ALIAS_RE = re.compile(
+    r"(?<![A-Za-z0-9-])(" + "|".join(re.escape(alias) for alias, _ in _ALIASES) + r")(?![A-Za-z0-9])",
+    re.IGNORECASE
+)
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_VALUE_RE = re.compile(
+    rf"^[\s:=\-]*(?P<cmp>[<>]=?)?\s*(?P<value>{_NUMBER})\s*(?P<flag>\b(?:H|L|HIGH|LOW|A)\b|\*)?\s*"
+    r"(?P<unit>(?:x\s?)?10\^?\d+/[a-zµμ]+|[a-zµμ%][a-zµμ0-9/.^%]*)?",
+    re.IGNORECASE
+)
+_RANGE_RE = re.compile(rf"(?P<low>{_NUMBER})\s*(?:-|–|to)\s*(?P<high>{_NUMBER})|(?P<cmp>[<>]=?)\s*(?P<bound>{_NUMBER})")
+
+_MONTHS = "jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec"
+_DATE_RE = re.compile(
+    r"(?P<iso>\d{4}-\d{1,2}-\d{1,2})"
+    r"|(?P<us>\d{1,2}/\d{1,2}/\d{2,4})"
+    rf"|(?P<mdy>(?:{_MONTHS})[a-z]*\.?\s+\d{{1,2}},?\s+\d{{4}})"
+    rf"|(?P<dmy>\d{{1,2}}\s+(?:{_MONTHS})[a-z]*\.?\s+\d{{4}})",
+    re.IGNORECASE
+)
+_COLLECTION_HINT = re.compile(r"collect|drawn|specimen|sample|report|result|received|service|date", re.IGNORECASE)
+_BIRTH_HINT = re.compile(r"birth|dob|d\.o\.b", re.IGNORECASE)
+
+
+@dataclass
+class LabResult:
+    analyte: str
+    value: float  # in the analyte's canonical unit
+    unit: str
+    raw_value: str
+    raw_unit: str
+    ref_low: Optional[float]
+    ref_high: Optional[float]
+    observed_at: Optional[str]  # ISO date of collection, when the report states one
+    page: Optional[int]
+    source_text: str
+
+
+def _normalize_unit(unit: str) -> str:
+    return unit.lower().replace("µ", "u").replace("μ", "u").replace(" ", "").replace("×", "x").rstrip(".")
+
+
+def _to_float(number: str) -> float:
+    return float(number.replace(",", "."))
+
+
+def _parse_date(text: str) -> Optional[date]:
+    for fmt in ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%b %d %Y", "%B %d %Y", "%d %b %Y", "%d %B %Y"):
+        try:
+            return datetime.strptime(text.replace(",", "").replace(".", "").replace("Sept", "Sep"), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def find_report_date(text: str) -> Optional[str]:
+    """Collection/report date of a page: a date on a line that says so, else the first non-birth date"""
+    fallback = None
+    for line in text.splitlines():
+        if _BIRTH_HINT.search(line):
+            continue
+        for match in _DATE_RE.finditer(line):
+            parsed = _parse_date(match.group(0))
+            if parsed is None or parsed > date.today():
+                continue
+            if _COLLECTION_HINT.search(line):
+                return parsed.isoformat()
+            fallback = fallback or parsed.isoformat()
+    return fallback
+
+
+def _convert(analyte: Analyte, value: float, unit: str) -> Optional[float]:
+    scale, offset = analyte.conversions.get(unit, (None, None))
+    if scale is None:
+        return None
+    return value * scale + offset
+
+
+def parse_lab_line(line: str, observed_at: Optional[str] = None, page: Optional[int] = None) -> Optional[LabResult]:
+    """Parse one report line such as 'LDL Cholesterol  142 H mg/dL  0-99' into a LabResult"""
+    alias_match = _ALIAS_RE.search(line)
+    if alias_match is None or alias_match.start() > 40:
+        return None
+    analyte = ANALYTES[_ALIAS_TO_ANALYTE[alias_match.group(1).lower()]]
+    rest = line[alias_match.end():]
+    # Skip qualifiers between the name and the value, e.g. "(calc)" or ", serum"
+    rest = re.sub(r"^\s*(?:\([^)]*\)|,\s*[a-z]+)", "", rest, flags=re.IGNORECASE)
+    value_match = _VALUE_RE.match(rest)
+    if value_match is None:
+        return None
+
+    raw_value = value_match.group("value")
+    value = _to_float(raw_value)
+    raw_unit = value_match.group("unit") or ""
+    unit = _normalize_unit(raw_unit) if raw_unit else _normalize_unit(analyte.unit)
+    if unit not in analyte.conversions:
+        # Text after the value was not a unit (e.g. a range or a comment): assume the canonical unit
+        raw_unit, unit = "", _normalize_unit(analyte.unit)
+    canonical = _convert(analyte, value, unit)
+    if canonical is None or not analyte.plausible[0] <= canonical <= analyte.plausible[1]:
+        return None
+
+    ref_low, ref_high = None, None
+    range_match = _RANGE_RE.search(rest[value_match.end():])
+    if range_match:
+        if range_match.group("low"):
+            ref_low = _convert(analyte, _to_float(range_match.group("low")), unit)
+            ref_high = _convert(analyte, _to_float(range_match.group("high")), unit)
+        elif range_match.group("cmp").startswith("<"):
+            ref_high = _convert(analyte, _to_float(range_match.group("bound")), unit)
+        else:
+            ref_low = _convert(analyte, _to_float(range_match.group("bound")), unit)
+
+    return LabResult(
+        analyte=analyte.name,
+        value=round(canonical, 4),
+        unit=analyte.unit,
+        raw_value=(value_match.group("cmp") or "") + raw_value,
+        raw_unit=raw_unit,
+        ref_low=ref_low,
+        ref_high=ref_high,
+        observed_at=observed_at,
+        page=page,
+        source_text=line.strip()[:200],
+    )
+
+
+def extract_lab_results(documents) -> List[LabResult]:
+    """Lab results found in extracted page Documents, dated by each page's report date"""
+    results = []
+    for document in documents:
+        text = document.page_content
+        observed_at = find_report_date(text)
+        page = document.metadata.get("page")
+        seen = set()
+        for line in text.splitlines():
+            result = parse_lab_line(line, observed_at, page)
+            if result and (result.analyte, result.value) not in seen:
+                seen.add((result.analyte, result.value))
+                results.append(result)
+    return results
+
+
+class LabStore:
+    """Per-user lab results in SQLite, with the files they were extracted from"""
+
+    def __init__(self, path: str = LAB_STORE_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS lab_results (
+                user_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                analyte TEXT NOT NULL,
+                value REAL NOT NULL,
+                unit TEXT NOT NULL,
+                raw_value TEXT,
+                raw_unit TEXT,
+                ref_low REAL,
+                ref_high REAL,
+                observed_at TEXT,
+                page INTEGER,
+                source_text TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_lab_results_user ON lab_results(user_id, analyte);
+            CREATE TABLE IF NOT EXISTS lab_files (
+                user_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                filename TEXT,
+                extracted_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, file_hash)
+            );"""
+        )
+        self._conn.commit()
+
+    def has_file(self, user_id: str, file_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM lab_files WHERE user_id = ? AND file_hash = ?", (user_id, file_hash)
+            ).fetchone()
+        return row is not None
+
+    def replace_file(self, user_id: str, file_hash: str, filename: str, results: Iterable[LabResult]):
+        """Store the results extracted from one file, replacing any earlier extraction"""
+        rows = [
+            (user_id, file_hash, r.analyte, r.value, r.unit, r.raw_value, r.raw_unit,
+             r.ref_low, r.ref_high, r.observed_at, r.page, r.source_text)
+            for r in results
+        ]
+        with self._lock:
+            self._conn.execute("DELETE FROM lab_results WHERE user_id = ? AND file_hash = ?", (user_id, file_hash))
+            self._conn.executemany(
+                "INSERT INTO lab_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lab_files VALUES (?, ?, ?, ?)",
+                (user_id, file_hash, filename, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def retain_files(self, user_id: str, file_hashes: Iterable[str]):
+        """Drop results from files no longer in the user's document set"""
+        keep = set(file_hashes)
+        with self._lock:
+            stored = [row[0] for row in self._conn.execute(
+                "SELECT file_hash FROM lab_files WHERE user_id = ?", (user_id,)
+            )]
+            stale = [(user_id, file_hash) for file_hash in stored if file_hash not in keep]
+            self._conn.executemany("DELETE FROM lab_results WHERE user_id = ? AND file_hash = ?", stale)
+            self._conn.executemany("DELETE FROM lab_files WHERE user_id = ? AND file_hash = ?", stale)
+            self._conn.commit()
+
+    def delete_user(self, user_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM lab_results WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM lab_files WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def columns(self, user_id: str, file_hashes: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        A user's results as column arrays: analyte, value, ref_low, ref_high,
+        day (NaN when undated), optionally limited to the given files
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT analyte, value, ref_low, ref_high, observed_at, file_hash FROM lab_results WHERE user_id = ?",
+                (user_id,)
+            ).fetchall()
+        if file_hashes is not None:
+            keep = set(file_hashes)
+            rows = [row for row in rows if row[5] in keep]
+        days = [date.fromisoformat(row[4]).toordinal() if row[4] else np.nan for row in rows]
+        return {
+            "analyte": np.array([row[0] for row in rows], dtype=object),
+            "value": np.array([row[1] for row in rows], dtype=np.float64),
+            "ref_low": np.array([np.nan if row[2] is None else row[2] for row in rows], dtype=np.float64),
+            "ref_high": np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64),
+            "day": np.array(days, dtype=np.float64),
+        }
+
+
+def compute_lab_trends(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Per-analyte latest value, change since the previous result, least-squares
+    slope per year and out-of-range flag, computed over column arrays
+    """
+    if columns["value"].size == 0:
+        return []
+
+    # Reference ranges stated on the report win; fall back to the catalog's defaults
+    default_low = np.array([_nan(ANALYTES[a].reference[0]) for a in columns["analyte"]])
+    default_high = np.array([_nan(ANALYTES[a].reference[1]) for a in columns["analyte"]])
+    ref_low = np.where(np.isnan(columns["ref_low"]), default_low, columns["ref_low"])
+    ref_high = np.where(np.isnan(columns["ref_high"]), default_high, columns["ref_high"])
+    high = ~np.isnan(ref_high) & (columns["value"] > ref_high)
+    low = ~np.isnan(ref_low) & (columns["value"] < ref_low)
+
+    # Undated results sort before dated ones and never contribute to a slope
+    sort_day = np.where(np.isnan(columns["day"]), -np.inf, columns["day"])
+    order = np.lexsort((sort_day, columns["analyte"].astype(str)))
+
+    trends = []
+    analytes = columns["analyte"][order]
+    boundaries = np.flatnonzero(analytes[1:] != analytes[:-1]) + 1
+    for rows in np.split(order, boundaries):
+        name = columns["analyte"][rows[0]]
+        values = columns["value"][rows]
+        days = columns["day"][rows]
+        last = rows[-1]
+        trend = {
+            "analyte": name,
+            "unit": ANALYTES[name].unit,
+            "latest": float(values[-1]),
+            "latest_date": _iso(days[-1]),
+            "previous": None,
+            "previous_date": None,
+            "delta": None,
+            "pct_change": None,
+            "slope_per_year": None,
+            "ref_low": _none(ref_low[last]),
+            "ref_high": _none(ref_high[last]),
+            "flag": "HIGH" if high[last] else "LOW" if low[last] else "",
+            "out_of_range_count": int(np.count_nonzero(high[rows] | low[rows])),
+            "count": int(rows.size),
+        }
+        if rows.size > 1:
+            trend["previous"] = float(values[-2])
+            trend["previous_date"] = _iso(days[-2])
+            trend["delta"] = float(values[-1] - values[-2])
+            if values[-2]:
+                trend["pct_change"] = float(100.0 * (values[-1] - values[-2]) / values[-2])
+        dated = ~np.isnan(days)
+        if np.unique(days[dated]).size >= 2:
+            years = (days[dated] - days[dated][0]) / 365.25
+            trend["slope_per_year"] = float(np.polyfit(years, values[dated], 1)[0])
+        trends.append(trend)
+    return trends
+
+
+def _nan(value: Optional[float]) -> float:
+    return np.nan if value is None else value
+
+
+def _none(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def _iso(day: float) -> Optional[str]:
+    return None if np.isnan(day) else date.fromordinal(int(day)).isoformat()
+
+
+def _fmt(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.3g}" if abs(value) < 10 else f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def format_lab_table(trends: List[Dict[str, Any]], max_rows: int = LAB_TABLE_MAX_ROWS) -> str:
+    """Compact pipe table of lab trends for agent prompts; flagged analytes first"""
+    if not trends:
+        return ""
+    ordered = sorted(trends, key=lambda t: (not t["flag"], t["analyte"]))[:max_rows]
+    lines = ["Analyte (unit) | Latest (date) | Previous (date) | Change | Slope/yr | Ref range | Flag | n"]
+    for t in ordered:
+        if t["ref_low"] is not None and t["ref_high"] is not None:
+            ref = f"{_fmt(t['ref_low'])}-{_fmt(t['ref_high'])}"
+        elif t["ref_high"] is not None:
+            ref = f"<{_fmt(t['ref_high'])}"
+        elif t["ref_low"] is not None:
+            ref = f">{_fmt(t['ref_low'])}"
+        else:
+            ref = "-"
+        previous = "-" if t["previous"] is None else f"{_fmt(t['previous'])} ({t['previous_date'] or 'undated'})"
+        change = "-"
+        if t["delta"] is not None:
+            change = f"{t['delta']:+.3g}" + (f" ({t['pct_change']:+.0f}%)" if t["pct_change"] is not None else "")
+        slope = "-" if t["slope_per_year"] is None else f"{t['slope_per_year']:+.3g}"
+        lines.append(
+            f"{t['analyte']} ({t['unit']}) | {_fmt(t['latest'])} ({t['latest_date'] or 'undated'}) | {previous} | "
+            f"{change} | {slope} | {ref} | {t['flag'] or '-'} | {t['count']}"
+        )
+    return "\n".join(lines)
+
+
+def lab_table(user_id: str) -> str:
+    """The lab table for a user's published documents, or an empty string if no labs were extracted"""
+    return format_lab_table(compute_lab_trends(get_lab_store().columns(user_id, published_file_hashes(user_id))))
+
+
+_lab_store: Optional[LabStore] = None
+_lab_store_lock = threading.Lock()
+
+
+def get_lab_store() -> LabStore:
+    """Process-wide lab store instance"""
+    global _lab_store
+    with _lab_store_lock:
+        if _lab_store is None:
+            _lab_store = LabStore()
+        return _lab_store
@@ -0,0 +1,230 @@
+"""
+Lexical Index
+
+A per-user BM25 inverted index over document chunks, built at ingest time
+and queried locally alongside dense retrieval. Exact lab tokens such as
+"ALT", "eGFR" or "LDL-C" are kept intact by the tokenizer, so lexical
+search can find chunks that dense embeddings rank poorly.
+"""
+
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Sequence
+
+from modules.ingest_manifest import user_storage_key, file_version, file_lock
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./lexical_index")
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# A lexical hit is "decisive" when it covers every query term and clearly
+# outscores the runner-up; such queries skip dense retrieval
+LEXICAL_DECISIVE_MIN_SCORE = float(os.getenv("LEXICAL_DECISIVE_MIN_SCORE", "5.0"))
+LEXICAL_DECISIVE_MARGIN = float(os.getenv("LEXICAL_DECISIVE_MARGIN", "1.5"))
+LEXICAL_DECISIVE_MAX_TERMS = 4
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_STOP_WORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me my of on or our
+should that the their there this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens; compound tokens like "ldl-c" are kept whole and
+    also split into their parts so "LDL C" and "LDL-C" still match
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOP_WORDS:
+            continue
+        tokens.append(token)
+        if any(sep in token for sep in "-/."):
+            tokens.extend(part for part in re.split(r"[-/.]", token) if part and part not in _STOP_WORDS)
+    return tokens
+
+
+class _UserIndex:
+    def __init__(self, data: Optional[Dict[str, Any]] = None):
+        data = data or {}
+        self.doc_len: Dict[str, int] = data.get("doc_len", {})
+        self.postings: Dict[str, Dict[str, int]] = data.get("postings", {})
+        self.metadata: Dict[str, Dict[str, Any]] = data.get("metadata", {})
+        self.total_len = sum(self.doc_len.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"doc_len": self.doc_len, "postings": self.postings, "metadata": self.metadata}
+
+
+class LexicalIndex:
+    """
+    BM25 indexes for all users, persisted as one JSON file per user. A
+    user's index is reloaded when another server process rewrites its file.
+    """
+
+    def __init__(self, base_dir: str = LEXICAL_INDEX_DIR):
+        self.base_dir = base_dir
+        self._users: Dict[str, _UserIndex] = {}
+        self._versions: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.base_dir, f"{user_storage_key(user_id)}.json")
+
+    def _load(self, user_id: str) -> _UserIndex:
+        path = self._path(user_id)
+        version = file_version(path)
+        if user_id not in self._users or self._versions.get(user_id) != version:
+            data = None
+            if version is not None:
+                try:
+                    with open(path, "r") as f:
+                        data = json.load(f)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"⚠️  Could not read lexical index for user {user_id}, rebuilding on next upload: {e}")
+            self._users[user_id] = _UserIndex(data)
+            self._versions[user_id] = version
+        return self._users[user_id]
+
+    def _save(self, user_id: str, user: _UserIndex):
+        path = self._path(user_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(user.to_dict(), f)
+        os.replace(f"{path}.tmp", path)
+        self._versions[user_id] = file_version(path)
+
+    def add(self, user_id: str, records: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """Index (id, text, metadata) records for a user"""
+        with self._lock, file_lock(self._path(user_id)):
+            user = self._load(user_id)
+            for chunk_id, text, metadata in records:
+                if chunk_id in user.doc_len:
+                    continue
+                counts = Counter(tokenize(text))
+                user.doc_len[chunk_id] = sum(counts.values())
+                user.total_len += user.doc_len[chunk_id]
+                user.metadata[chunk_id] = metadata
+                for term, tf in counts.items():
+                    user.postings.setdefault(term, {})[chunk_id] = tf
+            self._save(user_id, user)
+
+    def remove(self, user_id: str, ids: Iterable[str]):
+        """Drop chunks from a user's index"""
+        drop = set(ids)
+        with self._lock, file_lock(self._path(user_id)):
+            user = self._load(user_id)
+            for chunk_id in drop:
+                user.total_len -= user.doc_len.pop(chunk_id, 0)
+                user.metadata.pop(chunk_id, None)
+            for term in list(user.postings):
+                docs = user.postings[term]
+                for chunk_id in drop.intersection(docs):
+                    del docs[chunk_id]
+                if not docs:
+                    del user.postings[term]
+            self._save(user_id, user)
+
+    def clear(self, user_id: str):
+        """Forget a user's whole index"""
+        with self._lock, file_lock(self._path(user_id)):
+            self._users.pop(user_id, None)
+            self._versions.pop(user_id, None)
+            path = self._path(user_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def search(self, user_id: str, query: str, top_k: int = 10,
+               specialties: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        BM25 search returning match dicts with `id`, `score`, `metadata` and
+        `matched_terms`, optionally over only the chunks tagged with one of
+        `specialties`
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            user = self._load(user_id)
+            n_docs = len(user.doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = user.total_len / n_docs
+            scores: Dict[str, float] = {}
+            matched: Dict[str, int] = {}
+            for term in terms:
+                docs = user.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for chunk_id, tf in docs.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * user.doc_len[chunk_id] / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+                    matched[chunk_id] = matched.get(chunk_id, 0) + 1
+            if specialties:
+                wanted = set(specialties)
+                scores = {
+                    chunk_id: score for chunk_id, score in scores.items()
+                    if wanted.intersection(user.metadata.get(chunk_id, {}).get("specialties") or ())
+                }
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [
+                {
+                    "id": chunk_id,
+                    "score": score,
+                    "metadata": user.metadata.get(chunk_id, {}),
+                    "matched_terms": matched[chunk_id],
+                    "query_terms": len(terms),
+                }
+                for chunk_id, score in ranked
+            ]
+
+
+def is_decisive(matches: List[Dict[str, Any]]) -> bool:
+    """
+    True when the lexical results alone are trustworthy: a short, exact-term
+    query whose top hit covers every term with a clear score margin
+    """
+    if not matches:
+        return False
+    top = matches[0]
+    if top["query_terms"] > LEXICAL_DECISIVE_MAX_TERMS or top["matched_terms"] < top["query_terms"]:
+        return False
+    if top["score"] < LEXICAL_DECISIVE_MIN_SCORE:
+        return False
+    runner_up = matches[1]["score"] if len(matches) > 1 else 0.0
+    return top["score"] >= LEXICAL_DECISIVE_MARGIN * runner_up
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse ranked match lists by summing 1 / (k + rank) per document"""
+    fused: Dict[str, float] = {}
+    first_seen: Dict[str, Dict[str, Any]] = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            fused[match["id"]] = fused.get(match["id"], 0.0) + 1.0 / (k + rank)
+            first_seen.setdefault(match["id"], match)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    results = []
+    for chunk_id, score in ranked:
+        match = dict(first_seen[chunk_id])
+        match["score"] = score
+        results.append(match)
+    return results
+
+
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """Process-wide lexical index instance"""
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+        return _lexical_index
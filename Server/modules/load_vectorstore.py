@@ -1,15 +1,28 @@
 import os
-import time
+import asyncio
 import warnings
 from pathlib import Path
+from typing import List, Optional
 from dotenv import load_dotenv
 from tqdm.auto import tqdm
-from pinecone import Pinecone, ServerlessSpec
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.documents import Document
 from datetime import datetime
+from tenacity import retry, stop_after_attempt, wait_exponential
+from modules.ingest_manifest import (
+    chunk_vector_id, load_manifest, save_manifest, delete_manifest,
+    empty_manifest, manifest_chunk_ids, record_file, staging, record_staged, abandoned_staged_ids
+)
+from modules.embedding_cache import get_embedding_model
+from modules.embedding_profile import get_embedding_profile
+from modules.vector_store import get_vector_store, index_dimension
+from modules.lexical_index import get_lexical_index
+from modules.chunk_store import get_chunk_store, index_metadata
+from modules.pdf_handlers import SavedUpload
+from modules.pdf_extraction import extract_pdf_pages
+from modules.lab_store import get_lab_store, extract_lab_results
+from modules.retrieval_cache import get_retrieval_cache
+from modules.specialty_digest import get_digest_store, file_digest_parts
+from modules.specialties import classify_text
+from modules.text_splitter import split_documents
 
 # Suppress pypdf page label warnings
 warnings.filterwarnings("ignore", category=UserWarning, module="pypdf._page_labels")
@@ -17,173 +30,411 @@ warnings.filterwarnings("ignore", category=UserWarning, module="pypdf._page_labe
 load_dotenv()
 
 OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
-PINECONE_API_KEY=os.getenv("PINECONE_API_KEY")
-PINECONE_ENV="us-east-1"
-PINECONE_INDEX_NAME = "pocketmdtpdfs"
 
 if OPENAI_API_KEY is not None:
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
-UPLOAD_DIR = "./uploaded_docs"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Ingestion pipeline tuning
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+BATCH_MAX_ATTEMPTS = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))
 
-
-# initialize pinecone instance
-pc=Pinecone(api_key=PINECONE_API_KEY)
-spec=ServerlessSpec(cloud="aws",region=PINECONE_ENV)
-existing_indexes=[i["name"] for i in pc.list_indexes()]
-
-
-if PINECONE_INDEX_NAME not in existing_indexes:
-    pc.create_index(
-        name=PINECONE_INDEX_NAME,
-        dimension=3072,  # Updated to match text-embedding-3-large
-        metric="cosine",
-        spec=spec
-    )
-    while not pc.describe_index(PINECONE_INDEX_NAME).status["ready"]:
-        time.sleep(1)
-else:
-    # Check if existing index has correct dimension
-    index_info = pc.describe_index(PINECONE_INDEX_NAME)
-    current_dimension = index_info.dimension
-    if current_dimension != 3072:
-        print(f"⚠️  Existing index has dimension {current_dimension}, but text-embedding-3-large requires 3072")
-        print("🗑️  Deleting existing index to recreate with correct dimension...")
-        pc.delete_index(PINECONE_INDEX_NAME)
-        time.sleep(5)  # Wait for deletion to complete
-        
-        pc.create_index(
-            name=PINECONE_INDEX_NAME,
-            dimension=3072,
-            metric="cosine",
-            spec=spec
-        )
-        while not pc.describe_index(PINECONE_INDEX_NAME).status["ready"]:
-            time.sleep(1)
-        print("✅ Index recreated with correct dimension")
-
-
-index=pc.Index(PINECONE_INDEX_NAME)
-
-def load_pdf_with_fallback(file_path):
-    """Load PDF with fallback to alternative method if PyPDFLoader fails"""
-    try:
-        # Try PyPDFLoader first
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
-        print(f"📄 Successfully loaded {len(documents)} pages from {Path(file_path).name} using PyPDFLoader")
-        return documents
-    except Exception as e:
-        print(f"⚠️  PyPDFLoader failed for {Path(file_path).name}: {e}")
-        try:
-            # Fallback to PyMuPDF if available
-            import fitz
-            doc = fitz.open(file_path)
-            documents = []
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                if text.strip():  # Only add non-empty pages
-                    documents.append(Document(
-                        page_content=text,
-                        metadata={"source": file_path, "page": page_num + 1}
-                    ))
-            doc.close()
-            print(f"📄 Successfully loaded {len(documents)} pages from {Path(file_path).name} using PyMuPDF fallback")
-            return documents
-        except ImportError:
-            print(f"❌ PyMuPDF not available for fallback. Skipping {Path(file_path).name}")
-            return []
-        except Exception as e2:
-            print(f"❌ Both PDF loaders failed for {Path(file_path).name}: {e2}")
-            return []
+# Manifests record the profile their vectors were embedded with
+EMBEDDING_PROFILE = get_embedding_profile()
 
 def clear_user_documents(user_id: str):
     """Clear all documents for a specific user from the vector store"""
     try:
         print(f"🗑️  Clearing documents for user: {user_id}")
         
-        # Query for all vectors belonging to this user
-        # Note: This is a simplified approach. In production, you might want to use metadata filtering
-        # or implement a more sophisticated deletion strategy
-        
-        # For now, we'll use a filter to delete user-specific documents
-        # This requires the index to support metadata filtering
+        # Each user's vectors live in their own namespace (or per-user files for
+        # the local backend), so this is a single drop rather than a filtered delete
         try:
-            # Delete vectors with user_id in metadata
-            index.delete(filter={"user_id": user_id})
+            get_vector_store().delete_user(user_id)
+            get_lexical_index().clear(user_id)
+            get_chunk_store().delete_user(user_id)
+            get_lab_store().delete_user(user_id)
+            get_digest_store().delete_user(user_id)
+            delete_manifest(user_id)
+            get_retrieval_cache().invalidate(user_id)
             print(f"✅ Cleared documents for user: {user_id}")
         except Exception as e:
-            print(f"⚠️  Could not use metadata filter deletion: {e}")
-            print("⚠️  Consider recreating index with metadata filtering support")
+            print(f"⚠️  Could not clear vectors for user {user_id}: {e}")
             
     except Exception as e:
         print(f"⚠️  Warning: Could not clear documents for user {user_id}: {e}")
 
-def load_vectorstore(uploaded_files, user_id: str):
+def _batched(items, size):
+    """Yield successive fixed-size slices of a list"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+@retry(stop=stop_after_attempt(BATCH_MAX_ATTEMPTS), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+def _embed_batch(embed_model, texts):
+    """Embed one batch of texts, retrying the batch on transient failures"""
+    return embed_model.embed_documents(texts)
+
+@retry(stop=stop_after_attempt(BATCH_MAX_ATTEMPTS), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+def _upsert_batch(user_id, vectors):
+    """Upsert one batch of vectors, retrying the batch on transient failures"""
+    get_vector_store().upsert(user_id, vectors)
+
+@retry(stop=stop_after_attempt(BATCH_MAX_ATTEMPTS), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+def _delete_batch(user_id, ids):
+    """Delete one batch of vectors by ID, retrying the batch on transient failures"""
+    get_vector_store().delete(user_id, ids)
+
+class IngestProgress:
+    """Receives per-file progress from an ingestion run; the default ignores it"""
+
+    def stage(self, file_hash: str, stage: str, **fields):
+        pass
+
+    def advance(self, file_hash: str, chunks: int):
+        pass
+
+    def error(self, file_hash: str, message: str):
+        pass
+
+class IngestionPipeline:
+    """
+    Parses, embeds and upserts the files of one upload session.
+    
+    PDF extraction runs on the shared process pool in parallel page ranges, so
+    files parse while earlier ones embed without blocking the event loop;
+    embedding and upserting run in bounded-concurrency batches. Chunks whose
+    content-derived ID is already in the index are never re-embedded.
+    """
+
+    def __init__(self, user_id: str, session_id: str, embed_model, known_ids=None,
+                 progress: Optional[IngestProgress] = None):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.embed_model = embed_model
+        self.known_ids = set(known_ids or ())
+        self.claimed_ids = set()
+        self.progress = progress or IngestProgress()
+        self.failed_files = set()
+        self.embed_sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+        self.upsert_sem = asyncio.Semaphore(UPSERT_CONCURRENCY)
+        self.staged_lock = asyncio.Lock()
+        self.stats = {
+            "files_processed": 0,
+            "files_unchanged": 0,
+            "chunks_reused": 0,
+            "chunks_embedded": 0,
+            "chunks_deleted": 0,
+            "vectors_upserted": 0,
+            "lab_results": 0,
+            "failed_batches": 0,
+            "files": {},
+        }
+
+    async def ingest_file(self, file_path, file_hash, filename=None):
+        """
+        Ingest one file and return the IDs of all of its chunks, or None if
+        no content could be extracted
+        """
+        name = filename or Path(file_path).name
+
+        print(f"\n📁 Processing for user {self.user_id}: {name}")
+        self.progress.stage(file_hash, "parsing")
+        documents = await extract_pdf_pages(file_path, file_hash)
+        lab_results = await self._store_labs(documents, file_hash, name)
+        await self._store_digest_parts(documents, lab_results, file_hash, name)
+        chunks, split_stats = await asyncio.to_thread(split_documents, documents) if documents else ([], None)
+
+        if not chunks:
+            print(f"⚠️  Skipping {name} - no content extracted")
+            self.progress.error(file_hash, "No text could be extracted")
+            self.progress.stage(file_hash, "skipped")
+            return None
+
+        self.stats["files"][name] = split_stats.as_dict()
+        print(f"✂️  Split {name} as {split_stats.doc_type}: {split_stats.chunks} chunks "
+              f"from {split_stats.pages} pages, mean {split_stats.mean_chunk_tokens} tokens")
+
+        chunk_ids = []
+        records = []
+        for chunk in chunks:
+            vector_id = chunk_vector_id(self.user_id, chunk.page_content)
+            chunk_ids.append(vector_id)
+            # Skip chunks already in the index or already queued by another file
+            if vector_id in self.known_ids or vector_id in self.claimed_ids:
+                continue
+            self.claimed_ids.add(vector_id)
+
+            # Rich metadata goes to the local chunk store; the index only gets filter fields
+            metadata = chunk.metadata.copy()
+            metadata["filename"] = name  # Add filename for tracking
+            metadata["upload_session"] = self.session_id  # Add session ID for tracking
+            metadata["user_id"] = self.user_id  # Add user ID for isolation
+            metadata["specialties"] = sorted(classify_text(chunk.page_content))  # Filter for specialist retrieval
+            records.append((vector_id, chunk.page_content, metadata))
+
+        # Other server processes must hide these IDs before they reach any store
+        async with self.staged_lock:
+            await asyncio.to_thread(record_staged, self.user_id, list(self.claimed_ids))
+
+        # Chunk text must be readable before its vector becomes queryable
+        await asyncio.to_thread(get_chunk_store().put_many, self.user_id, records)
+
+        self.stats["chunks_reused"] += len(chunks) - len(records)
+        print(f"🔍 Embedding {len(records)} new chunks from {name} for user {self.user_id} "
+              f"({len(chunks) - len(records)} reused) in batches of {EMBED_BATCH_SIZE}...")
+
+        self.progress.stage(file_hash, "embedding", chunks_total=len(records), chunks_done=0,
+                            chunks_reused=len(chunks) - len(records), doc_type=split_stats.doc_type)
+        bar = tqdm(total=len(records), desc=f"Upserting {name}")
+        try:
+            await asyncio.gather(*(
+                self._embed_and_upsert(name, file_hash, batch, bar)
+                for batch in _batched(records, EMBED_BATCH_SIZE)
+            ))
+        finally:
+            bar.close()
+
+        # Keep the BM25 index in step with the vectors that were just written
+        await asyncio.to_thread(
+            get_lexical_index().add,
+            self.user_id,
+            [(vector_id, text, index_metadata(meta)) for vector_id, text, meta in records]
+        )
+
+        self.stats["files_processed"] += 1
+        self.progress.stage(file_hash, "failed" if file_hash in self.failed_files else "done")
+        print(f"✅ Upload complete for {name} (user: {self.user_id})")
+        return list(dict.fromkeys(chunk_ids))
+
+    async def _store_labs(self, documents, file_hash, name):
+        """Extract structured lab results from a file's pages into the lab store"""
+        results = await asyncio.to_thread(extract_lab_results, documents)
+        await asyncio.to_thread(get_lab_store().replace_file, self.user_id, file_hash, name, results)
+        self.stats["lab_results"] += len(results)
+        if results:
+            print(f"🧪 Extracted {len(results)} lab results from {name} for user {self.user_id}")
+        return results
+
+    async def _store_digest_parts(self, documents, lab_results, file_hash, name):
+        """Extract a file's per-specialty findings for the digests built after publishing"""
+        parts = await asyncio.to_thread(file_digest_parts, documents, lab_results)
+        await asyncio.to_thread(get_digest_store().replace_parts, self.user_id, file_hash, name, parts)
+
+    async def backfill(self, file_path, file_hash, name):
+        """Extract labs and digest findings for an unchanged file ingested before they existed"""
+        has_labs = await asyncio.to_thread(get_lab_store().has_file, self.user_id, file_hash)
+        has_parts = await asyncio.to_thread(get_digest_store().has_parts, self.user_id, file_hash)
+        if has_labs and has_parts:
+            return
+        documents = await extract_pdf_pages(file_path, file_hash)
+        if has_labs:
+            results = await asyncio.to_thread(extract_lab_results, documents)
+        else:
+            results = await self._store_labs(documents, file_hash, name)
+        if not has_parts:
+            await self._store_digest_parts(documents, results, file_hash, name)
+
+    def _batch_failed(self, file_hash, message):
+        print(f"❌ {message} (user: {self.user_id})")
+        self.stats["failed_batches"] += 1
+        self.failed_files.add(file_hash)
+        self.progress.error(file_hash, message)
+
+    async def _embed_and_upsert(self, name, file_hash, batch, bar):
+        async with self.embed_sem:
+            try:
+                embeddings = await asyncio.to_thread(
+                    _embed_batch, self.embed_model, [text for _, text, _ in batch]
+                )
+            except Exception as e:
+                self._batch_failed(file_hash, f"Embedding batch of {len(batch)} chunks failed for {name}: {e}")
+                return
+        self.stats["chunks_embedded"] += len(batch)
+        # Upsert as soon as a batch is embedded so the two stages overlap
+        vectors = [(vector_id, emb, index_metadata(meta)) for (vector_id, _, meta), emb in zip(batch, embeddings)]
+        await asyncio.gather(*(
+            self._upsert(name, file_hash, part, bar) for part in _batched(vectors, UPSERT_BATCH_SIZE)
+        ))
+
+    async def _upsert(self, name, file_hash, vectors, bar):
+        async with self.upsert_sem:
+            try:
+                await asyncio.to_thread(_upsert_batch, self.user_id, vectors)
+                self.stats["vectors_upserted"] += len(vectors)
+                bar.update(len(vectors))
+                self.progress.advance(file_hash, len(vectors))
+            except Exception as e:
+                self._batch_failed(file_hash, f"Upsert batch of {len(vectors)} vectors failed for {name}: {e}")
+
+async def collect_garbage(user_id: str) -> int:
+    """
+    Delete the chunks listed as garbage in the user's manifest, in batches.
+    These belong to superseded or abandoned versions and are no longer read.
+    Chunks that could not be deleted stay listed and are retried next time.
+
+    Returns:
+        Number of chunks deleted
+    """
+    manifest = load_manifest(user_id)
+    garbage = list(dict.fromkeys(manifest["garbage"]))
+    if not garbage:
+        return 0
+    print(f"🗑️  Collecting {len(garbage)} superseded chunks for user {user_id}")
+    sem = asyncio.Semaphore(UPSERT_CONCURRENCY)
+    deleted = []
+
+    async def delete(part):
+        async with sem:
+            try:
+                await asyncio.to_thread(_delete_batch, user_id, part)
+                deleted.extend(part)
+            except Exception as e:
+                print(f"⚠️  Delete batch of {len(part)} vectors failed (user: {user_id}), will retry: {e}")
+
+    await asyncio.gather(*(delete(part) for part in _batched(garbage, UPSERT_BATCH_SIZE)))
+    await asyncio.to_thread(get_lexical_index().remove, user_id, deleted)
+    await asyncio.to_thread(get_chunk_store().delete, deleted)
+
+    # Re-read so the version published meanwhile is kept; only the garbage list shrinks
+    manifest = load_manifest(user_id)
+    done = set(deleted)
+    manifest["garbage"] = [vector_id for vector_id in manifest["garbage"] if vector_id not in done]
+    save_manifest(user_id, manifest)
+    return len(deleted)
+
+async def load_vectorstore(uploads: List[SavedUpload], user_id: str, progress: Optional[IngestProgress] = None,
+                           rebuild: bool = False):
     """
     Load documents into vector store with user isolation
     
+    The upload is treated as the user's complete document set and built as a
+    new version next to the published one, which keeps serving queries until
+    the manifest pointer is swapped. Files and chunks are identified by
+    content hash, so unchanged files are skipped, unchanged chunks are not
+    re-embedded, and chunks that left the set are garbage-collected after
+    the swap.
+
+    Vectors stored before the user had a manifest keep serving while the
+    first set is built and are collected after it is published. After an
+    embedding profile change every chunk is re-embedded in place under its
+    content ID, so readers see old or new vectors of the same text; only a
+    store that cannot hold both layouts drops the old vectors first, and
+    lexical search keeps serving the published set meanwhile.
+    
     Args:
-        uploaded_files: List of uploaded file objects
+        uploads: Files already streamed to disk by save_uploaded_files
         user_id: Unique identifier for the user uploading documents
+        progress: Optional receiver of per-file stage and chunk progress
+        rebuild: Re-parse every file instead of reusing unchanged ones
+        
+    Returns:
+        Dict with ingestion statistics for the upload session
     """
-    embed_model = OpenAIEmbeddings(model="text-embedding-3-large")
-    file_paths = []
+    embed_model = get_embedding_model()
     
-    # Generate a unique session ID for this upload batch
-    session_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Generate a unique session ID for this upload batch; it names the new version
+    session_id = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     print(f"🆔 Starting upload session for user {user_id}: {session_id}")
 
-    # Clear existing documents for this user only
-    clear_user_documents(user_id)
+    manifest = load_manifest(user_id)
+    leftover = abandoned_staged_ids(user_id) - manifest_chunk_ids(manifest)
+    if leftover:
+        print(f"🧹 Queueing {len(leftover)} chunks left staged by an interrupted ingest for user {user_id}")
+        manifest["garbage"] = list(dict.fromkeys(manifest["garbage"] + sorted(leftover)))
+        save_manifest(user_id, manifest)
+    store = get_vector_store()
+    # Everything that may be stored; only the published chunks are known to be complete
+    stored_ids = manifest_chunk_ids(manifest) | set(manifest["garbage"])
+    legacy_ids = set()
+    if not manifest["files"]:
+        # Vectors from before manifests (or migrated into the user's namespace) are not
+        # recorded anywhere; list them so they can be collected once the new set is live
+        try:
+            legacy_ids = set(await asyncio.to_thread(store.list_ids, user_id)) - stored_ids
+        except Exception as e:
+            print(f"⚠️  Could not list existing vectors for user {user_id}; they will stay stored but unused: {e}")
+    reuse = bool(manifest["files"]) and manifest.get("embedding_profile") == EMBEDDING_PROFILE.name
+    if not reuse and manifest["files"]:
+        print(f"🔁 Embedding profile changed to {EMBEDDING_PROFILE.name}; re-embedding all chunks for user {user_id}")
+        rebuild = True
+        if not await asyncio.to_thread(store.accepts, user_id, index_dimension()):
+            # The old layout cannot take the new vectors, nor answer the new profile's queries
+            await asyncio.to_thread(store.delete_user, user_id)
+    known_ids = manifest_chunk_ids(manifest) if reuse else set()
 
-    for file in uploaded_files:
-        save_path = Path(UPLOAD_DIR) / f"{user_id}_{file.filename}"
-        with open(save_path, "wb") as f:
-            f.write(file.file.read())
-        file_paths.append(str(save_path))
+    pipeline = IngestionPipeline(user_id, session_id, embed_model, known_ids, progress)
+    new_manifest = empty_manifest(user_id)
+    new_manifest["embedding_profile"] = EMBEDDING_PROFILE.name
+    new_manifest["version"] = session_id
 
-    for file_path in file_paths:
-        print(f"\n📁 Processing for user {user_id}: {Path(file_path).name}")
-        documents = load_pdf_with_fallback(file_path)
-        
-        if not documents:
-            print(f"⚠️  Skipping {Path(file_path).name} - no content extracted")
-            continue
+    async def ingest(upload: SavedUpload):
+        file_hash, name = upload.sha256, upload.filename
+        entry = None if rebuild else manifest["files"].get(file_hash)
+        if entry:
+            print(f"⏭️  Skipping unchanged file for user {user_id}: {name}")
+            pipeline.stats["files_unchanged"] += 1
+            pipeline.stats["chunks_reused"] += len(entry["chunk_ids"])
+            record_file(new_manifest, file_hash, name, entry["chunk_ids"])
+            await pipeline.backfill(upload.path, file_hash, name)
+            pipeline.progress.stage(file_hash, "unchanged", chunks_reused=len(entry["chunk_ids"]))
+            return
+        chunk_ids = await pipeline.ingest_file(upload.path, file_hash, name)
+        if chunk_ids is not None:
+            record_file(new_manifest, file_hash, name, chunk_ids)
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(documents)
+    stats = pipeline.stats
+    with staging(user_id, pipeline.claimed_ids):
+        try:
+            # Hashes were computed while streaming; identical files only need ingesting once
+            unique_uploads = {upload.sha256: upload for upload in uploads}
+            # Let every file finish so no task is still writing chunks when they are recorded below
+            results = await asyncio.gather(*(ingest(upload) for upload in unique_uploads.values()),
+                                           return_exceptions=True)
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                raise errors[0]
+            # Backends that buffer upserts write them once here, before anything is published
+            await asyncio.to_thread(get_vector_store().flush, user_id)
+            if stats["failed_batches"]:
+                raise RuntimeError(
+                    f"{stats['failed_batches']} batch(es) failed after {BATCH_MAX_ATTEMPTS} attempts "
+                    f"in session {session_id} for user {user_id}"
+                )
+        except BaseException:
+            # Keep the published version and queue the abandoned one's new chunks for deletion
+            abandoned = pipeline.claimed_ids - stored_ids - legacy_ids
+            manifest["garbage"] = list(dict.fromkeys(manifest["garbage"] + sorted(abandoned)))
+            save_manifest(user_id, manifest)
+            try:
+                await collect_garbage(user_id)
+            except Exception as e:
+                print(f"⚠️  Could not collect abandoned chunks for user {user_id}, will retry: {e}")
+            raise
 
-        texts = [chunk.page_content for chunk in chunks]
-        # Include the text content in metadata for retrieval
-        metadatas = []
-        for chunk in chunks:
-            metadata = chunk.metadata.copy()
-            metadata["text"] = chunk.page_content  # Add text content to metadata
-            metadata["filename"] = Path(file_path).name  # Add filename for tracking
-            metadata["upload_session"] = session_id  # Add session ID for tracking
-            metadata["user_id"] = user_id  # Add user ID for isolation
-            metadatas.append(metadata)
-        
-        # Generate unique IDs with user_id and timestamp to prevent conflicts
-        ids = [f"{user_id}_{session_id}_{Path(file_path).stem}_{i}" for i in range(len(chunks))]
+        # Swap the pointer: readers move from the old version to the new one in one rename
+        new_manifest["garbage"] = sorted((stored_ids | legacy_ids) - manifest_chunk_ids(new_manifest))
+        save_manifest(user_id, new_manifest)
+        get_retrieval_cache().invalidate(user_id)
+    print(f"🔀 Published document set version {session_id} for user {user_id}")
 
-        print(f"🔍 Embedding {len(texts)} chunks from {Path(file_path).name} for user {user_id}...")
-        embeddings = embed_model.embed_documents(texts)
+    if not manifest["files"]:
+        # The user's own storage is now authoritative; drop copies left in the shared namespace
+        await asyncio.to_thread(store.delete_legacy, user_id)
 
-        print(f"📤 Uploading {Path(file_path).name} to Pinecone for user {user_id}...")
-        with tqdm(total=len(embeddings), desc=f"Upserting {Path(file_path).name}") as progress:
-            index.upsert(vectors=list(zip(ids, embeddings, metadatas)))
-            progress.update(len(embeddings))
+    await asyncio.to_thread(get_lab_store().retain_files, user_id, new_manifest["files"].keys())
+    # Digest parts of removed files are dropped by refresh_digests, which still needs them
+    stats["chunks_deleted"] = await collect_garbage(user_id)
 
-        print(f"✅ Upload complete for {Path(file_path).name} (user: {user_id})")
-    
     print(f"\n🎉 All documents uploaded successfully for user {user_id} in session: {session_id}")
-    print(f"📊 Total files processed: {len(file_paths)}")
+    print(f"📊 Files processed: {stats['files_processed']}, unchanged: {stats['files_unchanged']}, "
+          f"chunks embedded: {stats['chunks_embedded']}, reused: {stats['chunks_reused']}, "
+          f"deleted: {stats['chunks_deleted']}")
+    return stats
 
-def query_user_documents(query_embedding, user_id: str, top_k: int = 5):
+def query_user_documents(query_embedding, user_id: str, top_k: int = 5, include_values: bool = False,
+                         specialties=None, exclude_ids=None):
     """
     Query documents for a specific user only
     
@@ -191,29 +442,14 @@ def query_user_documents(query_embedding, user_id: str, top_k: int = 5):
         query_embedding: The embedded query vector
         user_id: User ID to filter documents for
         top_k: Number of results to return
+        include_values: Also return each match's vector
+        specialties: Only search chunks tagged with one of these specialty labels
+        exclude_ids: Never return these chunks
         
     Returns:
         List of matching documents for the user only
     """
-    try:
-        # Query with user_id filter to ensure only user's documents are returned
-        res = index.query(
-            vector=query_embedding, 
-            top_k=top_k, 
-            include_metadata=True,
-            filter={"user_id": user_id}  # This ensures user isolation
-        )
-        return res.get("matches", [])
-    except Exception as e:
-        print(f"⚠️  Warning: Could not use metadata filter for user {user_id}: {e}")
-        # Fallback: query without filter (less secure, but functional)
-        print("⚠️  Falling back to unfiltered query - consider enabling metadata filtering")
-        res = index.query(
-            vector=query_embedding, 
-            top_k=top_k, 
-            include_metadata=True
-        )
-        # Manually filter results by user_id
-        matches = res.get("matches", [])
-        user_matches = [match for match in matches if match.get("metadata", {}).get("user_id") == user_id]
-        return user_matches
\ No newline at end of file
+    return get_vector_store().query(
+        user_id, query_embedding, top_k=top_k, include_values=include_values, specialties=specialties,
+        exclude_ids=exclude_ids
+    )
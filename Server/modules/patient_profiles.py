@@ -0,0 +1,253 @@
+"""
+Patient Profiles
+
+Server-side store of each user's patient history. Every upsert that changes
+the profile bumps its version, which is exposed to clients as an ETag, so
+`/ask/` can reference the stored profile by version instead of receiving
+the whole history as JSON on every call. Saving identical content keeps the
+current version. Deleting a profile leaves a tombstone holding its last
+version, so versions never restart and old ETags never match a new profile.
+
+The formatted profile text that agents see is memoized per
+(user, version), so it is built once per profile change rather than once
+per question.
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+PROFILE_STORE_PATH = os.getenv("PROFILE_STORE_PATH", "./cache/profiles.sqlite3")
+PROFILE_CONTEXT_CACHE_SIZE = int(os.getenv("PROFILE_CONTEXT_CACHE_SIZE", "1024"))
+
+
+class ProfileVersionConflict(ValueError):
+    """The profile changed since the version the client based its update on"""
+
+    def __init__(self, user_id: str, expected: int, current: int):
+        super().__init__(f"Profile for user {user_id} is at version {current}, not {expected}")
+        self.current = current
+
+
+def _etag_prefix(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:12]
+
+
+def profile_etag(user_id: str, version: int) -> str:
+    return f'"{_etag_prefix(user_id)}-{version}"'
+
+
+def parse_etag(value: Optional[str], user_id: str) -> Optional[int]:
+    """The version in an If-Match / If-None-Match value, or None for a missing or foreign tag"""
+    if not value:
+        return None
+    tag = value.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    prefix, _, version = tag.strip('"').rpartition("-")
+    if prefix != _etag_prefix(user_id):
+        return None
+    try:
+        return int(version)
+    except ValueError:
+        return None
+
+
+def _content_hash(data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ProfileStore:
+    """
+    SQLite table of the current profile per user with a monotonically
+    increasing version. A deleted profile is kept as a row with null data.
+    """
+
+    def __init__(self, path: str = PROFILE_STORE_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's profile as {"user_id", "version", "data", "updated_at"}, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, data, updated_at FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None or row[1] == "null":
+            return None
+        return {"user_id": user_id, "version": row[0], "data": json.loads(row[1]), "updated_at": row[2]}
+
+    def version(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM profiles WHERE user_id = ? AND data != 'null'", (user_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, user_id: str, data: Dict[str, Any], if_match: Optional[int] = None) -> Tuple[int, bool]:
+        """
+        Store a user's profile and return (version, changed). With
+        `if_match`, the update only applies if the stored version is still
+        that one (0 meaning no profile, also after a delete); otherwise
+        ProfileVersionConflict.
+        """
+        content_hash = _content_hash(data)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, content_hash, data FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            last = row[0] if row else 0
+            current = last if row and row[2] != "null" else 0
+            if if_match is not None and if_match != current:
+                raise ProfileVersionConflict(user_id, if_match, current)
+            if current and row[1] == content_hash:
+                return current, False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?)",
+                (user_id, last + 1, content_hash, json.dumps(data), datetime.now().isoformat())
+            )
+            self._conn.commit()
+        return last + 1, True
+
+    def delete(self, user_id: str):
+        """Replace the profile with a tombstone that keeps its version sequence going"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE profiles SET version = version + 1, content_hash = '', data = 'null', updated_at = ? "
+                "WHERE user_id = ? AND data != 'null'",
+                (datetime.now().isoformat(), user_id)
+            )
+            self._conn.commit()
+        forget_profile_context(user_id)
+
+
+def format_patient_history(patient_data):
+    """Format patient history data into a readable string for agents"""
+    if not patient_data or not isinstance(patient_data, dict):
+        return ""
+
+    formatted = []
+
+    # Demographics
+    if patient_data.get("name"):
+        formatted.append(f"Name: {patient_data['name']}")
+    if patient_data.get("dob"):
+        formatted.append(f"Date of Birth: {patient_data['dob']}")
+    if patient_data.get("gender"):
+        formatted.append(f"Gender: {patient_data['gender']}")
+    if patient_data.get("height_ft") is not None or patient_data.get("height_in") is not None:
+        height_ft = patient_data.get('height_ft', 0) or 0
+        height_in = patient_data.get('height_in', 0) or 0
+        if height_ft > 0 or height_in > 0:
+            height = f"{height_ft}' {height_in}\""
+            formatted.append(f"Height: {height}")
+    if patient_data.get("weight_lbs"):
+        formatted.append(f"Weight: {patient_data['weight_lbs']} lbs")
+
+    # Medical History
+    if patient_data.get("conditions") and isinstance(patient_data["conditions"], list) and patient_data["conditions"]:
+        formatted.append("\nMedical Conditions:")
+        for condition in patient_data["conditions"]:
+            if isinstance(condition, dict) and condition.get('name'):
+                name = condition.get('name', 'Unknown')
+                date = condition.get('date', 'Unknown date')
+                formatted.append(f"  - {name} (Diagnosed: {date})")
+
+    if patient_data.get("medications") and isinstance(patient_data["medications"], list) and patient_data["medications"]:
+        formatted.append("\nCurrent Medications:")
+        for med in patient_data["medications"]:
+            if isinstance(med, dict) and med.get('name'):
+                name = med.get('name', 'Unknown')
+                dosage = med.get('dosage', 'Unknown dosage')
+                reason = med.get('reason', 'Unknown reason')
+                formatted.append(f"  - {name} ({dosage}) - {reason}")
+
+    if patient_data.get("family_history") and isinstance(patient_data["family_history"], list) and patient_data["family_history"]:
+        formatted.append(f"\nFamily History: {', '.join(patient_data['family_history'])}")
+
+    # Goals
+    if patient_data.get("health_goals"):
+        formatted.append(f"\nHealth Goals: {patient_data['health_goals']}")
+
+    # Symptoms
+    if patient_data.get("symptoms") and isinstance(patient_data["symptoms"], list) and patient_data["symptoms"]:
+        formatted.append("\nCurrent Symptoms:")
+        for symptom in patient_data["symptoms"]:
+            if isinstance(symptom, dict) and symptom.get('symptom'):
+                symptom_name = symptom.get('symptom', 'Unknown')
+                frequency = symptom.get('frequency', 'Unknown')
+                severity = symptom.get('severity', 'Unknown')
+                duration = symptom.get('duration', 'Unknown')
+                formatted.append(f"  - {symptom_name} (Frequency: {frequency}, Severity: {severity}, Duration: {duration})")
+
+    return "\n".join(formatted)
+
+
+_formatted: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+_formatted_lock = threading.Lock()
+
+
+def profile_context(user_id: str) -> Tuple[Optional[int], str]:
+    """
+    (version, formatted text) of the user's stored profile, or (None, "")
+    when there is none. Formatting is memoized per version.
+    """
+    store = get_profile_store()
+    version = store.version(user_id)
+    if version is None:
+        return None, ""
+    key = (user_id, version)
+    with _formatted_lock:
+        if key in _formatted:
+            _formatted.move_to_end(key)
+            return version, _formatted[key]
+
+    profile = store.get(user_id)
+    if profile is None:
+        return None, ""
+    # Key by the version actually read; it may be newer than the one checked above
+    key = (user_id, profile["version"])
+    text = format_patient_history(profile["data"])
+    with _formatted_lock:
+        _formatted[key] = text
+        while len(_formatted) > PROFILE_CONTEXT_CACHE_SIZE:
+            _formatted.popitem(last=False)
+    return profile["version"], text
+
+
+def forget_profile_context(user_id: str):
+    """Drop the user's memoized profile text"""
+    with _formatted_lock:
+        for key in [key for key in _formatted if key[0] == user_id]:
+            del _formatted[key]
+
+
+_profile_store: Optional[ProfileStore] = None
+_profile_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Process-wide profile store instance"""
+    global _profile_store
+    with _profile_store_lock:
+        if _profile_store is None:
+            _profile_store = ProfileStore()
+        return _profile_store
@@ -0,0 +1,205 @@
+"""
+PDF Text Extraction
+
+Page text is extracted in a process pool so CPU-bound parsing never runs on
+the event loop and large documents use every core: a PDF is split into
+page ranges that are extracted in parallel. The backend (pypdf or PyMuPDF)
+is chosen up front from a quick sniff of the file instead of after a full
+failed parse, and every page's text is cached by file hash so re-uploads
+and retries skip extraction entirely.
+
+Worker functions only import the PDF libraries they need, so the module is
+cheap to load in spawned worker processes.
+"""
+
+import os
+import sqlite3
+import importlib.util
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional
+
+from langchain_core.documents import Document
+
+from modules.chunk_store import compress_payload, decompress_payload
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 2)))
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "16"))
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", "./cache/pages.sqlite3")
+
+# PyMuPDF is optional; workers import it only when it is the chosen backend
+PYMUPDF_AVAILABLE = importlib.util.find_spec("fitz") is not None
+
+
+def sniff_pdf(path: str) -> Tuple[Optional[str], int]:
+    """
+    Pick an extraction backend and count pages without extracting any text.
+    pypdf is used when it can open the file; damaged or encrypted files that
+    it cannot read go straight to PyMuPDF. Returns (None, 0) when neither
+    backend can open the file.
+    """
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if b"%PDF" not in head and PYMUPDF_AVAILABLE:
+        return "pymupdf", _pymupdf_page_count(path)
+
+    try:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path, strict=False)
+        if reader.is_encrypted and PYMUPDF_AVAILABLE:
+            return "pymupdf", _pymupdf_page_count(path)
+        return "pypdf", len(reader.pages)
+    except Exception:
+        if PYMUPDF_AVAILABLE:
+            return "pymupdf", _pymupdf_page_count(path)
+        return None, 0
+
+
+def _pymupdf_page_count(path: str) -> int:
+    import fitz
+
+    try:
+        with fitz.open(path) as doc:
+            return len(doc)
+    except Exception:
+        return 0
+
+
+def extract_page_range(path: str, backend: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, end) as (page index, text); runs in a worker process"""
+    if backend == "pymupdf":
+        import fitz
+
+        with fitz.open(path) as doc:
+            return [(i, doc.load_page(i).get_text()) for i in range(start, min(end, len(doc)))]
+
+    from pypdf import PdfReader
+
+    reader = PdfReader(path, strict=False)
+    pages = []
+    for i in range(start, min(end, len(reader.pages))):
+        try:
+            pages.append((i, reader.pages[i].extract_text() or ""))
+        except Exception:
+            if not PYMUPDF_AVAILABLE:
+                raise
+            # One bad page should not cost the whole range
+            pages.extend(extract_page_range(path, "pymupdf", i, i + 1))
+    return pages
+
+
+class PageTextCache:
+    """Compressed per-page text keyed by (file hash, page index)"""
+
+    def __init__(self, path: str = PAGE_CACHE_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (file_hash, page)
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, file_hash: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, codec, payload FROM pages WHERE file_hash = ?", (file_hash,)
+            ).fetchall()
+        return {page: decompress_payload(codec, payload).decode("utf-8") for page, codec, payload in rows}
+
+    def put(self, file_hash: str, pages: List[Tuple[int, str]]):
+        rows = [(file_hash, page, *compress_payload(text.encode("utf-8"))) for page, text in pages]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, page, codec, payload) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_page_cache: Optional[PageTextCache] = None
+_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """Process-wide pool for PDF extraction"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: forking a process that already runs threads is unsafe
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_parse_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def get_page_cache() -> PageTextCache:
+    """Process-wide page text cache"""
+    global _page_cache
+    with _lock:
+        if _page_cache is None:
+            _page_cache = PageTextCache()
+        return _page_cache
+
+
+async def extract_pdf_pages(path: str, file_hash: str) -> List[Document]:
+    """
+    One Document per non-empty page of the PDF at `path`, with the same
+    `source`/`page` metadata as PyPDFLoader. Cached pages are reused; the
+    rest are extracted in parallel page ranges on the process pool.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    name = Path(path).name
+    cache = get_page_cache()
+
+    backend, page_count = await loop.run_in_executor(pool, sniff_pdf, path)
+    if backend is None:
+        print(f"❌ Could not open {name} with pypdf or PyMuPDF")
+        return []
+
+    texts = await asyncio.to_thread(cache.get, file_hash)
+    missing = [page for page in range(page_count) if page not in texts]
+    if missing:
+        groups = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+        ranges = [(group[0], group[-1] + 1) for group in groups]
+
+        async def run(start, end):
+            backends = [backend] + (["pymupdf"] if backend == "pypdf" and PYMUPDF_AVAILABLE else [])
+            for attempt in backends:
+                try:
+                    return await loop.run_in_executor(pool, extract_page_range, path, attempt, start, end)
+                except Exception as e:
+                    print(f"⚠️  {attempt} failed on pages {start + 1}-{end} of {name}: {e}")
+            return []
+
+        results = await asyncio.gather(*(run(start, end) for start, end in ranges))
+        extracted = [page for result in results for page in result if page[0] not in texts]
+        await asyncio.to_thread(cache.put, file_hash, extracted)
+        texts.update(extracted)
+
+    print(f"📄 Extracted {page_count} pages from {name} with {backend} "
+          f"({page_count - len(missing)} from cache)")
+    return [
+        Document(page_content=texts[page], metadata={"source": path, "page": page, "total_pages": page_count})
+        for page in sorted(texts)
+        if page < page_count and texts[page].strip()
+    ]
@@ -1,18 +1,177 @@
+"""
+Upload Storage
+
+Streams uploaded PDFs to disk in fixed-size chunks with non-blocking file
+I/O, hashing them on the way so memory per upload stays constant and the
+content hash used for deduplication and the ingest manifest costs no extra
+pass. Per-file and per-request size limits are enforced while streaming,
+and page counts are checked before any parsing starts.
+
+Files are stored content-addressed per user, so two uploads with the same
+name no longer overwrite each other and identical content is written once.
+"""
+
 import os
-import shutil
+import re
+import uuid
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import anyio
 from fastapi import UploadFile
-import tempfile
-
-UPLOAD_DIR="./uploaded_docs"
-
-def save_uploaded_files(files:list[UploadFile])-> list[str]:
-    os.makedirs(UPLOAD_DIR,exist_ok=True)
-    file_paths = []
-    for file in files:
-        if file.filename is None:
-            continue  # skip files with no filename
-        temp_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(temp_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        file_paths.append(temp_path)
-    return file_paths
\ No newline at end of file
+
+from modules.ingest_manifest import user_storage_key
+
+UPLOAD_DIR = "./uploaded_docs"
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_FILE_MB = int(os.getenv("MAX_UPLOAD_FILE_MB", "50"))
+MAX_UPLOAD_REQUEST_MB = int(os.getenv("MAX_UPLOAD_REQUEST_MB", "200"))
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", "500"))
+MAX_REQUEST_PAGES = int(os.getenv("MAX_REQUEST_PAGES", "2000"))
+
+
+class UploadLimitError(ValueError):
+    """An upload exceeded a size or page-count limit"""
+
+
+@dataclass
+class SavedUpload:
+    filename: str  # name as uploaded, used for display and metadata
+    path: str
+    sha256: str
+    size: int
+    pages: Optional[int] = None  # None when the page count could not be read up front
+
+
+def _safe_filename(filename: Optional[str]) -> str:
+    name = Path(filename or "upload.pdf").name
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name) or "upload.pdf"
+
+
+def user_upload_dir(user_id: str) -> Path:
+    return Path(UPLOAD_DIR) / user_storage_key(user_id)
+
+
+def stored_upload_path(dest_dir: Path, file_hash: str, filename: str) -> Path:
+    return dest_dir / f"{file_hash[:16]}_{_safe_filename(filename)}"
+
+
+def find_stored_upload(user_id: str, file_hash: str, size: int) -> Optional[Path]:
+    """A file of this user's with the given content already on disk, under any name"""
+    dest_dir = user_upload_dir(user_id)
+    if not dest_dir.is_dir():
+        return None
+    for path in dest_dir.glob(f"{file_hash[:16]}_*"):
+        if path.is_file() and path.stat().st_size == size:
+            return path
+    return None
+
+
+def check_pdf_pages(upload: SavedUpload, total_pages: int) -> int:
+    """Count an upload's pages and enforce the page limits; returns the new running total"""
+    upload.pages = count_pdf_pages(upload.path)
+    if upload.pages is None:
+        return total_pages
+    if upload.pages > MAX_PDF_PAGES:
+        raise UploadLimitError(f"{upload.filename} has {upload.pages} pages; the limit is {MAX_PDF_PAGES}")
+    total_pages += upload.pages
+    if total_pages > MAX_REQUEST_PAGES:
+        raise UploadLimitError(f"Upload exceeds the limit of {MAX_REQUEST_PAGES} pages per request")
+    return total_pages
+
+
+def count_pdf_pages(path: str) -> Optional[int]:
+    """Page count from the PDF's page tree without extracting any text"""
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(path, strict=False).pages)
+    except Exception:
+        # Leave unreadable files to the parser, which has its own fallbacks
+        return None
+
+
+async def stream_upload(file: UploadFile, dest_dir: Path, max_bytes: int) -> Tuple[SavedUpload, bool]:
+    """
+    Copy one upload to `dest_dir` chunk by chunk, hashing as it goes. Returns
+    the saved upload and whether a new file was written. Raises
+    UploadLimitError as soon as more than `max_bytes` have been read.
+    """
+    filename = _safe_filename(file.filename)
+    tmp_path = dest_dir / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadLimitError(f"{filename} is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    file_hash = digest.hexdigest()
+    final_path = stored_upload_path(dest_dir, file_hash, filename)
+    created = not final_path.exists()
+    if created:
+        os.replace(tmp_path, final_path)
+    else:
+        # Same content already on disk: keep the existing copy
+        tmp_path.unlink(missing_ok=True)
+    return SavedUpload(filename=filename, path=str(final_path), sha256=file_hash, size=size), created
+
+
+async def save_uploaded_files(files: List[UploadFile], user_id: str) -> List[SavedUpload]:
+    """
+    Stream a request's uploads to the user's upload directory and enforce
+    the size and page limits. Identical files within the request are kept
+    once. Nothing is parsed until every file has passed the limits; on a
+    limit violation the files written by this request are removed.
+    """
+    dest_dir = user_upload_dir(user_id)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    file_limit = MAX_UPLOAD_FILE_MB * 1024 * 1024
+    request_limit = MAX_UPLOAD_REQUEST_MB * 1024 * 1024
+
+    saved: List[SavedUpload] = []
+    created: List[str] = []
+    seen = set()
+    total_bytes = 0
+    total_pages = 0
+    try:
+        for file in files:
+            remaining = request_limit - total_bytes
+            try:
+                upload, is_new = await stream_upload(file, dest_dir, min(file_limit, remaining))
+            except UploadLimitError:
+                if remaining < file_limit:
+                    raise UploadLimitError(f"Upload exceeds the limit of {MAX_UPLOAD_REQUEST_MB} MB per request")
+                raise UploadLimitError(
+                    f"{_safe_filename(file.filename)} exceeds the limit of {MAX_UPLOAD_FILE_MB} MB per file"
+                )
+            if upload.sha256 in seen:
+                # Same content under another name earlier in this request
+                if is_new:
+                    Path(upload.path).unlink(missing_ok=True)
+                continue
+            if is_new:
+                created.append(upload.path)
+            seen.add(upload.sha256)
+            total_bytes += upload.size
+
+            total_pages = await asyncio.to_thread(check_pdf_pages, upload, total_pages)
+            saved.append(upload)
+    except UploadLimitError:
+        for path in created:
+            Path(path).unlink(missing_ok=True)
+        raise
+    return saved
@@ -0,0 +1,142 @@
+"""
+Vector Quantization
+
+Compact encodings of row-normalized embedding matrices for the local
+vector store: float32 (exact), int8 (per-row scale, 4x smaller) and binary
+(sign bits, 32x smaller). `QuantizedMatrix` scores a query directly
+against the encoded rows without materializing float32 copies.
+"""
+
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+
+QUANTIZATION_MODES = ("float32", "int8", "binary")
+
+# Number of set bits for every byte value, for Hamming distances on packed bits
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize_rows(values) -> np.ndarray:
+    """float32 copy of `values` with unit-length rows (or a unit-length vector)"""
+    matrix = np.asarray(values, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def truncate_dimensions(values, dimensions: Optional[int]) -> np.ndarray:
+    """
+    Shorten text-embedding-3 vectors to `dimensions` and renormalize, which is
+    equivalent to requesting `dimensions` from the API
+    """
+    matrix = np.asarray(values, dtype=np.float32)
+    if dimensions and dimensions < matrix.shape[-1]:
+        matrix = matrix[..., :dimensions]
+    return normalize_rows(matrix)
+
+
+class QuantizedMatrix:
+    """A matrix of normalized vectors in one of QUANTIZATION_MODES"""
+
+    def __init__(self, mode: str, data: np.ndarray, scale: Optional[np.ndarray], dim: int):
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+        self.mode = mode
+        self.data = data
+        self.scale = scale
+        self.dim = dim
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    @classmethod
+    def empty(cls, mode: str, dim: int) -> "QuantizedMatrix":
+        return cls.from_float(np.zeros((0, dim), dtype=np.float32), mode)
+
+    @classmethod
+    def from_float(cls, values, mode: str) -> "QuantizedMatrix":
+        """Encode already-normalized float vectors"""
+        matrix = np.atleast_2d(np.asarray(values, dtype=np.float32))
+        dim = matrix.shape[1]
+        if mode == "float32":
+            return cls(mode, np.ascontiguousarray(matrix), None, dim)
+        if mode == "int8":
+            scale = np.abs(matrix).max(axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            data = np.round(matrix / scale[:, None]).astype(np.int8)
+            return cls(mode, data, scale.astype(np.float32), dim)
+        if mode == "binary":
+            return cls(mode, np.packbits(matrix > 0, axis=1), None, dim)
+        raise ValueError(f"Unknown quantization mode: {mode}")
+
+    def to_float(self, rows=None) -> np.ndarray:
+        """Approximate float32 reconstruction of (some of) the rows"""
+        data = self.data if rows is None else self.data[rows]
+        if self.mode == "float32":
+            return np.asarray(data, dtype=np.float32)
+        if self.mode == "int8":
+            scale = self.scale if rows is None else self.scale[rows]
+            return data.astype(np.float32) * np.asarray(scale)[..., None]
+        signs = np.unpackbits(data, axis=-1, count=self.dim).astype(np.float32) * 2 - 1
+        return signs / np.sqrt(self.dim)
+
+    def scores(self, query: Sequence[float]) -> np.ndarray:
+        """Similarity of a normalized query to every row (cosine, or its Hamming estimate for binary)"""
+        query = np.asarray(query, dtype=np.float32)
+        if self.mode == "float32":
+            return self.data @ query
+        if self.mode == "int8":
+            return (self.data.astype(np.float32) @ query) * self.scale
+        query_bits = np.packbits(query > 0)
+        hamming = _POPCOUNT[np.bitwise_xor(self.data, query_bits)].sum(axis=1, dtype=np.int32)
+        return 1.0 - 2.0 * hamming.astype(np.float32) / self.dim
+
+    def take(self, rows) -> "QuantizedMatrix":
+        return QuantizedMatrix(
+            self.mode, np.asarray(self.data)[rows], None if self.scale is None else np.asarray(self.scale)[rows], self.dim
+        )
+
+    def appended(self, *others: "QuantizedMatrix") -> "QuantizedMatrix":
+        data = np.concatenate([np.asarray(self.data)] + [other.data for other in others])
+        scale = None if self.scale is None else np.concatenate(
+            [np.asarray(self.scale)] + [other.scale for other in others]
+        )
+        return QuantizedMatrix(self.mode, data, scale, self.dim)
+
+    def with_rows(self, rows, other: "QuantizedMatrix") -> "QuantizedMatrix":
+        """Copy with `rows` overwritten by the rows of `other`"""
+        data = np.array(self.data)
+        data[rows] = other.data
+        scale = None
+        if self.scale is not None:
+            scale = np.array(self.scale)
+            scale[rows] = other.scale
+        return QuantizedMatrix(self.mode, data, scale, self.dim)
+
+    def save(self, prefix: str):
+        """Write `{prefix}.npy` (and `{prefix}_scale.npy` for int8) atomically"""
+        arrays = {f"{prefix}.npy": self.data}
+        if self.scale is not None:
+            arrays[f"{prefix}_scale.npy"] = self.scale
+        for path, array in arrays.items():
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+        for path in arrays:
+            os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, prefix: str, mode: str, dim: Optional[int] = None) -> Optional["QuantizedMatrix"]:
+        """Memory-map a matrix written by save(), or None if it does not exist"""
+        if not os.path.exists(f"{prefix}.npy"):
+            return None
+        data = np.load(f"{prefix}.npy", mmap_mode="r")
+        scale = np.load(f"{prefix}_scale.npy", mmap_mode="r") if mode == "int8" else None
+        if dim is None:
+            dim = data.shape[1] * (8 if mode == "binary" else 1)
+        return cls(mode, data, scale, dim)
@@ -0,0 +1,123 @@
+"""
+Hybrid Retrieval
+
+Retrieves a user's most relevant chunks by combining local BM25 lexical
+search with dense vector search, fused by reciprocal rank fusion. When the
+lexical results are decisive for an exact-term query the vector store round
+trip is skipped and the question is not embedded here; agent routing still
+embeds it unless its keyword rules decide first. A follow-up question close
+to a recent one re-ranks that question's cached dense candidates instead of
+querying the vector store.
+
+Specialists can restrict both searches to the chunks tagged with their
+specialty at ingest time, so their context is drawn from the documents
+relevant to them rather than from the question's overall top matches.
+
+Only chunks of the user's published document set are returned. While a new
+version is being ingested its chunks are already in the stores, so both
+searches over-fetch and drop them. Users with no published set yet (vectors
+from before manifests, or from the legacy namespace) are served everything
+stored except the chunks an ingest is staging or has abandoned.
+"""
+
+import os
+from typing import List, Dict, Any, Optional, Tuple
+
+from logger import logger
+from modules.lexical_index import get_lexical_index, is_decisive, reciprocal_rank_fusion
+from modules.chunk_store import hydrate_matches
+from modules.embedding_cache import CachedEmbeddings
+from modules.load_vectorstore import query_user_documents
+from modules.ingest_manifest import published_set, unpublished_chunk_ids, is_staging
+from modules.retrieval_cache import get_retrieval_cache, RETRIEVAL_CACHE_OVERFETCH
+
+STAGING_OVERFETCH = int(os.getenv("STAGING_OVERFETCH", "3"))
+
+
+def _published_only(matches: List[Dict[str, Any]], published, hidden, top_k: int) -> List[Dict[str, Any]]:
+    """Matches in the published set, or, with no published set, those not hidden"""
+    if published is None:
+        return [match for match in matches if match["id"] not in hidden][:top_k]
+    return [match for match in matches if match["id"] in published][:top_k]
+
+
+def _fill_missing_values(matches: List[Dict[str, Any]], embed_model):
+    """
+    Attach vectors to lexical-only matches from the embedding cache, where
+    they were stored at ingest time, so MMR can compare every candidate
+    """
+    missing = [match for match in matches if not match.get("values") and match["metadata"].get("text")]
+    if not missing or not isinstance(embed_model, CachedEmbeddings):
+        return
+    vectors = embed_model.cache.get_many(
+        embed_model.model, embed_model.dimensions, [match["metadata"]["text"] for match in missing]
+    )
+    for match, vector in zip(missing, vectors):
+        if vector is not None:
+            match["values"] = vector
+
+
+def _dense_matches(embedded_query: List[float], user_id: str, version: Optional[str], published, hidden,
+                   top_k: int, specialties: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Dense candidates from the retrieval cache when a similar question was asked, else the vector store"""
+    cache = get_retrieval_cache()
+    cached = cache.lookup(user_id, version, embedded_query, top_k, specialties)
+    if cached is not None:
+        logger.info(f"Reusing cached dense candidates for user {user_id} (document set {version})")
+        return cached
+
+    cache_k = top_k * RETRIEVAL_CACHE_OVERFETCH
+    fetch_k = cache_k * STAGING_OVERFETCH if is_staging(user_id) or hidden else cache_k
+    candidates = _published_only(
+        query_user_documents(embedded_query, user_id, top_k=fetch_k, include_values=True, specialties=specialties,
+                             exclude_ids=hidden if published is None else None),
+        published, hidden, cache_k
+    )
+    cache.store(user_id, version, embedded_query, candidates, cache_k, specialties)
+    return candidates[:top_k]
+
+
+def retrieve_user_documents(question: str, user_id: str, embed_model, top_k: int = 10,
+                            specialties: Optional[List[str]] = None,
+                            query_embedding: Optional[List[float]] = None
+                            ) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Hybrid lexical + dense retrieval for one user's documents
+
+    Args:
+        question: The user's question
+        user_id: User whose documents are searched
+        embed_model: Embeddings model used for the dense query
+        top_k: Number of fused candidate matches to return
+        specialties: Only search chunks tagged with one of these specialty labels
+        query_embedding: The question's embedding if already computed
+
+    Returns:
+        (matches, query_embedding). Matches are dicts with `id`, `score`,
+        `metadata` (hydrated with chunk text from the local chunk store) and
+        `values` where known; query_embedding is None when the lexical index
+        answered on its own, so callers that need it must embed the question.
+    """
+    version, published = published_set(user_id)
+    hidden = unpublished_chunk_ids(user_id) if published is None else frozenset()
+    fetch_k = top_k * STAGING_OVERFETCH if is_staging(user_id) or hidden else top_k
+
+    lexical_matches = _published_only(
+        get_lexical_index().search(user_id, question, top_k=fetch_k, specialties=specialties),
+        published, hidden, top_k
+    )
+    if is_decisive(lexical_matches):
+        logger.info(f"Lexical match is decisive for user {user_id}; skipping dense retrieval")
+        return hydrate_matches(lexical_matches), query_embedding
+
+    embedded_query = query_embedding if query_embedding is not None else embed_model.embed_query(question)
+    dense_matches = _dense_matches(embedded_query, user_id, version, published, hidden, top_k, specialties)
+    logger.info(
+        f"Hybrid retrieval for user {user_id}: {len(dense_matches)} dense, {len(lexical_matches)} lexical matches"
+    )
+    if not lexical_matches:
+        return hydrate_matches(dense_matches), embedded_query
+
+    matches = hydrate_matches(reciprocal_rank_fusion([dense_matches, lexical_matches])[:top_k])
+    _fill_missing_values(matches, embed_model)
+    return matches, embedded_query
@@ -0,0 +1,141 @@
+"""
+Retrieval Cache
+
+Remembers, per user, the dense candidates retrieved for recent questions,
+keyed by the version of the user's published document set, the specialty
+filter the candidates were retrieved with, and the query embedding. A follow-up question whose embedding is close enough to a cached
+one re-ranks that cached candidate set locally instead of querying the
+vector store again. Entries from another document set version never match,
+and publishing or clearing a user's documents drops their entries at once.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+RETRIEVAL_CACHE_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_ENTRIES", "16"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "1800"))
+# Minimum cosine similarity between query embeddings for a cached candidate set to be reused
+SEMANTIC_REUSE_THRESHOLD = float(os.getenv("SEMANTIC_REUSE_THRESHOLD", "0.92"))
+# Cached candidate sets are this many times top_k so a follow-up has room to re-rank
+RETRIEVAL_CACHE_OVERFETCH = int(os.getenv("RETRIEVAL_CACHE_OVERFETCH", "2"))
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    return array / max(float(np.linalg.norm(array)), 1e-12)
+
+
+def _scope(specialties: Optional[Sequence[str]]) -> Tuple[str, ...]:
+    return tuple(sorted(set(specialties or ())))
+
+
+@dataclass
+class _Entry:
+    version: Optional[str]
+    scope: Tuple[str, ...]  # specialty filter, empty when unfiltered
+    query: np.ndarray  # unit-normalized query embedding
+    matches: List[Dict[str, Any]]  # candidates with vectors, best first
+    candidates: np.ndarray  # unit-normalized candidate vectors, one row per match
+    fetched_k: int
+    created: float
+
+
+class RetrievalCache:
+    """In-memory per-user LRU of dense candidate sets"""
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_ENTRIES, ttl: float = RETRIEVAL_CACHE_TTL,
+                 threshold: float = SEMANTIC_REUSE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._users: Dict[str, "OrderedDict[int, _Entry]"] = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, user_id: str, version: Optional[str], query_vector: Sequence[float],
+               top_k: int, specialties: Optional[Sequence[str]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Top `top_k` cached candidates re-ranked for `query_vector`, or None
+        when no fresh entry for this document set version and specialty
+        filter is similar enough
+        """
+        query = _unit(query_vector)
+        scope = _scope(specialties)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._users.get(user_id)
+            best_key, best_similarity = None, self.threshold
+            for key, entry in list((entries or {}).items()):
+                if entry.version != version or now - entry.created > self.ttl:
+                    del entries[key]
+                    continue
+                if entry.scope != scope or entry.fetched_k < top_k or entry.query.shape != query.shape:
+                    continue
+                similarity = float(entry.query @ query)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_key)
+            entry = entries[best_key]
+            self.hits += 1
+
+        scores = entry.candidates @ query
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [{**entry.matches[i], "score": float(scores[i])} for i in order]
+
+    def store(self, user_id: str, version: Optional[str], query_vector: Sequence[float],
+              matches: List[Dict[str, Any]], fetched_k: int, specialties: Optional[Sequence[str]] = None):
+        """Remember the candidates retrieved for a query; matches without vectors are not cacheable"""
+        if not matches or any(not match.get("values") for match in matches):
+            return
+        candidates = np.asarray([match["values"] for match in matches], dtype=np.float32).reshape(len(matches), -1)
+        candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+        entry = _Entry(
+            version, _scope(specialties), _unit(query_vector), [dict(match) for match in matches], candidates,
+            fetched_k, time.monotonic()
+        )
+        with self._lock:
+            entries = self._users.setdefault(user_id, OrderedDict())
+            entries[self._next_key] = entry
+            self._next_key += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        """Forget every cached candidate set for a user"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._users),
+                "entries": sum(len(entries) for entries in self._users.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    """Process-wide retrieval cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RetrievalCache()
+        return _cache
@@ -0,0 +1,113 @@
+"""
+Specialty Vocabulary
+
+A cheap, local classifier that maps text to the specialties of the agent
+registry. Each specialist agent contributes a specialty label (its first
+tag), and its terms are:
+- its tags
+- the `cross_specialty_keywords` that list the label
+- the lab analytes its description or tags mention
+
+Text is matched against all terms with one compiled regex, so classifying
+a chunk costs a single scan and no model calls.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional
+
+from modules.embedding_profile import AGENT_REGISTRY_PATH
+from modules.lab_store import ANALYTES
+
+# Tags that mark an agent as a generalist rather than a specialty
+GENERALIST_TAGS = {"general", "fallback"}
+
+
+@dataclass(frozen=True)
+class Specialty:
+    label: str
+    agent_name: str
+    terms: Tuple[str, ...]
+    analytes: Tuple[str, ...]
+
+
+def _word_re(term: str) -> "re.Pattern":
+    return re.compile(r"(?<![A-Za-z0-9])" + re.escape(term) + r"(?![A-Za-z0-9])", re.IGNORECASE)
+
+
+def _mentioned_analytes(description: str, tags: List[str]) -> Tuple[str, ...]:
+    """Catalog analytes named in an agent's description, or whose aliases contain one of its tags"""
+    tag_res = [_word_re(tag) for tag in tags if len(tag) >= 3]
+    found = []
+    for analyte in ANALYTES.values():
+        aliases = [alias for alias in analyte.aliases if len(alias) >= 3]
+        if any(_word_re(alias).search(description) for alias in aliases) or \
+                any(tag_re.search(alias) for tag_re in tag_res for alias in aliases):
+            found.append(analyte.name)
+    return tuple(found)
+
+
+@lru_cache(maxsize=1)
+def get_specialties() -> Tuple[Specialty, ...]:
+    """Specialties of the enabled specialist agents in the registry"""
+    from modules.central_orchestrator.agent_loader import AgentLoader
+
+    loader = AgentLoader(AGENT_REGISTRY_PATH)
+    summary_agent = loader.get_summary_agent_name()
+    keywords = loader.get_cross_specialty_keywords()
+
+    specialties = []
+    for name, config in loader.get_enabled_agents().items():
+        tags = [tag.lower() for tag in config.get("tags", [])]
+        if name == summary_agent or config.get("is_summary_agent") or not tags or GENERALIST_TAGS & set(tags):
+            continue
+        label = tags[0]
+        analytes = _mentioned_analytes(config.get("description", ""), tags)
+        terms = list(tags)
+        terms += [keyword.lower() for keyword, labels in keywords.items() if label in labels]
+        terms += [alias for analyte in analytes for alias in ANALYTES[analyte].aliases if len(alias) >= 3]
+        specialties.append(Specialty(label, name, tuple(dict.fromkeys(terms)), analytes))
+    return tuple(specialties)
+
+
+@lru_cache(maxsize=1)
+def _term_index() -> Tuple[Optional["re.Pattern"], Dict[str, Tuple[str, ...]]]:
+    """One alternation over every term (longest first) and the labels each term belongs to"""
+    labels_by_term: Dict[str, List[str]] = {}
+    for specialty in get_specialties():
+        for term in specialty.terms:
+            labels_by_term.setdefault(term, []).append(specialty.label)
+    if not labels_by_term:
+        return None, {}
+    terms = sorted(labels_by_term, key=len, reverse=True)
+    pattern = re.compile(
+        r"(?<![A-Za-z0-9])(" + "|".join(re.escape(term) for term in terms) + r")(?![A-Za-z0-9])", re.IGNORECASE
+    )
+    return pattern, {term: tuple(labels) for term, labels in labels_by_term.items()}
+
+
+def classify_text(text: str) -> Dict[str, int]:
+    """Number of specialty term mentions in `text`, per specialty label"""
+    pattern, labels_by_term = _term_index()
+    hits: Dict[str, int] = {}
+    if pattern is None:
+        return hits
+    for match in pattern.finditer(text):
+        for label in labels_by_term.get(match.group(1).lower(), ()):
+            hits[label] = hits.get(label, 0) + 1
+    return hits
+
+
+def analyte_specialties() -> Dict[str, Tuple[str, ...]]:
+    """Specialty labels interested in each lab analyte"""
+    mapping: Dict[str, List[str]] = {}
+    for specialty in get_specialties():
+        for analyte in specialty.analytes:
+            mapping.setdefault(analyte, []).append(specialty.label)
+    return {analyte: tuple(labels) for analyte, labels in mapping.items()}
+
+
+def specialty_for_agent(agent_name: str) -> Optional[str]:
+    """Specialty label of a registry agent, or None for generalist and summary agents"""
+    return next((s.label for s in get_specialties() if s.agent_name == agent_name), None)
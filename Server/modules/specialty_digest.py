@@ -0,0 +1,269 @@
+"""
+Specialty Digests
+
+A compact, per-specialty summary of each user's documents, built at ingest
+time so specialists do not re-derive the same findings from raw chunks on
+every question. Each digest holds two parts:
+- the lab trend rows for the analytes the specialty cares about
+- short extractive findings (impressions, diagnoses, abnormal or measured
+  values) from lines that mention the specialty's terms
+
+No model is involved, so building a digest is cheap and deterministic.
+
+Findings are extracted once per file while the file's pages are in memory
+and stored as per-file parts. After a new document set version is
+published, only the specialties touched by added or removed files are
+reassembled from the parts of the published files.
+"""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, Set
+
+from modules.context_assembler import truncate_to_tokens, count_tokens
+from modules.ingest_manifest import published_file_hashes
+from modules.lab_store import get_lab_store, compute_lab_trends, format_lab_table, parse_lab_line, LabResult
+from modules.specialties import get_specialties, classify_text, analyte_specialties
+
+DIGEST_STORE_PATH = os.getenv("DIGEST_STORE_PATH", "./cache/digests.sqlite3")
+DIGEST_TOKEN_BUDGET = int(os.getenv("DIGEST_TOKEN_BUDGET", "500"))
+DIGEST_FINDINGS_PER_FILE = int(os.getenv("DIGEST_FINDINGS_PER_FILE", "12"))
+DIGEST_MODEL = "gpt-4"
+
+_FINDING_CUE_RE = re.compile(
+    r"impression|assessment|diagnos|history of|consistent with|abnormal|elevated|increased|decreased|reduced|"
+    r"positive|negative for|mild|moderate|severe|recommend|\d",
+    re.IGNORECASE
+)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def extract_findings(documents) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Findings per specialty label from a file's pages: the lines (or sentences
+    of long lines) that mention a specialty term and carry a clinical cue.
+    Lab table rows are left to the lab section.
+    """
+    candidates: Dict[str, List[tuple]] = {}
+    for document in documents:
+        page = document.metadata.get("page")
+        for line in document.page_content.splitlines():
+            line = line.strip()
+            for sentence in (_SENTENCE_RE.split(line) if len(line) > 300 else [line]):
+                if not 20 <= len(sentence) <= 300 or not _FINDING_CUE_RE.search(sentence):
+                    continue
+                hits = classify_text(sentence)
+                if not hits or parse_lab_line(sentence) is not None:
+                    continue
+                for label, count in hits.items():
+                    candidates.setdefault(label, []).append((count, sentence, page))
+
+    findings = {}
+    for label, items in candidates.items():
+        # Strongest mentions first, then back into document order
+        unique = list({sentence: (count, sentence, page) for count, sentence, page in items}.values())
+        best = sorted(range(len(unique)), key=lambda i: -unique[i][0])[:DIGEST_FINDINGS_PER_FILE]
+        findings[label] = [{"text": unique[i][1], "page": unique[i][2]} for i in sorted(best)]
+    return findings
+
+
+class DigestStore:
+    """Per-file digest parts and assembled per-specialty digests in SQLite"""
+
+    def __init__(self, path: str = DIGEST_STORE_PATH):
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """CREATE TABLE IF NOT EXISTS digest_parts (
+                user_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                specialty TEXT NOT NULL,
+                filename TEXT,
+                findings TEXT NOT NULL,
+                PRIMARY KEY (user_id, file_hash, specialty)
+            );
+            CREATE TABLE IF NOT EXISTS digest_files (
+                user_id TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                PRIMARY KEY (user_id, file_hash)
+            );
+            CREATE TABLE IF NOT EXISTS digests (
+                user_id TEXT NOT NULL,
+                specialty TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, specialty)
+            );
+            CREATE TABLE IF NOT EXISTS digest_state (
+                user_id TEXT PRIMARY KEY,
+                files TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );"""
+        )
+        self._conn.commit()
+
+    def has_parts(self, user_id: str, file_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM digest_files WHERE user_id = ? AND file_hash = ?", (user_id, file_hash)
+            ).fetchone()
+        return row is not None
+
+    def replace_parts(self, user_id: str, file_hash: str, filename: str, parts: Dict[str, List[Dict[str, Any]]]):
+        """Store one file's findings per specialty (an empty list marks a specialty touched only by labs)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM digest_parts WHERE user_id = ? AND file_hash = ?", (user_id, file_hash))
+            self._conn.executemany(
+                "INSERT INTO digest_parts VALUES (?, ?, ?, ?, ?)",
+                [(user_id, file_hash, label, filename, json.dumps(findings)) for label, findings in parts.items()]
+            )
+            self._conn.execute("INSERT OR IGNORE INTO digest_files VALUES (?, ?)", (user_id, file_hash))
+            self._conn.commit()
+
+    def file_specialties(self, user_id: str, file_hashes: Iterable[str]) -> Set[str]:
+        """Specialties the given files contribute to"""
+        wanted = set(file_hashes)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_hash, specialty FROM digest_parts WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return {specialty for file_hash, specialty in rows if file_hash in wanted}
+
+    def parts(self, user_id: str, specialty: str, file_hashes: Iterable[str]) -> List[Dict[str, Any]]:
+        """One specialty's findings from the given files, by filename"""
+        keep = set(file_hashes)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_hash, filename, findings FROM digest_parts WHERE user_id = ? AND specialty = ? "
+                "ORDER BY filename",
+                (user_id, specialty)
+            ).fetchall()
+        return [
+            {"filename": filename, "findings": json.loads(findings)}
+            for file_hash, filename, findings in rows if file_hash in keep
+        ]
+
+    def digested_files(self, user_id: str) -> Set[str]:
+        """File hashes the user's current digests were assembled from"""
+        with self._lock:
+            row = self._conn.execute("SELECT files FROM digest_state WHERE user_id = ?", (user_id,)).fetchone()
+        return set(json.loads(row[0])) if row else set()
+
+    def save_digests(self, user_id: str, digests: Dict[str, str], files: Iterable[str]):
+        """Replace the given specialties' digests (empty text deletes one) and record the files they cover"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            for specialty, content in digests.items():
+                if content:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                        (user_id, specialty, content, count_tokens(content, DIGEST_MODEL), now)
+                    )
+                else:
+                    self._conn.execute("DELETE FROM digests WHERE user_id = ? AND specialty = ?", (user_id, specialty))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO digest_state VALUES (?, ?, ?)", (user_id, json.dumps(sorted(files)), now)
+            )
+            self._conn.commit()
+
+    def digests(self, user_id: str) -> Dict[str, str]:
+        """A user's assembled digests by specialty label"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT specialty, content FROM digests WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def retain_files(self, user_id: str, file_hashes: Iterable[str]):
+        """Drop the parts of files no longer in the user's document set"""
+        keep = set(file_hashes)
+        with self._lock:
+            stored = [row[0] for row in self._conn.execute(
+                "SELECT file_hash FROM digest_files WHERE user_id = ?", (user_id,)
+            )]
+            stale = [(user_id, file_hash) for file_hash in stored if file_hash not in keep]
+            self._conn.executemany("DELETE FROM digest_parts WHERE user_id = ? AND file_hash = ?", stale)
+            self._conn.executemany("DELETE FROM digest_files WHERE user_id = ? AND file_hash = ?", stale)
+            self._conn.commit()
+
+    def delete_user(self, user_id: str):
+        with self._lock:
+            for table in ("digest_parts", "digest_files", "digests", "digest_state"):
+                self._conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+
+def file_digest_parts(documents, lab_results: Iterable[LabResult]) -> Dict[str, List[Dict[str, Any]]]:
+    """A file's findings per specialty, including specialties it only touches through lab results"""
+    parts = extract_findings(documents)
+    interested = analyte_specialties()
+    for result in lab_results:
+        for label in interested.get(result.analyte, ()):
+            parts.setdefault(label, [])
+    return parts
+
+
+def build_digest(label: str, trends: List[Dict[str, Any]], parts: List[Dict[str, Any]]) -> str:
+    """One specialty's digest from the user's lab trends and its findings in each file"""
+    specialty = next((s for s in get_specialties() if s.label == label), None)
+    analytes = set(specialty.analytes) if specialty else set()
+    sections = []
+    lab_rows = format_lab_table([t for t in trends if t["analyte"] in analytes])
+    if lab_rows:
+        sections.append(f"Lab results:\n{lab_rows}")
+    findings = [
+        f"- [{part['filename']}" + (f" p.{finding['page'] + 1}" if finding.get("page") is not None else "")
+        + f"] {finding['text']}"
+        for part in parts for finding in part["findings"]
+    ]
+    if findings:
+        sections.append("Findings from documents:\n" + "\n".join(findings))
+    return truncate_to_tokens("\n\n".join(sections), DIGEST_TOKEN_BUDGET, DIGEST_MODEL)
+
+
+def refresh_digests(user_id: str) -> Dict[str, Any]:
+    """
+    Bring a user's digests in line with their published document set,
+    reassembling only the specialties touched by added or removed files
+    """
+    store = get_digest_store()
+    published = published_file_hashes(user_id)
+    digested = store.digested_files(user_id)
+    changed = (published - digested) | (digested - published)
+    if not changed:
+        return {"specialties": [], "files_changed": 0}
+
+    touched = sorted(store.file_specialties(user_id, changed))
+    trends = compute_lab_trends(get_lab_store().columns(user_id, published)) if touched else []
+    digests = {label: build_digest(label, trends, store.parts(user_id, label, published)) for label in touched}
+    store.save_digests(user_id, digests, published)
+    store.retain_files(user_id, published)
+    if touched:
+        print(f"📋 Rebuilt {len(touched)} specialty digests for user {user_id}: {', '.join(touched)}")
+    return {"specialties": touched, "files_changed": len(changed)}
+
+
+def specialty_digests(user_id: str) -> Dict[str, str]:
+    """The user's current digests by specialty label"""
+    return get_digest_store().digests(user_id)
+
+
+_digest_store: Optional[DigestStore] = None
+_digest_store_lock = threading.Lock()
+
+
+def get_digest_store() -> DigestStore:
+    """Process-wide digest store instance"""
+    global _digest_store
+    with _digest_store_lock:
+        if _digest_store is None:
+            _digest_store = DigestStore()
+        return _digest_store
@@ -0,0 +1,232 @@
+"""
+Layout-Aware Splitter
+
+Splits extracted PDF pages into chunks measured in real tokens (the
+embedding models' cl100k tokenizer, or a length estimate when it cannot be
+loaded, see context_assembler) rather than characters. Chunks never
+cross a page and break only at line boundaries. Section headings start a
+new chunk when the current one is already reasonably full, and table rows
+are kept whole. A lab table that spills into a second chunk carries its
+section heading along, so each chunk still says what its rows are.
+
+Chunk metadata locates each chunk on its page for merging at answer time:
+`start_index` is where its page text starts (after any carried heading,
+whose length is `heading_chars`), and `previous_end` is where the page's
+previous chunk ended; only blank lines lie between the two.
+
+Each page is tokenized in a single batched tokenizer call and then packed
+greedily, which keeps chunking to thousands of pages per second. Settings
+are chosen per document type; lab reports get larger chunks with no
+overlap because table rows are self-contained.
+"""
+
+import os
+import re
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Tuple
+
+from langchain_core.documents import Document
+
+from modules.context_assembler import count_tokens_batch
+
+TOKENIZER_MODEL = "text-embedding-3-large"
+
+
+@dataclass(frozen=True)
+class SplitterConfig:
+    max_tokens: int  # hard chunk size limit
+    overlap_tokens: int  # prose carried over from the previous chunk
+    min_tokens: int  # below this a heading does not force a new chunk
+
+
+SPLITTER_CONFIGS: Dict[str, SplitterConfig] = {
+    "lab_report": SplitterConfig(
+        max_tokens=int(os.getenv("LAB_REPORT_CHUNK_TOKENS", "400")), overlap_tokens=0, min_tokens=120
+    ),
+    "clinical_note": SplitterConfig(
+        max_tokens=int(os.getenv("CLINICAL_NOTE_CHUNK_TOKENS", "350")), overlap_tokens=40, min_tokens=100
+    ),
+}
+
+# Share of short numeric lines above which a document is treated as a lab report
+LAB_REPORT_ROW_SHARE = 0.35
+
+_TABLE_ROW_RE = re.compile(r"^\s*[A-Za-z(][^.!?]{0,80}?\d")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class SplitStats:
+    doc_type: str
+    pages: int
+    chunks: int
+    tokens: int
+    mean_chunk_tokens: float
+    max_chunk_tokens: int
+    table_rows: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _is_table_row(line: str) -> bool:
+    return len(line) <= 120 and bool(_TABLE_ROW_RE.match(line))
+
+
+def _is_heading(line: str) -> bool:
+    stripped = line.strip()
+    if not stripped or len(stripped) > 60 or sum(c.isdigit() for c in stripped) > 2:
+        return False
+    return stripped.endswith(":") or (stripped.isupper() and any(c.isalpha() for c in stripped))
+
+
+def classify_document(pages: List[Document]) -> str:
+    """'lab_report' when a large share of non-empty lines look like table rows, else 'clinical_note'"""
+    lines = [line for page in pages for line in page.page_content.splitlines() if line.strip()]
+    if not lines:
+        return "clinical_note"
+    rows = sum(1 for line in lines if _is_table_row(line))
+    return "lab_report" if rows / len(lines) >= LAB_REPORT_ROW_SHARE else "clinical_note"
+
+
+def _pack_spans(line: str, cuts: List[int], max_tokens: int) -> List[Tuple[int, int]]:
+    """Greedily join the segments between `cuts` into spans of at most max_tokens"""
+    bounds = [0] + [c for c in cuts if 0 < c < len(line)] + [len(line)]
+    segments = list(zip(bounds, bounds[1:]))
+    counts = count_tokens_batch([line[a:b] for a, b in segments], TOKENIZER_MODEL)
+    spans, span_start, span_tokens = [], None, 0
+    for (a, b), count in zip(segments, counts):
+        if span_start is not None and span_tokens + count > max_tokens:
+            spans.append((span_start, a))
+            span_start, span_tokens = None, 0
+        if span_start is None:
+            span_start = a
+        span_tokens += count
+    spans.append((span_start, len(line)))
+    return spans
+
+
+def _split_long_line(line: str, max_tokens: int) -> List[Tuple[int, int]]:
+    """Character spans of a line longer than max_tokens, cut at sentences, then spaces, then characters"""
+    spans = []
+    for a, b in _pack_spans(line, [m.end() for m in _SENTENCE_RE.finditer(line)], max_tokens):
+        piece = line[a:b]
+        if count_tokens_batch([piece], TOKENIZER_MODEL)[0] <= max_tokens:
+            spans.append((a, b))
+            continue
+        cuts = [m.end() for m in re.finditer(r" +", piece)] or list(range(max_tokens * 3, len(piece), max_tokens * 3))
+        spans.extend((a + x, a + y) for x, y in _pack_spans(piece, cuts, max_tokens))
+    return spans
+
+
+def _page_lines(text: str, max_tokens: int) -> List[Tuple[int, int, int]]:
+    """(start, end, tokens) page spans of every non-empty line, long lines pre-split"""
+    spans = []
+    position = 0
+    for raw in text.splitlines(keepends=True):
+        line = raw.rstrip("\r\n")
+        if line.strip():
+            spans.append((position, position + len(line)))
+        position += len(raw)
+    counts = count_tokens_batch([text[a:b] for a, b in spans], TOKENIZER_MODEL) if spans else []
+
+    result = []
+    for (a, b), count in zip(spans, counts):
+        if count <= max_tokens:
+            result.append((a, b, count + 1))  # +1 for the line break
+            continue
+        pieces = _split_long_line(text[a:b], max_tokens)
+        piece_counts = count_tokens_batch([text[a + x:a + y] for x, y in pieces], TOKENIZER_MODEL)
+        result.extend((a + x, a + y, n + 1) for (x, y), n in zip(pieces, piece_counts))
+    return result
+
+
+def split_page(page: Document, config: SplitterConfig) -> Tuple[List[Document], int]:
+    """Chunks of one page and the number of table rows it contained"""
+    text = page.page_content
+    lines = _page_lines(text, config.max_tokens)
+    chunks: List[Document] = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    carried_heading = None  # heading repeated at the top of a continued table
+    heading = None  # span of the section heading the current lines belong to
+    previous_end = None  # page offset where the previous chunk ended
+    table_rows = 0
+
+    def flush():
+        nonlocal current, current_tokens, carried_heading, previous_end
+        if current:
+            metadata = dict(page.metadata)
+            metadata["chunk_tokens"] = current_tokens
+            metadata["start_index"] = current[0][0]
+            metadata.pop("heading_chars", None)
+            metadata.pop("previous_end", None)
+            if previous_end is not None:
+                metadata["previous_end"] = previous_end
+            body = text[current[0][0]:current[-1][1]]
+            if carried_heading is not None:
+                prefix = text[carried_heading[0]:carried_heading[1]] + "\n"
+                metadata["heading_chars"] = len(prefix)
+                body = prefix + body
+            chunks.append(Document(page_content=body, metadata=metadata))
+            previous_end = current[-1][1]
+        current, current_tokens, carried_heading = [], 0, None
+
+    for entry in lines:
+        a, b, tokens = entry
+        line = text[a:b]
+        is_heading = _is_heading(line)
+        is_row = not is_heading and _is_table_row(line)
+        table_rows += is_row
+
+        # Prefer to start a section in a fresh chunk once the current one has some substance
+        if is_heading and current_tokens >= config.min_tokens:
+            flush()
+
+        if current and current_tokens + tokens > config.max_tokens:
+            previous = current
+            flush()
+            if is_row and heading and heading[2] + tokens <= config.max_tokens:
+                # Continue the table under its heading
+                carried_heading, current_tokens = heading, heading[2]
+            elif not is_row and config.overlap_tokens:
+                # Carry trailing prose lines over for context
+                carry, carry_tokens = [], 0
+                for prev in reversed(previous):
+                    if carry_tokens + prev[2] > config.overlap_tokens or _is_table_row(text[prev[0]:prev[1]]):
+                        break
+                    carry.insert(0, prev)
+                    carry_tokens += prev[2]
+                if carry_tokens + tokens <= config.max_tokens:
+                    current, current_tokens = carry, carry_tokens
+
+        if is_heading:
+            heading = entry
+        current.append(entry)
+        current_tokens += tokens
+    flush()
+    return chunks, table_rows
+
+
+def split_documents(pages: List[Document], doc_type: str = None) -> Tuple[List[Document], SplitStats]:
+    """Split a file's pages into chunks using the settings for its document type"""
+    doc_type = doc_type or classify_document(pages)
+    config = SPLITTER_CONFIGS[doc_type]
+    chunks: List[Document] = []
+    table_rows = 0
+    for page in pages:
+        page_chunks, rows = split_page(page, config)
+        chunks.extend(page_chunks)
+        table_rows += rows
+
+    token_counts = [chunk.metadata["chunk_tokens"] for chunk in chunks]
+    stats = SplitStats(
+        doc_type=doc_type,
+        pages=len(pages),
+        chunks=len(chunks),
+        tokens=sum(token_counts),
+        mean_chunk_tokens=round(sum(token_counts) / len(chunks), 1) if chunks else 0.0,
+        max_chunk_tokens=max(token_counts, default=0),
+        table_rows=table_rows,
+    )
+    return chunks, stats
@@ -0,0 +1,251 @@
+"""
+Resumable Upload Sessions
+
+A client opens a session by listing the files of the document set it wants
+to ingest, by name, SHA-256 and size. The server answers with the hashes it
+does not already have on disk, so unchanged files are never sent again.
+Missing files are then sent in chunks at explicit offsets. Each file's
+`.part` file on disk is the record of how much has arrived, so after a
+dropped connection the client asks for the received offsets and carries on
+from there. Parts are kept per user and content hash rather than per
+session, so a new session for the same file resumes an abandoned one. Once every file is present the session is committed and
+queued for ingestion as one document set, exactly like a multipart upload.
+
+Sessions are persisted next to the user's uploads and survive restarts.
+Abandoned sessions and parts are removed after UPLOAD_SESSION_TTL_HOURS.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+import anyio
+
+from modules.pdf_handlers import (
+    SavedUpload, UploadLimitError, UPLOAD_CHUNK_SIZE, MAX_UPLOAD_FILE_MB, MAX_UPLOAD_REQUEST_MB,
+    user_upload_dir, stored_upload_path, find_stored_upload, check_pdf_pages, _safe_filename
+)
+
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+# Chunk size suggested to clients; any size up to the remaining bytes is accepted
+UPLOAD_SESSION_CHUNK_MB = int(os.getenv("UPLOAD_SESSION_CHUNK_MB", "4"))
+
+_SESSION_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+class UploadSessionError(ValueError):
+    """A request that does not fit the session's state"""
+
+
+class UploadOffsetMismatch(UploadSessionError):
+    """A chunk did not start where the received bytes end"""
+
+    def __init__(self, file_hash: str, received: int):
+        super().__init__(f"Expected the next chunk of {file_hash} at offset {received}")
+        self.received = received
+
+
+def _sessions_dir(user_id: str) -> Path:
+    return user_upload_dir(user_id) / ".sessions"
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadSessions:
+    """Session metadata as JSON, received bytes as `.part` files, one directory per session"""
+
+    def __init__(self):
+        self._file_locks: Dict[tuple, asyncio.Lock] = {}
+        self._meta_lock = threading.Lock()
+
+    def _dir(self, user_id: str, session_id: str) -> Path:
+        return _sessions_dir(user_id) / session_id
+
+    def _file_lock(self, user_id: str, file_hash: str) -> asyncio.Lock:
+        """Appends to one file are serialized; different files upload concurrently"""
+        return self._file_locks.setdefault((user_id, file_hash), asyncio.Lock())
+
+    def _save(self, session: Dict[str, Any]):
+        path = self._dir(session["user_id"], session["id"]) / "session.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(session))
+        os.replace(tmp, path)
+
+    def get(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        if not _SESSION_ID_RE.fullmatch(session_id):
+            return None
+        path = self._dir(user_id, session_id) / "session.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+    def _part(self, session: Dict[str, Any], file_hash: str) -> Path:
+        return _sessions_dir(session["user_id"]) / "parts" / f"{file_hash}.part"
+
+    def create(self, user_id: str, files: List[Dict[str, Any]], clear_existing: bool = False) -> Dict[str, Any]:
+        """Open a session for a document set and work out which of its files must be sent"""
+        self.expire(user_id)
+        file_limit = MAX_UPLOAD_FILE_MB * 1024 * 1024
+        entries = {}
+        for file in files:
+            file_hash, size = str(file["sha256"]).lower(), int(file["size"])
+            filename = _safe_filename(file.get("filename"))
+            if len(file_hash) != 64 or any(c not in "0123456789abcdef" for c in file_hash):
+                raise UploadSessionError(f"Invalid SHA-256 for {filename}")
+            if size <= 0:
+                raise UploadSessionError(f"{filename} is empty")
+            if size > file_limit:
+                raise UploadLimitError(f"{filename} exceeds the limit of {MAX_UPLOAD_FILE_MB} MB per file")
+            # Identical content under two names is ingested once, as in a multipart upload
+            entries.setdefault(file_hash, {"filename": filename, "sha256": file_hash, "size": size})
+
+        needed = [h for h, entry in entries.items() if find_stored_upload(user_id, h, entry["size"]) is None]
+        if sum(entries[h]["size"] for h in needed) > MAX_UPLOAD_REQUEST_MB * 1024 * 1024:
+            raise UploadLimitError(f"Upload exceeds the limit of {MAX_UPLOAD_REQUEST_MB} MB per request")
+
+        session = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "clear_existing": clear_existing,
+            "files": list(entries.values()),
+            "needed": needed,
+            "created_at": time.time(),
+        }
+        self._dir(user_id, session["id"]).mkdir(parents=True, exist_ok=True)
+        (_sessions_dir(user_id) / "parts").mkdir(exist_ok=True)
+        self._save(session)
+        return session
+
+    def status(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-file received bytes; files the server already had count as complete"""
+        files = []
+        for entry in session["files"]:
+            if entry["sha256"] in session["needed"]:
+                part = self._part(session, entry["sha256"])
+                received = part.stat().st_size if part.exists() else 0
+            else:
+                received = entry["size"]
+            files.append({**entry, "needed": entry["sha256"] in session["needed"], "received": received,
+                          "complete": received == entry["size"]})
+        return {
+            "session_id": session["id"],
+            "user_id": session["user_id"],
+            "needed": session["needed"],
+            "chunk_size": UPLOAD_SESSION_CHUNK_MB * 1024 * 1024,
+            "files": files,
+            "complete": all(f["complete"] for f in files),
+        }
+
+    async def append(self, session: Dict[str, Any], file_hash: str, offset: int,
+                     chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Append a chunk that starts at `offset` to a needed file. The file is
+        verified against its hash and moved into the user's uploads once all
+        of its bytes are in.
+        """
+        entry = next((e for e in session["files"] if e["sha256"] == file_hash), None)
+        if entry is None:
+            raise UploadSessionError(f"File {file_hash} is not part of this session")
+        if file_hash not in session["needed"]:
+            # Already on the server; a retried final chunk lands here
+            return {"sha256": file_hash, "received": entry["size"], "complete": True}
+
+        async with self._file_lock(session["user_id"], file_hash):
+            part = self._part(session, file_hash)
+            if not part.exists() and find_stored_upload(session["user_id"], file_hash, entry["size"]):
+                # Another session finished the same file in the meantime
+                await asyncio.to_thread(self._mark_received, session, file_hash)
+                return {"sha256": file_hash, "received": entry["size"], "complete": True}
+            received = part.stat().st_size if part.exists() else 0
+            if offset != received:
+                raise UploadOffsetMismatch(file_hash, received)
+            async with await anyio.open_file(part, "ab") as out:
+                try:
+                    async for chunk in chunks:
+                        if received + len(chunk) > entry["size"]:
+                            raise UploadSessionError(f"More than {entry['size']} bytes sent for {entry['filename']}")
+                        await out.write(chunk)
+                        received += len(chunk)
+                finally:
+                    await out.flush()
+            if received == entry["size"]:
+                await asyncio.to_thread(self._finish_file, session, entry, part)
+        return {"sha256": file_hash, "received": received, "complete": received == entry["size"]}
+
+    def _finish_file(self, session: Dict[str, Any], entry: Dict[str, Any], part: Path):
+        if _file_sha256(part) != entry["sha256"]:
+            part.unlink(missing_ok=True)
+            raise UploadSessionError(f"{entry['filename']} does not match its SHA-256; send it again")
+        dest_dir = user_upload_dir(session["user_id"])
+        final_path = stored_upload_path(dest_dir, entry["sha256"], entry["filename"])
+        if final_path.exists():
+            part.unlink(missing_ok=True)
+        else:
+            os.replace(part, final_path)
+        self._mark_received(session, entry["sha256"])
+
+    def _mark_received(self, session: Dict[str, Any], file_hash: str):
+        with self._meta_lock:
+            # Re-read: other files of the session may have finished since this request loaded it
+            current = self.get(session["user_id"], session["id"]) or session
+            current["needed"] = [h for h in current["needed"] if h != file_hash]
+            self._save(current)
+        session["needed"] = current["needed"]
+
+    def commit(self, session: Dict[str, Any]) -> List[SavedUpload]:
+        """The session's files as saved uploads, once all of them are on disk; closes the session"""
+        uploads = []
+        total_pages = 0
+        for entry in session["files"]:
+            path = find_stored_upload(session["user_id"], entry["sha256"], entry["size"])
+            if path is None:
+                raise UploadSessionError(f"{entry['filename']} has not been fully uploaded")
+            upload = SavedUpload(filename=entry["filename"], path=str(path), sha256=entry["sha256"], size=entry["size"])
+            total_pages = check_pdf_pages(upload, total_pages)
+            uploads.append(upload)
+        self.delete(session)
+        return uploads
+
+    def delete(self, session: Dict[str, Any]):
+        shutil.rmtree(self._dir(session["user_id"], session["id"]), ignore_errors=True)
+
+    def expire(self, user_id: str):
+        """Remove the user's sessions and parts untouched for longer than the TTL"""
+        root = _sessions_dir(user_id)
+        if not root.is_dir():
+            return
+        cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+        for path in list(root.iterdir()) + list((root / "parts").glob("*.part")):
+            if path.name == "parts" or path.stat().st_mtime >= cutoff:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+
+
+_upload_sessions: Optional[UploadSessions] = None
+_upload_sessions_lock = threading.Lock()
+
+
+def get_upload_sessions() -> UploadSessions:
+    """Process-wide upload session registry"""
+    global _upload_sessions
+    with _upload_sessions_lock:
+        if _upload_sessions is None:
+            _upload_sessions = UploadSessions()
+        return _upload_sessions
@@ -0,0 +1,561 @@
+"""
+Vector Store Backends
+
+A small `VectorStore` interface over the per-user document vectors, with a
+Pinecone implementation (one namespace per user) for shared deployments and
+a local in-process implementation for single-node deployments.
+
+The local backend keeps each user's vectors as a float32, int8 or binary
+matrix (per the embedding profile) in memory-mapped `.npy` files with a
+JSON metadata sidecar. Upserted batches are appended in memory and written
+once per ingest by `flush`, rather than rewriting the files per batch.
+Small users are
+searched exactly by brute force; above `HNSW_THRESHOLD` vectors an HNSW
+graph is built (when `hnswlib` is installed) for approximate search.
+"""
+
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Collection
+
+import numpy as np
+
+from modules.ingest_manifest import user_storage_key, file_version, file_lock
+from modules.quantization import QuantizedMatrix, normalize_rows
+from modules.embedding_profile import get_embedding_profile
+
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "./vector_store")
+HNSW_THRESHOLD = int(os.getenv("HNSW_THRESHOLD", "5000"))
+RESCORE_OVERSAMPLE = int(os.getenv("RESCORE_OVERSAMPLE", "4"))
+# Query the shared default namespace for users not yet migrated to their own
+PINECONE_LEGACY_FALLBACK = os.getenv("PINECONE_LEGACY_FALLBACK", "true").lower() == "true"
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "pocketmdtpdfs")
+PINECONE_CLOUD = os.getenv("PINECONE_CLOUD", "aws")
+PINECONE_ENV = os.getenv("PINECONE_ENV", "us-east-1")
+INDEX_READY_TIMEOUT = float(os.getenv("INDEX_READY_TIMEOUT", "120"))
+
+# (id, values, metadata) as accepted by Pinecone's upsert
+VectorRecord = Tuple[str, Sequence[float], Dict[str, Any]]
+
+
+class VectorStore(ABC):
+    """Per-user vector storage and similarity search"""
+
+    @abstractmethod
+    def upsert(self, user_id: str, vectors: List[VectorRecord]):
+        """Insert or replace vectors belonging to a user"""
+
+    @abstractmethod
+    def query(self, user_id: str, vector: Sequence[float], top_k: int = 5,
+              include_values: bool = False, specialties: Optional[Sequence[str]] = None,
+              exclude_ids: Optional[Collection[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Return the user's top_k most similar vectors as match dicts with
+        `id`, `score`, `metadata` and, if requested, `values`. With
+        `specialties`, only vectors tagged with one of them are searched;
+        vectors in `exclude_ids` are never returned.
+        """
+
+    @abstractmethod
+    def list_ids(self, user_id: str) -> List[str]:
+        """IDs of every vector stored for a user"""
+
+    @abstractmethod
+    def delete(self, user_id: str, ids: List[str]):
+        """Delete specific vectors belonging to a user"""
+
+    @abstractmethod
+    def delete_user(self, user_id: str):
+        """Delete every vector belonging to a user"""
+
+    def flush(self, user_id: str):
+        """Persist writes buffered for a user; backends that write through need nothing"""
+
+    def accepts(self, user_id: str, dimension: int) -> bool:
+        """Whether vectors of `dimension` under the active profile can be added beside the user's stored ones"""
+        return True
+
+    def delete_legacy(self, user_id: str):
+        """Delete copies of the user's vectors kept outside their own storage, if the backend has any"""
+
+
+def _match_dict(match, include_values: bool) -> Dict[str, Any]:
+    """Plain-dict copy of a Pinecone scored vector"""
+    result = {"id": match["id"], "score": match["score"], "metadata": match.get("metadata") or {}}
+    if include_values:
+        result["values"] = list(match.get("values") or [])
+    return result
+
+
+def user_namespace(user_id: str) -> str:
+    """Pinecone namespace holding one user's vectors"""
+    return f"user-{user_storage_key(user_id)}"
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Pinecone index with one namespace per user, so queries only touch that
+    tenant's vectors and clearing a user is a single namespace drop.
+
+    While legacy vectors are being migrated out of the shared default
+    namespace (see utils/migrate_namespaces.py), queries for users whose
+    namespace is still empty fall back to a filtered query over it.
+    """
+
+    def __init__(self, index, legacy_fallback: bool = PINECONE_LEGACY_FALLBACK):
+        self.index = index
+        self.legacy_fallback = legacy_fallback
+
+    def upsert(self, user_id: str, vectors: List[VectorRecord]):
+        self.index.upsert(vectors=vectors, namespace=user_namespace(user_id))
+
+    def query(self, user_id: str, vector: Sequence[float], top_k: int = 5,
+              include_values: bool = False, specialties: Optional[Sequence[str]] = None,
+              exclude_ids: Optional[Collection[str]] = None) -> List[Dict[str, Any]]:
+        res = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            namespace=user_namespace(user_id),
+            filter={"specialties": {"$in": list(specialties)}} if specialties else None
+        )
+        matches = [_match_dict(match, include_values) for match in res.get("matches", [])]
+        if exclude_ids:
+            # A namespace holding only a first upload's staged chunks still falls back below
+            matches = [match for match in matches if match["id"] not in exclude_ids]
+        if matches or not self.legacy_fallback or specialties:
+            return matches
+        return self._query_legacy(user_id, vector, top_k, include_values)
+
+    def _query_legacy(self, user_id: str, vector: Sequence[float], top_k: int,
+                      include_values: bool) -> List[Dict[str, Any]]:
+        """Filtered query over the shared default namespace for not-yet-migrated users"""
+        try:
+            res = self.index.query(
+                vector=vector,
+                top_k=top_k,
+                include_metadata=True,
+                include_values=include_values,
+                filter={"user_id": user_id}  # This ensures user isolation
+            )
+        except Exception as e:
+            print(f"⚠️  Legacy filtered query failed for user {user_id}: {e}")
+            return []
+        matches = [_match_dict(match, include_values) for match in res.get("matches", [])]
+        return [match for match in matches if match["metadata"].get("user_id") == user_id]
+
+    def list_ids(self, user_id: str) -> List[str]:
+        ids, token = [], None
+        while True:
+            page = self.index.list_paginated(namespace=user_namespace(user_id), limit=100, pagination_token=token)
+            ids.extend(vector.id for vector in page.vectors)
+            token = page.pagination.next if page.pagination else None
+            if token is None:
+                return ids
+
+    def delete(self, user_id: str, ids: List[str]):
+        self.index.delete(ids=ids, namespace=user_namespace(user_id))
+
+    def delete_user(self, user_id: str):
+        try:
+            self.index.delete(delete_all=True, namespace=user_namespace(user_id))
+        except Exception as e:
+            # Deleting a namespace that was never created is not an error here
+            if "not found" not in str(e).lower():
+                raise
+        self.delete_legacy(user_id)
+
+    def delete_legacy(self, user_id: str):
+        """Drop the user's vectors from the shared default namespace once their own namespace is authoritative"""
+        if self.legacy_fallback:
+            try:
+                self.index.delete(filter={"user_id": user_id})
+            except Exception as e:
+                print(f"⚠️  Could not clear legacy vectors for user {user_id}: {e}")
+
+
+class _UserVectors:
+    """
+    One user's vectors: encoded (possibly quantized) normalized rows, an
+    optional float32 copy for rescoring, plus ids and metadata
+    """
+
+    def __init__(self, ids: List[str], metadata: List[Dict[str, Any]], codes: QuantizedMatrix,
+                 full: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.metadata = metadata
+        self.codes = codes
+        self.full = full
+        self.row_of = {vector_id: row for row, vector_id in enumerate(ids)}
+        self.hnsw = None
+        self._specialty_rows: Optional[Dict[str, np.ndarray]] = None
+        # Appended (codes, full) batches not yet merged into the matrices, and unsaved changes
+        self.pending: List[Tuple[QuantizedMatrix, Optional[np.ndarray]]] = []
+        self.dirty = False
+        # file_version() of the metadata file this copy was loaded from
+        self.version = None
+
+    def merge_pending(self):
+        """Concatenate appended batches into the matrices in one copy"""
+        if not self.pending:
+            return
+        self.codes = self.codes.appended(*(codes for codes, _ in self.pending))
+        if self.full is not None:
+            self.full = np.concatenate([np.asarray(self.full)] + [full for _, full in self.pending])
+        self.pending = []
+        self.hnsw = None
+        self._specialty_rows = None
+
+    def specialty_rows(self, specialties: Sequence[str]) -> np.ndarray:
+        """Rows tagged with any of the given specialties, ascending"""
+        if self._specialty_rows is None:
+            by_label: Dict[str, List[int]] = {}
+            for row, meta in enumerate(self.metadata):
+                for label in meta.get("specialties") or ():
+                    by_label.setdefault(label, []).append(row)
+            self._specialty_rows = {label: np.asarray(rows, dtype=np.int64) for label, rows in by_label.items()}
+        parts = [self._specialty_rows[label] for label in specialties if label in self._specialty_rows]
+        return np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def float_rows(self, rows=None) -> np.ndarray:
+        """Best available float32 view of (some of) the rows"""
+        if self.full is not None:
+            return np.asarray(self.full if rows is None else self.full[rows], dtype=np.float32)
+        return self.codes.to_float(rows)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store backed by memory-mapped `.npy` files
+
+    Rows are stored in the encoding chosen by `quantization`; with
+    `keep_full_precision` a float32 copy is kept too and used to rescore the
+    quantized candidates exactly. A user's clean in-memory copy is reloaded
+    when another server process rewrites their files.
+    """
+
+    def __init__(self, base_dir: str = LOCAL_VECTOR_DIR, hnsw_threshold: int = HNSW_THRESHOLD,
+                 quantization: str = "float32", keep_full_precision: bool = False):
+        self.base_dir = base_dir
+        self.hnsw_threshold = hnsw_threshold
+        self.quantization = quantization
+        self.keep_full_precision = keep_full_precision and quantization != "float32"
+        self._users: Dict[str, _UserVectors] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _lock(self, user_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(user_id, threading.Lock())
+
+    def _user_dir(self, user_id: str) -> str:
+        return os.path.join(self.base_dir, user_storage_key(user_id))
+
+    def _load(self, user_id: str) -> Optional[_UserVectors]:
+        """Load (and memoize) a user's vectors, memory-mapping the matrices"""
+        user_dir = self._user_dir(user_id)
+        metadata_path = os.path.join(user_dir, "metadata.json")
+        version = file_version(metadata_path)
+        cached = self._users.get(user_id)
+        if cached is not None and (cached.dirty or cached.version == version):
+            return cached
+        if version is None:
+            self._users.pop(user_id, None)
+            return None
+        with open(metadata_path, "r") as f:
+            sidecar = json.load(f)
+        mode = sidecar.get("quantization", "float32")
+        codes = QuantizedMatrix.load(os.path.join(user_dir, "vectors"), mode, sidecar.get("dim"))
+        if codes is None:
+            return None
+        full_path = os.path.join(user_dir, "vectors_full.npy")
+        full = np.load(full_path, mmap_mode="r") if os.path.exists(full_path) else None
+        user = _UserVectors(sidecar["ids"], sidecar["metadata"], codes, full)
+        user.version = version
+        self._users[user_id] = user
+        return user
+
+    def _save(self, user_id: str, ids: List[str], metadata: List[Dict[str, Any]], codes: QuantizedMatrix,
+              full: Optional[np.ndarray]):
+        """Atomically replace a user's files and re-map the matrices"""
+        user_dir = self._user_dir(user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        codes.save(os.path.join(user_dir, "vectors"))
+        full_path = os.path.join(user_dir, "vectors_full.npy")
+        if full is not None:
+            QuantizedMatrix("float32", np.asarray(full, dtype=np.float32), None, codes.dim).save(
+                os.path.join(user_dir, "vectors_full")
+            )
+        elif os.path.exists(full_path):
+            os.remove(full_path)
+        metadata_path = os.path.join(user_dir, "metadata.json")
+        with open(f"{metadata_path}.tmp", "w") as f:
+            json.dump({"ids": ids, "metadata": metadata, "quantization": codes.mode, "dim": codes.dim}, f)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+        self._users.pop(user_id, None)
+        self._load(user_id)
+
+    def upsert(self, user_id: str, vectors: List[VectorRecord]):
+        """Apply a batch in memory; the files are written by flush()"""
+        if not vectors:
+            return
+        with self._lock(user_id):
+            user = self._load(user_id)
+            new_values = normalize_rows([values for _, values, _ in vectors])
+            if user is None:
+                user = _UserVectors([], [], QuantizedMatrix.empty(self.quantization, new_values.shape[1]),
+                                    np.zeros((0, new_values.shape[1]), dtype=np.float32) if self.keep_full_precision else None)
+                self._users[user_id] = user
+            elif new_values.shape[1] != user.codes.dim:
+                raise ValueError(
+                    f"Vector dimension {new_values.shape[1]} does not match stored dimension {user.codes.dim} "
+                    f"for user {user_id}; clear the user's documents after changing the embedding profile"
+                )
+
+            replace_rows, replace_values, appended = [], [], []
+            for (vector_id, _, meta), values in zip(vectors, new_values):
+                if vector_id in user.row_of:
+                    replace_rows.append(user.row_of[vector_id])
+                    replace_values.append(values)
+                    user.metadata[user.row_of[vector_id]] = meta
+                else:
+                    user.row_of[vector_id] = len(user.ids)
+                    user.ids.append(vector_id)
+                    user.metadata.append(meta)
+                    appended.append(values)
+
+            if replace_rows:
+                # Rare (same content re-upserted); rows may still be in a pending batch
+                user.merge_pending()
+                user.codes = user.codes.with_rows(replace_rows, QuantizedMatrix.from_float(replace_values, user.codes.mode))
+                if user.full is not None:
+                    user.full = np.array(user.full)
+                    user.full[replace_rows] = replace_values
+                user.hnsw = None
+            if appended:
+                user.pending.append((
+                    QuantizedMatrix.from_float(appended, user.codes.mode),
+                    np.asarray(appended, dtype=np.float32) if user.full is not None else None
+                ))
+            user._specialty_rows = None
+            user.dirty = True
+
+    def flush(self, user_id: str):
+        """Write the user's matrices and ID map once, after a whole ingest's upserts"""
+        with self._lock(user_id), file_lock(self._user_dir(user_id)):
+            user = self._users.get(user_id)
+            if user is None or not user.dirty:
+                return
+            user.merge_pending()
+            self._save(user_id, user.ids, user.metadata, user.codes, user.full)
+
+    def list_ids(self, user_id: str) -> List[str]:
+        user = self._load(user_id)
+        return list(user.ids) if user is not None else []
+
+    def accepts(self, user_id: str, dimension: int) -> bool:
+        """False when the stored matrix has another dimension or encoding than the active profile writes"""
+        user = self._load(user_id)
+        if user is None or not user.ids:
+            return True
+        return (user.codes.dim == dimension and user.codes.mode == self.quantization
+                and (user.full is not None) == self.keep_full_precision)
+
+    def query(self, user_id: str, vector: Sequence[float], top_k: int = 5,
+              include_values: bool = False, specialties: Optional[Sequence[str]] = None,
+              exclude_ids: Optional[Collection[str]] = None) -> List[Dict[str, Any]]:
+        user = self._load(user_id)
+        if user is None or not user.ids:
+            return []
+        with self._lock(user_id):
+            user.merge_pending()
+            rows_stored = len(user.codes)
+        query = normalize_rows(vector)
+        allowed = user.specialty_rows(specialties) if specialties else None
+        if exclude_ids:
+            excluded = {user.row_of[vector_id] for vector_id in exclude_ids if vector_id in user.row_of}
+            if excluded:
+                candidates = allowed if allowed is not None else np.arange(rows_stored)
+                allowed = candidates[~np.isin(candidates, list(excluded))]
+        if allowed is not None:
+            # Rows appended by a concurrent upsert are not in the matrix yet
+            allowed = allowed[allowed < rows_stored]
+        k = min(top_k, rows_stored if allowed is None else len(allowed))
+        if k == 0:
+            return []
+
+        if allowed is None and rows_stored >= self.hnsw_threshold and self._ensure_hnsw(user_id, user):
+            labels, distances = user.hnsw.knn_query(query, k=k)
+            rows = labels[0].tolist()
+            scores = (1.0 - distances[0]).tolist()
+        else:
+            # Exact brute-force similarity over the encoded rows (only the allowed ones when filtered)
+            sims = user.codes.scores(query)
+            if allowed is not None:
+                masked = np.full(len(sims), -np.inf, dtype=np.float32)
+                masked[allowed] = sims[allowed]
+                sims = masked
+            if user.full is not None:
+                # Shortlist on the quantized codes, then rescore exactly in float32
+                shortlist = min(len(sims), k * RESCORE_OVERSAMPLE)
+                candidates = _top_rows(sims, shortlist)
+                sims = np.full(len(sims), -np.inf, dtype=np.float32)
+                sims[candidates] = np.asarray(user.full[candidates], dtype=np.float32) @ query
+            rows = _top_rows(sims, k).tolist()
+            scores = sims[rows].tolist()
+
+        matches = []
+        for row, score in zip(rows, scores):
+            match = {"id": user.ids[row], "score": float(score), "metadata": user.metadata[row]}
+            if include_values:
+                match["values"] = user.float_rows(row).tolist()
+            matches.append(match)
+        return matches
+
+    def _ensure_hnsw(self, user_id: str, user: _UserVectors) -> bool:
+        """Build the user's HNSW graph on first use; False if hnswlib is unavailable"""
+        if user.hnsw is not None:
+            return True
+        try:
+            import hnswlib
+        except ImportError:
+            return False
+        with self._lock(user_id):
+            if user.hnsw is None:
+                graph = hnswlib.Index(space="ip", dim=user.codes.dim)
+                graph.init_index(max_elements=len(user.codes), ef_construction=200, M=16)
+                graph.add_items(user.float_rows(), np.arange(len(user.codes)))
+                graph.set_ef(64)
+                user.hnsw = graph
+                print(f"🕸️  Built HNSW graph over {len(user.codes)} vectors for user {user_id}")
+        return True
+
+    def delete(self, user_id: str, ids: List[str]):
+        with self._lock(user_id), file_lock(self._user_dir(user_id)):
+            user = self._load(user_id)
+            if user is None:
+                return
+            user.merge_pending()
+            drop = set(ids)
+            keep = [row for row, vector_id in enumerate(user.ids) if vector_id not in drop]
+            if len(keep) == len(user.ids):
+                if user.dirty:
+                    self._save(user_id, user.ids, user.metadata, user.codes, user.full)
+                return
+            self._save(
+                user_id,
+                [user.ids[row] for row in keep],
+                [user.metadata[row] for row in keep],
+                user.codes.take(keep),
+                None if user.full is None else np.asarray(user.full)[keep]
+            )
+
+    def delete_user(self, user_id: str):
+        with self._lock(user_id), file_lock(self._user_dir(user_id)):
+            self._users.pop(user_id, None)
+            user_dir = self._user_dir(user_id)
+            if os.path.isdir(user_dir):
+                for name in os.listdir(user_dir):
+                    os.remove(os.path.join(user_dir, name))
+
+
+def _top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    rows = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return rows[np.argsort(-scores[rows])]
+
+
+def create_vector_store(index=None) -> VectorStore:
+    """Build the backend selected by VECTOR_STORE_BACKEND"""
+    if VECTOR_STORE_BACKEND == "local":
+        profile = get_embedding_profile()
+        print(f"📦 Using local vector store at {LOCAL_VECTOR_DIR} (profile: {profile.name})")
+        return LocalVectorStore(quantization=profile.quantization, keep_full_precision=profile.keep_full_precision)
+    if index is None:
+        raise ValueError("A Pinecone index is required for the pinecone vector store backend")
+    return PineconeVectorStore(index)
+
+
+class IndexConfigurationError(RuntimeError):
+    """The Pinecone index does not match what the embedding profile requires"""
+
+
+def index_dimension() -> int:
+    """Vector size produced by the registry's embedding model under the active profile"""
+    from modules.embedding_cache import configured_embedding_model
+
+    return get_embedding_profile().vector_dimension(configured_embedding_model())
+
+
+_pinecone_client = None
+_vector_store: Optional[VectorStore] = None
+_vector_store_lock = threading.Lock()
+
+
+def get_pinecone_client():
+    """Process-wide Pinecone client"""
+    global _pinecone_client
+    if _pinecone_client is None:
+        from pinecone import Pinecone
+
+        _pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return _pinecone_client
+
+
+def wait_for_index_ready(pc, name: str = PINECONE_INDEX_NAME, timeout: float = INDEX_READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not pc.describe_index(name).status["ready"]:
+        if time.monotonic() > deadline:
+            raise IndexConfigurationError(f"Pinecone index {name} was not ready after {timeout:.0f}s")
+        time.sleep(1)
+
+
+def create_pinecone_index(pc, name: str = PINECONE_INDEX_NAME, dimension: Optional[int] = None):
+    from pinecone import ServerlessSpec
+
+    pc.create_index(
+        name=name,
+        dimension=dimension or index_dimension(),  # Matches the embedding model and profile
+        metric="cosine",
+        spec=ServerlessSpec(cloud=PINECONE_CLOUD, region=PINECONE_ENV)
+    )
+    wait_for_index_ready(pc, name)
+
+
+def ensure_pinecone_index(pc, name: str = PINECONE_INDEX_NAME):
+    """
+    Connect to the index, creating it if it does not exist. A dimension
+    mismatch is reported, never fixed here: deleting the index destroys
+    every user's vectors, so it is only done by `utils/index_admin.py`.
+    """
+    expected = index_dimension()
+    if name not in [i["name"] for i in pc.list_indexes()]:
+        print(f"🆕 Creating Pinecone index {name} with dimension {expected}")
+        create_pinecone_index(pc, name, expected)
+    else:
+        current = pc.describe_index(name).dimension
+        if current != expected:
+            raise IndexConfigurationError(
+                f"Pinecone index {name} has dimension {current}, but the embedding profile requires {expected}. "
+                f"Run `python utils/index_admin.py recreate --confirm {name}` to rebuild it."
+            )
+    return pc.Index(name)
+
+
+def get_vector_store() -> VectorStore:
+    """
+    Process-wide vector store for VECTOR_STORE_BACKEND, connected and
+    verified on first use. A failed verification is retried on the next call.
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            index = ensure_pinecone_index(get_pinecone_client()) if VECTOR_STORE_BACKEND == "pinecone" else None
+            _vector_store = create_vector_store(index)
+        return _vector_store
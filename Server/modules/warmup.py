@@ -0,0 +1,75 @@
+"""
+Startup Warm-up
+
+Runs in the background from the application lifespan so the server starts
+serving immediately. It connects and verifies the vector index, opens the
+local stores and loads the tokenizer and agent registry. Each step is
+retried until it succeeds. `/ready` reports ready only once every step
+has completed.
+"""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Tuple
+
+from logger import logger
+
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "15"))
+
+_state: Dict[str, Any] = {"ready": False, "started_at": None, "finished_at": None, "steps": {}}
+
+
+def _steps() -> List[Tuple[str, Callable[[], Any]]]:
+    from modules.vector_store import get_vector_store
+    from modules.embedding_cache import get_embedding_cache, get_embedding_model
+    from modules.chunk_store import get_chunk_store
+    from modules.lexical_index import get_lexical_index
+    from modules.lab_store import get_lab_store
+    from modules.pdf_extraction import get_page_cache
+    from modules.specialty_digest import get_digest_store
+    from modules.context_assembler import count_tokens
+    from modules.central_orchestrator.agent_loader import AgentLoader
+
+    return [
+        ("vector_index", get_vector_store),
+        ("embedding_cache", get_embedding_cache),
+        ("embedding_client", get_embedding_model),
+        ("chunk_store", get_chunk_store),
+        ("lexical_index", get_lexical_index),
+        ("lab_store", get_lab_store),
+        ("page_cache", get_page_cache),
+        ("digest_store", get_digest_store),
+        ("tokenizer", lambda: count_tokens("warm-up")),
+        ("agent_registry", lambda: AgentLoader().load_all_enabled_agents()),
+    ]
+
+
+async def warm_up():
+    """Run every warm-up step off the event loop, retrying failed ones until all succeed"""
+    _state.update(ready=False, started_at=datetime.now().isoformat(), finished_at=None)
+    pending = _steps()
+    for name, _ in pending:
+        _state["steps"][name] = "pending"
+
+    while pending:
+        failed = []
+        for name, step in pending:
+            try:
+                await asyncio.to_thread(step)
+                _state["steps"][name] = "ok"
+            except Exception as e:
+                logger.warning(f"Warm-up step {name} failed, retrying in {WARMUP_RETRY_SECONDS:.0f}s: {e}")
+                _state["steps"][name] = f"error: {e}"
+                failed.append((name, step))
+        pending = failed
+        if pending:
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    _state.update(ready=True, finished_at=datetime.now().isoformat())
+    logger.info("Warm-up complete; server is ready")
+
+
+def readiness() -> Dict[str, Any]:
+    """Snapshot of warm-up progress"""
+    return {**_state, "steps": dict(_state["steps"])}
@@ -1,153 +1,122 @@
 from fastapi import APIRouter, Form
 from fastapi.responses import JSONResponse
 from modules.central_orchestrator.agent import CentralOrchestratorAgent
-from langchain_core.documents import Document
-from langchain.schema import BaseRetriever
-from langchain_openai import OpenAIEmbeddings
-from pinecone import Pinecone
-from pydantic import Field
-from typing import List, Optional
+from modules.retrieval import retrieve_user_documents
+from modules.context_assembler import assemble_context, count_tokens, CONTEXT_TOKEN_BUDGET
+from modules.lab_store import lab_table
+from modules.specialty_digest import specialty_digests
+from modules.patient_profiles import profile_context, format_patient_history
+from typing import Optional
 from logger import logger
-import os
 import json
 
 router=APIRouter()
 
+# Candidates fetched for MMR re-ranking and the model whose tokenizer sizes the context
+RETRIEVAL_CANDIDATES = 20
+ANSWER_MODEL = "gpt-4"
+# Chunk budget when specialists also get a digest; the digest carries the recurring findings
+DIGEST_DOCUMENT_BUDGET = 1200
+# Specialists fall back to the shared context when fewer of their tagged chunks match
+SPECIALIST_MIN_MATCHES = 3
+
 @router.post("/ask/")
 async def ask_question(
     question: str = Form(...), 
     user_id: str = Form(..., description="Unique identifier for the user asking the question"),
-    patient_history: Optional[str] = Form(None)
+    patient_history: Optional[str] = Form(None),
+    profile_version: Optional[int] = Form(
+        None, description="Use the user's stored profile (PUT /profiles/{user_id}) instead of an inline patient_history"
+    )
 ):
     try:
-        logger.info(f"user query from user {user_id}: {question}")
-        logger.info(f"patient history provided for user {user_id}: {patient_history is not None}")
-        if patient_history:
-            logger.info(f"patient history type: {type(patient_history)}, value: {patient_history[:100] if isinstance(patient_history, str) else str(patient_history)[:100]}")
-
-        # Embed model + Pinecone setup
-        pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
-        index = pc.Index(os.environ["PINECONE_INDEX_NAME"])
-        embed_model = OpenAIEmbeddings(model="text-embedding-3-large")
-        embedded_query = embed_model.embed_query(question)
-        
-        # Use user-specific document query to ensure isolation
-        from modules.load_vectorstore import query_user_documents
-        matches = query_user_documents(embedded_query, user_id, top_k=10)
-
-        logger.info(f"Vector store query returned {len(matches)} matches for user {user_id}")
-
-        docs = []
-        seen_filenames = set()  # Track which files we've seen to avoid duplicates
-        
-        for match in matches:
-            metadata = match.get("metadata", {})
-            # Try to get text content from metadata
-            text_content = metadata.get("text", "")
-            
-            # If no text in metadata, try to get it from page_content if available
-            if not text_content and "page_content" in metadata:
-                text_content = metadata.get("page_content", "")
-            
-            # Get filename for tracking
-            filename = metadata.get("filename", "unknown")
-            
-            # Verify this document belongs to the requesting user
-            document_user_id = metadata.get("user_id", "")
-            if document_user_id != user_id:
-                logger.warning(f"Document {filename} belongs to user {document_user_id}, not requesting user {user_id}")
-                continue
-                
-            # Skip if we've already seen this file (to avoid duplicate content)
-            if filename in seen_filenames:
-                logger.info(f"Skipping duplicate file for user {user_id}: {filename}")
-                continue
-                
-            # Log the first few characters of each document for debugging
-            if text_content:
-                logger.info(f"Document preview from {filename} for user {user_id}: {text_content[:100]}...")
-                seen_filenames.add(filename)
-            else:
-                logger.warning(f"No text content found in document metadata for user {user_id}: {metadata.keys()}")
-                continue
-            
-            doc = Document(
-                page_content=text_content,
-                metadata=metadata
-            )
-            docs.append(doc)
-            
-            # Limit to top 5 unique documents to avoid overwhelming the context
-            if len(docs) >= 5:
-                break
+        logger.info("user query", extra={
+            "user_id": user_id, "question": question, "question_chars": len(question),
+            "patient_history_inline": patient_history is not None, "profile_version": profile_version
+        })
+
+        use_stored_profile = profile_version is not None and not patient_history
+        if use_stored_profile:
+            # Stored profile, formatted once per version
+            stored_version, patient_context = profile_context(user_id)
+            if stored_version is None:
+                logger.info(f"Profile version {profile_version} referenced but no profile stored for user {user_id}")
+                return JSONResponse(status_code=409, content={
+                    "error": f"No profile stored for user {user_id}; store it again or send patient_history",
+                    "version": None
+                })
+            if stored_version != profile_version:
+                logger.info(f"Profile version {profile_version} for user {user_id} is stale; using {stored_version}")
+        else:
+            patient_context = parse_patient_history(patient_history, user_id)
 
-        class SimpleRetriever(BaseRetriever):
-            tags: Optional[List[str]] = Field(default_factory=list)
-            metadata: Optional[dict] = Field(default_factory=dict)
+        # One orchestrator per request; its registry-configured embedding model is
+        # shared by retrieval and routing. Routing reuses the retrieval embedding,
+        # or embeds the question itself (through the embedding cache) after a
+        # decisive lexical match skipped dense retrieval
+        agent = CentralOrchestratorAgent()
+
+        # Hybrid lexical + dense retrieval over this user's documents only
+        embed_model = agent.embedder
+        matches, embedded_query = retrieve_user_documents(question, user_id, embed_model, top_k=RETRIEVAL_CANDIDATES)
 
-            def __init__(self, documents: List[Document]):
-                super().__init__()
-                self._docs = documents
+        logger.debug(f"Vector store query returned {len(matches)} matches for user {user_id}")
+        user_matches = owned_matches(matches, user_id)
 
-            def _get_relevant_documents(self, query: str) -> List[Document]:
-                return self._docs
+        # Structured lab results with locally computed trends; they share the context budget
+        lab_context = lab_table(user_id) if agent.agent_loader.is_trend_analysis_enabled() else ""
+        document_budget = CONTEXT_TOKEN_BUDGET - count_tokens(lab_context, ANSWER_MODEL)
+        if lab_context:
+            logger.debug(f"Lab table for user {user_id}: {lab_context.count(chr(10))} analytes")
 
-        # Extract document content for context
+        # Precomputed per-specialty digests replace most of the raw chunks for specialists
+        digests = specialty_digests(user_id)
+        if digests:
+            document_budget = min(document_budget, DIGEST_DOCUMENT_BUDGET)
+            logger.debug(f"Specialty digests for user {user_id}: {sorted(digests)}")
+
+        # Re-rank with MMR, merge adjacent chunks and fit the model's token budget
         document_content = ""
-        if docs:
-            # Filter out empty documents
-            valid_docs = [doc for doc in docs if doc.page_content.strip()]
-            if valid_docs:
-                # Log which documents are being used
-                filenames_used = [doc.metadata.get("filename", "unknown") for doc in valid_docs]
-                logger.info(f"Using documents from files for user {user_id}: {filenames_used}")
-                
-                document_content = "\n\n".join([doc.page_content for doc in valid_docs])
-                logger.info(f"Retrieved {len(valid_docs)} relevant documents with content for context for user {user_id}")
-                logger.info(f"Total document context length for user {user_id}: {len(document_content)} characters")
+        if user_matches:
+            assembled = assemble_context(user_matches, embedded_query, model_name=ANSWER_MODEL,
+                                         token_budget=document_budget)
+            document_content = assembled.text
+            if document_content:
+                logger.debug(f"Using documents from files for user {user_id}: {assembled.filenames}")
+                logger.debug(f"Assembled {len(assembled.chunk_ids)} chunks into {assembled.tokens} tokens of context for user {user_id}")
             else:
                 logger.warning(f"All retrieved documents have empty content for user {user_id}")
         else:
             logger.info(f"No relevant documents found in vector store for user {user_id}")
 
-        # Parse patient history if provided
-        patient_context = ""
-        if patient_history:
-            try:
-                # Handle both JSON string and dict object formats
-                if isinstance(patient_history, str):
-                    if patient_history.strip():  # Check if string is not empty
-                        patient_data = json.loads(patient_history)
-                    else:
-                        logger.info(f"Empty patient history string for user {user_id}")
-                        patient_context = ""
-                        patient_data = None
-                else:
-                    patient_data = patient_history
-                
-                if patient_data:
-                    patient_context = format_patient_history(patient_data)
-                    logger.info(f"Patient history context length for user {user_id}: {len(patient_context)} characters")
-                else:
-                    logger.info(f"No patient data available for user {user_id}")
-                    
-            except (json.JSONDecodeError, TypeError) as e:
-                logger.error(f"Error parsing patient history for user {user_id}: {e}")
-                logger.error(f"Patient history type: {type(patient_history)}, value: {patient_history}")
-                patient_context = ""
-        else:
-            logger.info(f"No patient history provided for user {user_id}")
-
         # Combine document and patient context
-        full_context = ""
-        if patient_context:
-            full_context += f"PATIENT HISTORY:\n{patient_context}\n\n"
-        if document_content:
-            full_context += f"DOCUMENT CONTEXT:\n{document_content}"
+        full_context = compose_context(patient_context, lab_context, document_content)
+
+        def specialist_context(specialty: str) -> Optional[str]:
+            """
+            Context drawn from the chunks tagged with one specialty, or None to
+            use the shared context when too few of the user's chunks carry it
+            """
+            specialist_matches, _ = retrieve_user_documents(
+                question, user_id, embed_model, top_k=RETRIEVAL_CANDIDATES,
+                specialties=[specialty], query_embedding=embedded_query
+            )
+            specialist_matches = owned_matches(specialist_matches, user_id)
+            if len(specialist_matches) < SPECIALIST_MIN_MATCHES:
+                return None
+            assembled = assemble_context(specialist_matches, embedded_query, model_name=ANSWER_MODEL,
+                                         token_budget=document_budget)
+            if not assembled.text:
+                return None
+            logger.debug(f"Assembled {len(assembled.chunk_ids)} {specialty} chunks into {assembled.tokens} tokens for user {user_id}")
+            return compose_context(patient_context, lab_context, assembled.text)
 
         # Use the CentralOrchestratorAgent to process the question with combined context
-        agent = CentralOrchestratorAgent()
-        result = agent.orchestrate(question, document_context=full_context)
+        result = agent.orchestrate(question, document_context=full_context, query_embedding=embedded_query,
+                                   specialty_digests=digests, specialist_context=specialist_context)
+
+        if use_stored_profile:
+            result["profile_version"] = stored_version
 
         logger.info(f"query successful for user {user_id}")
         return result
@@ -156,63 +125,58 @@ async def ask_question(
         logger.exception(f"Error processing question for user {user_id}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
-def format_patient_history(patient_data):
-    """Format patient history data into a readable string for agents"""
-    if not patient_data or not isinstance(patient_data, dict):
-        return ""
-        
-    formatted = []
-    
-    # Demographics
-    if patient_data.get("name"):
-        formatted.append(f"Name: {patient_data['name']}")
-    if patient_data.get("dob"):
-        formatted.append(f"Date of Birth: {patient_data['dob']}")
-    if patient_data.get("gender"):
-        formatted.append(f"Gender: {patient_data['gender']}")
-    if patient_data.get("height_ft") is not None or patient_data.get("height_in") is not None:
-        height_ft = patient_data.get('height_ft', 0) or 0
-        height_in = patient_data.get('height_in', 0) or 0
-        if height_ft > 0 or height_in > 0:
-            height = f"{height_ft}' {height_in}\""
-            formatted.append(f"Height: {height}")
-    if patient_data.get("weight_lbs"):
-        formatted.append(f"Weight: {patient_data['weight_lbs']} lbs")
-    
-    # Medical History
-    if patient_data.get("conditions") and isinstance(patient_data["conditions"], list) and patient_data["conditions"]:
-        formatted.append("\nMedical Conditions:")
-        for condition in patient_data["conditions"]:
-            if isinstance(condition, dict) and condition.get('name'):
-                name = condition.get('name', 'Unknown')
-                date = condition.get('date', 'Unknown date')
-                formatted.append(f"  - {name} (Diagnosed: {date})")
-    
-    if patient_data.get("medications") and isinstance(patient_data["medications"], list) and patient_data["medications"]:
-        formatted.append("\nCurrent Medications:")
-        for med in patient_data["medications"]:
-            if isinstance(med, dict) and med.get('name'):
-                name = med.get('name', 'Unknown')
-                dosage = med.get('dosage', 'Unknown dosage')
-                reason = med.get('reason', 'Unknown reason')
-                formatted.append(f"  - {name} ({dosage}) - {reason}")
-    
-    if patient_data.get("family_history") and isinstance(patient_data["family_history"], list) and patient_data["family_history"]:
-        formatted.append(f"\nFamily History: {', '.join(patient_data['family_history'])}")
-    
-    # Goals
-    if patient_data.get("health_goals"):
-        formatted.append(f"\nHealth Goals: {patient_data['health_goals']}")
-    
-    # Symptoms
-    if patient_data.get("symptoms") and isinstance(patient_data["symptoms"], list) and patient_data["symptoms"]:
-        formatted.append("\nCurrent Symptoms:")
-        for symptom in patient_data["symptoms"]:
-            if isinstance(symptom, dict) and symptom.get('symptom'):
-                symptom_name = symptom.get('symptom', 'Unknown')
-                frequency = symptom.get('frequency', 'Unknown')
-                severity = symptom.get('severity', 'Unknown')
-                duration = symptom.get('duration', 'Unknown')
-                formatted.append(f"  - {symptom_name} (Frequency: {frequency}, Severity: {severity}, Duration: {duration})")
-    
-    return "\n".join(formatted)
\ No newline at end of file
+def owned_matches(matches, user_id):
+    """Matches whose document belongs to the requesting user"""
+    user_matches = []
+    for match in matches:
+        metadata = match.get("metadata", {})
+        document_user_id = metadata.get("user_id", "")
+        if document_user_id != user_id:
+            logger.warning(f"Document {metadata.get('filename', 'unknown')} belongs to user {document_user_id}, not requesting user {user_id}")
+            continue
+        user_matches.append(match)
+    return user_matches
+
+def parse_patient_history(patient_history, user_id):
+    """Formatted patient history from the form field, or an empty string"""
+    patient_context = ""
+    if patient_history:
+        try:
+            # Handle both JSON string and dict object formats
+            if isinstance(patient_history, str):
+                if patient_history.strip():  # Check if string is not empty
+                    patient_data = json.loads(patient_history)
+                else:
+                    logger.debug(f"Empty patient history string for user {user_id}")
+                    patient_context = ""
+                    patient_data = None
+            else:
+                patient_data = patient_history
+            
+            if patient_data:
+                patient_context = format_patient_history(patient_data)
+                logger.debug(f"Patient history context length for user {user_id}: {len(patient_context)} characters")
+            else:
+                logger.debug(f"No patient data available for user {user_id}")
+                
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Error parsing patient history for user {user_id}: {e}",
+                         extra={"patient_history": patient_history})
+            patient_context = ""
+    else:
+        logger.debug(f"No patient history provided for user {user_id}")
+    return patient_context
+
+def compose_context(patient_context, lab_context, document_content):
+    """Combine patient history, lab results and document chunks into one agent context"""
+    full_context = ""
+    if patient_context:
+        full_context += f"PATIENT HISTORY:\n{patient_context}\n\n"
+    if lab_context:
+        full_context += (
+            "LAB RESULTS (extracted from the uploaded documents; values in canonical units, "
+            f"changes, slopes and flags precomputed):\n{lab_context}\n\n"
+        )
+    if document_content:
+        full_context += f"DOCUMENT CONTEXT:\n{document_content}"
+    return full_context
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from modules.warmup import readiness
+
+router = APIRouter()
+
+@router.get("/health")
+async def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    """Readiness: 200 once background warm-up has finished, 503 until then"""
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from modules.embedding_cache import get_embedding_cache
+
+router = APIRouter()
+
+@router.get("/metrics/")
+async def get_metrics():
+    """Operational metrics for the server's caches"""
+    return {
+        "embedding_cache": get_embedding_cache().metrics()
+    }
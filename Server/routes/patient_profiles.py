@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Body, Header
+from fastapi.responses import JSONResponse, Response
+from typing import Optional, Dict, Any
+from logger import logger
+from modules.patient_profiles import get_profile_store, profile_etag, parse_etag, ProfileVersionConflict
+
+router = APIRouter()
+
+@router.get("/profiles/{user_id}")
+async def get_profile(user_id: str, if_none_match: Optional[str] = Header(None)):
+    """The user's stored patient profile; 304 if the client's ETag is current"""
+    profile = get_profile_store().get(user_id)
+    if profile is None:
+        return JSONResponse(status_code=404, content={"error": f"No profile stored for user {user_id}"})
+    etag = profile_etag(user_id, profile["version"])
+    if parse_etag(if_none_match, user_id) == profile["version"]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=profile, headers={"ETag": etag})
+
+@router.put("/profiles/{user_id}")
+async def put_profile(
+    user_id: str,
+    profile: Dict[str, Any] = Body(..., description="The patient history, as collected by the client"),
+    if_match: Optional[str] = Header(None, description="Only update if the stored profile still has this ETag")
+):
+    """Create or replace the user's patient profile; the version only changes when the content does"""
+    expected = parse_etag(if_match, user_id) if if_match and if_match.strip() != "*" else None
+    try:
+        version, changed = get_profile_store().upsert(user_id, profile, if_match=expected)
+    except ProfileVersionConflict as e:
+        logger.info(f"Rejected stale profile update for user {user_id}: {e}")
+        return JSONResponse(status_code=412, content={"error": str(e), "version": e.current},
+                            headers={"ETag": profile_etag(user_id, e.current)})
+    if changed:
+        logger.info(f"Stored profile version {version} for user {user_id}")
+    return JSONResponse(content={"user_id": user_id, "version": version, "changed": changed},
+                        headers={"ETag": profile_etag(user_id, version)})
+
+@router.delete("/profiles/{user_id}")
+async def delete_profile(user_id: str):
+    """Delete the user's stored patient profile"""
+    get_profile_store().delete(user_id)
+    return {"message": f"Profile deleted for user: {user_id}", "user_id": user_id}
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Query
+from typing import Optional
+from fastapi.responses import JSONResponse
+from modules.ingest_jobs import get_job_manager, job_status
+
+router = APIRouter()
+
+@router.get("/upload_jobs/{job_id}")
+async def get_upload_job(
+    job_id: str,
+    user_id: Optional[str] = Query(None, description="If given, the job must belong to this user")
+):
+    """Status of a background ingestion job: per-file stage, chunks done vs total, and errors"""
+    job = get_job_manager().store.get(job_id)
+    if job is None or (user_id is not None and job["user_id"] != user_id):
+        return JSONResponse(status_code=404, content={"error": f"Upload job {job_id} not found"})
+    return job_status(job)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, UploadFile, File, Query, Form
-from typing import List, Optional
+from typing import List
 from fastapi.responses import JSONResponse
 from logger import logger
-from modules.load_vectorstore import load_vectorstore, clear_user_documents
+from modules.load_vectorstore import clear_user_documents
+from modules.ingest_jobs import get_job_manager
+from modules.pdf_handlers import save_uploaded_files, UploadLimitError
 
 router = APIRouter()
 
@@ -10,7 +12,9 @@ router = APIRouter()
 async def upload_pdfs(
     files: List[UploadFile] = File(...),
     user_id: str = Form(..., description="Unique identifier for the user uploading documents"),
-    clear_existing: bool = Query(False, description="Clear existing documents for this user before uploading")
+    clear_existing: bool = Query(
+        False, description="Re-process every file from scratch; existing documents stay searchable until it finishes"
+    )
 ):
     try:
         logger.info(f"Received {len(files)} uploaded files for user: {user_id}")
@@ -19,17 +23,24 @@ async def upload_pdfs(
         filenames = [f.filename for f in files]
         logger.info(f"Files to process for user {user_id}: {filenames}")
         
-        if clear_existing:
-            logger.info(f"Clearing existing documents for user {user_id} as requested")
-            clear_user_documents(user_id)
-        
-        load_vectorstore(files, user_id)
-        logger.info(f"Documents added to vectorstore successfully for user: {user_id}")
-        return {
-            "message": f"Files processed and vectorstore updated for user {user_id}. Processed {len(files)} files: {filenames}",
-            "files_processed": filenames,
+        # Stream to disk and enforce size/page limits before touching existing documents
+        uploads = await save_uploaded_files(files, user_id)
+        logger.info(f"Saved {len(uploads)} unique files ({sum(u.size for u in uploads)} bytes) for user {user_id}")
+
+        # Parsing, embedding and upserting run as a background job that builds a new
+        # document set version; queries keep using the current one until it is published
+        job = await get_job_manager().submit(user_id, uploads, clear_existing=clear_existing)
+        logger.info(f"Queued ingestion job {job['id']} for user {user_id}")
+        return JSONResponse(status_code=202, content={
+            "message": f"Upload accepted for user {user_id}. Processing {len(uploads)} files in the background.",
+            "job_id": job["id"],
+            "status_url": f"/upload_jobs/{job['id']}",
+            "files_processed": [upload.filename for upload in uploads],
             "user_id": user_id
-        }
+        })
+    except UploadLimitError as e:
+        logger.warning(f"Rejected upload for user {user_id}: {e}")
+        return JSONResponse(status_code=413, content={"error": str(e)})
     except Exception as e:
         logger.exception(f"Error during PDF upload for user {user_id}")
         return JSONResponse(status_code=500, content={"error": str(e)})
@@ -0,0 +1,87 @@
+import asyncio
+from fastapi import APIRouter, Body, Query, Request
+from typing import List, Dict, Any
+from fastapi.responses import JSONResponse
+from logger import logger
+from modules.ingest_jobs import get_job_manager
+from modules.pdf_handlers import UploadLimitError
+from modules.upload_sessions import get_upload_sessions, UploadSessionError, UploadOffsetMismatch
+
+router = APIRouter()
+
+def _not_found(session_id):
+    return JSONResponse(status_code=404, content={"error": f"Upload session {session_id} not found"})
+
+@router.post("/upload_sessions/")
+async def create_upload_session(
+    user_id: str = Body(..., description="Unique identifier for the user uploading documents"),
+    files: List[Dict[str, Any]] = Body(..., description="The document set as [{filename, sha256, size}]"),
+    clear_existing: bool = Body(
+        False, description="Re-process every file from scratch; existing documents stay searchable until it finishes"
+    )
+):
+    """Open a resumable upload; `needed` lists the hashes the server does not have yet"""
+    try:
+        session = get_upload_sessions().create(user_id, files, clear_existing)
+    except UploadLimitError as e:
+        logger.warning(f"Rejected upload session for user {user_id}: {e}")
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except (UploadSessionError, KeyError, TypeError, ValueError) as e:
+        return JSONResponse(status_code=422, content={"error": f"Invalid file list: {e}"})
+    logger.info(f"Upload session {session['id']} for user {user_id}: "
+                f"{len(session['needed'])} of {len(session['files'])} files needed")
+    return JSONResponse(status_code=201, content=get_upload_sessions().status(session))
+
+@router.get("/upload_sessions/{session_id}")
+async def get_upload_session(session_id: str, user_id: str = Query(...)):
+    """Bytes received per file, for resuming after a dropped connection"""
+    session = get_upload_sessions().get(user_id, session_id)
+    if session is None:
+        return _not_found(session_id)
+    return get_upload_sessions().status(session)
+
+@router.put("/upload_sessions/{session_id}/files/{sha256}")
+async def upload_session_chunk(
+    session_id: str,
+    sha256: str,
+    request: Request,
+    user_id: str = Query(...),
+    offset: int = Query(..., ge=0, description="Byte offset of this chunk; must equal the bytes received so far")
+):
+    """Append a raw chunk of one file; 409 with the received offset if the chunk does not follow on"""
+    sessions = get_upload_sessions()
+    session = sessions.get(user_id, session_id)
+    if session is None:
+        return _not_found(session_id)
+    try:
+        return await sessions.append(session, sha256.lower(), offset, request.stream())
+    except UploadOffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"error": str(e), "received": e.received})
+    except UploadSessionError as e:
+        return JSONResponse(status_code=422, content={"error": str(e)})
+
+@router.post("/upload_sessions/{session_id}/commit")
+async def commit_upload_session(session_id: str, user_id: str = Query(...)):
+    """Queue the session's document set for ingestion once every file is on the server"""
+    sessions = get_upload_sessions()
+    session = sessions.get(user_id, session_id)
+    if session is None:
+        return _not_found(session_id)
+    try:
+        uploads = await asyncio.to_thread(sessions.commit, session)
+    except UploadLimitError as e:
+        logger.warning(f"Rejected upload session {session_id} for user {user_id}: {e}")
+        sessions.delete(session)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except UploadSessionError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+    job = await get_job_manager().submit(user_id, uploads, clear_existing=session["clear_existing"])
+    logger.info(f"Queued ingestion job {job['id']} for user {user_id} from upload session {session_id}")
+    return JSONResponse(status_code=202, content={
+        "message": f"Upload accepted for user {user_id}. Processing {len(uploads)} files in the background.",
+        "job_id": job["id"],
+        "status_url": f"/upload_jobs/{job['id']}",
+        "files_processed": [upload.filename for upload in uploads],
+        "user_id": user_id
+    })
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Logging Overhead Benchmark
+
+Measures how long a request thread spends inside a logging call with the
+old synchronous setup (formatting and writing to the console and a file on
+the caller's thread) and with the queued setup in `logger.py`, where the
+caller only enqueues the record. Both write to a temporary directory.
+"""
+
+import io
+import sys
+import time
+import logging
+import tempfile
+import argparse
+import statistics
+from pathlib import Path
+
+# Add the Server directory to sys.path so `logger` imports resolve
+server_root = Path(__file__).resolve().parent.parent
+if str(server_root) not in sys.path:
+    sys.path.insert(0, str(server_root))
+
+
+def _measure(log, iterations: int):
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        log.info("user query", extra={"user_id": f"bench-{i % 10}", "question": "What is my latest HbA1c?"})
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "mean_us": statistics.fmean(timings),
+        "p50_us": timings[len(timings) // 2],
+        "p99_us": timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def _sync_logger(log_dir: str, console) -> logging.Logger:
+    """The previous configuration: text lines written on the caller's thread"""
+    log = logging.getLogger("BENCH_SYNC")
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] --- %(message)s")
+    for handler in (logging.StreamHandler(console), logging.FileHandler(str(Path(log_dir) / "sync.log"))):
+        handler.setFormatter(formatter)
+        log.addHandler(handler)
+    return log
+
+
+def run_benchmark(iterations: int):
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        console = io.StringIO()
+        results["synchronous"] = _measure(_sync_logger(log_dir, console), iterations)
+
+        import logger as queued
+        queued.LOG_DIR = log_dir
+        log = queued.setup_logger("BENCH_QUEUED")
+        results["queued"] = _measure(log, iterations)
+        queued.stop_logging("BENCH_QUEUED")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare synchronous and queued logging latency")
+    parser.add_argument("--iterations", type=int, default=20000, help="Log calls per configuration")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.iterations)
+    print(f"\n{'Setup':<12} {'mean µs':>9} {'p50 µs':>9} {'p99 µs':>9}")
+    print("-" * 42)
+    for name, row in results.items():
+        print(f"{name:<12} {row['mean_us']:>9.1f} {row['p50_us']:>9.1f} {row['p99_us']:>9.1f}")
+    print("\nThe Server-Timing header on each response reports the end-to-end effect per request.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Embedding Profile Evaluation
+
+Measures, on our own ingested corpus, how each embedding profile trades
+retrieval quality for memory and search latency. Ground truth is exact
+float32 search at the model's native size; each profile is scored by
+recall@k against it.
+
+Shortened text-embedding-3 vectors are derived by truncating and
+renormalizing the native embeddings (equivalent to requesting fewer
+`dimensions`), so the whole evaluation needs at most one embedding pass
+over the corpus, which the embedding cache makes free on reruns.
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Add the Server directory to sys.path so `modules` imports resolve
+server_root = Path(__file__).resolve().parent.parent
+if str(server_root) not in sys.path:
+    sys.path.insert(0, str(server_root))
+
+from modules.chunk_store import get_chunk_store
+from modules.embedding_cache import get_embedding_model, configured_embedding_model
+from modules.embedding_profile import PROFILES, NATIVE_DIMENSIONS, EmbeddingProfile
+from modules.quantization import QuantizedMatrix, truncate_dimensions, normalize_rows
+
+RESCORE_OVERSAMPLE = 4
+
+
+def _load_corpus(user_ids: Optional[List[str]]) -> List[str]:
+    store = get_chunk_store()
+    texts = []
+    for user_id in user_ids or store.user_ids():
+        texts.extend(store.user_chunks(user_id).values())
+    return list(dict.fromkeys(texts))
+
+
+def _pseudo_queries(corpus: List[str], count: int, seed: int) -> List[str]:
+    """Short queries cut from random chunks, standing in for real questions"""
+    rng = random.Random(seed)
+    sample = rng.sample(corpus, min(count, len(corpus)))
+    queries = []
+    for text in sample:
+        words = text.split()
+        start = rng.randrange(max(1, len(words) - 12))
+        queries.append(" ".join(words[start:start + 12]))
+    return queries
+
+
+def _search(codes: QuantizedMatrix, full: Optional[np.ndarray], query: np.ndarray, k: int) -> np.ndarray:
+    sims = codes.scores(query)
+    if full is not None:
+        shortlist = np.argpartition(-sims, min(len(sims), k * RESCORE_OVERSAMPLE) - 1)[:k * RESCORE_OVERSAMPLE]
+        exact = full[shortlist] @ query
+        return shortlist[np.argsort(-exact)[:k]]
+    top = np.argpartition(-sims, k - 1)[:k]
+    return top[np.argsort(-sims[top])]
+
+
+def evaluate_profile(profile: EmbeddingProfile, model: str, doc_vectors: np.ndarray, query_vectors: np.ndarray,
+                     ground_truth: List[set], k: int) -> Dict[str, Any]:
+    """recall@k, bytes per vector and mean search latency for one profile"""
+    dims = profile.request_dimensions(model)
+    docs = truncate_dimensions(doc_vectors, dims)
+    queries = truncate_dimensions(query_vectors, dims)
+    codes = QuantizedMatrix.from_float(docs, profile.quantization)
+    full = docs if profile.keep_full_precision and profile.quantization != "float32" else None
+
+    hits = 0
+    started = time.perf_counter()
+    results = [_search(codes, full, query, k) for query in queries]
+    elapsed = time.perf_counter() - started
+    for found, truth in zip(results, ground_truth):
+        hits += len(truth.intersection(found.tolist()))
+
+    bytes_per_vector = codes.nbytes / len(codes) + (docs.shape[1] * 4 if full is not None else 0)
+    return {
+        "profile": profile.name,
+        "dimensions": docs.shape[1],
+        "quantization": profile.quantization + ("+rescore" if full is not None else ""),
+        "recall": hits / (k * len(queries)),
+        "bytes_per_vector": bytes_per_vector,
+        "latency_ms": 1000 * elapsed / len(queries),
+    }
+
+
+def run_evaluation(user_ids: Optional[List[str]] = None, k: int = 10, num_queries: int = 100,
+                   queries_file: Optional[str] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    model = configured_embedding_model()
+    corpus = _load_corpus(user_ids)
+    if len(corpus) <= k:
+        raise ValueError(f"Need more than {k} chunks in the chunk store to evaluate; found {len(corpus)}")
+
+    if queries_file:
+        queries = [line.strip() for line in Path(queries_file).read_text().splitlines() if line.strip()]
+    else:
+        queries = _pseudo_queries(corpus, num_queries, seed)
+
+    # Native-size embeddings are the reference every profile is derived from
+    embedder = get_embedding_model(model, dimensions=NATIVE_DIMENSIONS.get(model))
+    print(f"🔍 Embedding {len(corpus)} chunks and {len(queries)} queries with {model}...")
+    doc_vectors = normalize_rows(embedder.embed_documents(corpus))
+    query_vectors = normalize_rows(embedder.embed_documents(queries))
+
+    exact = doc_vectors @ query_vectors.T
+    ground_truth = [set(np.argsort(-exact[:, i])[:k].tolist()) for i in range(len(queries))]
+
+    return [
+        evaluate_profile(profile, model, doc_vectors, query_vectors, ground_truth, k)
+        for profile in PROFILES.values()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding profiles on the ingested corpus")
+    parser.add_argument("--user", action="append", help="Only use this user's chunks (repeatable)")
+    parser.add_argument("--k", type=int, default=10, help="Recall cut-off")
+    parser.add_argument("--queries", help="File with one evaluation question per line")
+    parser.add_argument("--num-queries", type=int, default=100, help="Pseudo-queries to sample when --queries is not given")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed")
+    args = parser.parse_args()
+
+    try:
+        results = run_evaluation(args.user, args.k, args.num_queries, args.queries, args.seed)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"\n{'Profile':<24} {'Dims':>5} {'Encoding':<16} {'Recall@' + str(args.k):>10} {'Bytes/vec':>10} {'ms/query':>9}")
+    print("-" * 80)
+    for row in results:
+        print(f"{row['profile']:<24} {row['dimensions']:>5} {row['quantization']:<16} "
+              f"{row['recall']:>10.3f} {row['bytes_per_vector']:>10.0f} {row['latency_ms']:>9.3f}")
+    print("\nSet settings.embedding_profile in config/agent_registry.json to adopt a profile.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Vector Index Administration
+
+The server only ever creates a missing Pinecone index; it never deletes
+one. Changes that destroy vectors, such as rebuilding the index for a new
+embedding dimension, are done explicitly with this command.
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# Add the Server directory to sys.path so `modules` imports resolve
+server_root = Path(__file__).resolve().parent.parent
+if str(server_root) not in sys.path:
+    sys.path.insert(0, str(server_root))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from modules.vector_store import (
+    PINECONE_INDEX_NAME, get_pinecone_client, index_dimension, create_pinecone_index, ensure_pinecone_index,
+    IndexConfigurationError
+)
+from modules.ingest_manifest import MANIFEST_DIR, delete_manifest
+from modules.lexical_index import get_lexical_index
+from modules.chunk_store import get_chunk_store
+from modules.lab_store import get_lab_store
+from modules.specialty_digest import get_digest_store
+
+
+def show_status(name: str):
+    pc = get_pinecone_client()
+    expected = index_dimension()
+    if name not in [i["name"] for i in pc.list_indexes()]:
+        print(f"❌ Index {name} does not exist (the server will create it with dimension {expected})")
+        return
+    info = pc.describe_index(name)
+    marker = "✅" if info.dimension == expected else "⚠️ "
+    print(f"{marker} Index {name}: dimension {info.dimension} (profile requires {expected}), "
+          f"ready: {info.status['ready']}")
+    print(pc.Index(name).describe_index_stats())
+
+
+def _manifest_files():
+    for path in Path(MANIFEST_DIR).glob("*.json"):
+        if path.name != "namespace_migration.json" and not path.name.endswith(".staging.json"):
+            yield path
+
+
+def known_users() -> set:
+    """Every user with a manifest or stored chunk text"""
+    users = set(get_chunk_store().user_ids())
+    for path in _manifest_files():
+        try:
+            users.add(json.loads(path.read_text())["user_id"])
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            print(f"⚠️  Could not read user from {path.name}: {e}")
+    return users
+
+
+def clear_ingested_documents() -> int:
+    """
+    Forget everything every user has ingested (manifest, lexical index,
+    chunk text, lab results and digests) so nothing refers to vectors the
+    new index does not have and their next upload re-ingests from scratch
+    """
+    users = known_users()
+    for user_id in users:
+        get_lexical_index().clear(user_id)
+        get_chunk_store().delete_user(user_id)
+        get_lab_store().delete_user(user_id)
+        get_digest_store().delete_user(user_id)
+        delete_manifest(user_id)
+    for path in _manifest_files():
+        path.unlink(missing_ok=True)  # Manifests whose user could not be read
+    return len(users)
+
+
+def recreate(name: str):
+    pc = get_pinecone_client()
+    expected = index_dimension()
+    if name in [i["name"] for i in pc.list_indexes()]:
+        print(f"🗑️  Deleting index {name}...")
+        pc.delete_index(name)
+    print(f"🆕 Creating index {name} with dimension {expected}...")
+    create_pinecone_index(pc, name, expected)
+    print(f"🧹 Cleared ingested documents of {clear_ingested_documents()} users; they re-ingest on their next upload")
+    print("✅ Index recreated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and administer the Pinecone vector index")
+    parser.add_argument("--index", default=PINECONE_INDEX_NAME, help="Index name")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    subparsers.add_parser("status", help="Show the index dimension, readiness and vector counts")
+    subparsers.add_parser("ensure", help="Create the index if missing and verify its dimension (non-destructive)")
+
+    recreate_parser = subparsers.add_parser("recreate", help="DELETE and recreate the index for the current profile")
+    recreate_parser.add_argument("--confirm", required=True, metavar="INDEX_NAME",
+                                 help="Repeat the index name to confirm that all vectors will be deleted")
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return
+
+    if not os.getenv("PINECONE_API_KEY"):
+        print("❌ PINECONE_API_KEY is not set")
+        sys.exit(1)
+
+    if args.command == "status":
+        show_status(args.index)
+    elif args.command == "ensure":
+        try:
+            ensure_pinecone_index(get_pinecone_client(), args.index)
+            print(f"✅ Index {args.index} exists with dimension {index_dimension()}")
+        except IndexConfigurationError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    elif args.command == "recreate":
+        if args.confirm != args.index:
+            print(f"❌ --confirm must match the index name ({args.index})")
+            sys.exit(1)
+        recreate(args.index)
+
+
+if __name__ == "__main__":
+    main()
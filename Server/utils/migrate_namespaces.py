@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Namespace Migration Utility
+
+Copies vectors from the shared default Pinecone namespace into one
+namespace per user (keyed by each vector's `user_id` metadata), in
+batches, while the API keeps serving. Progress is checkpointed after every
+batch so an interrupted run resumes where it stopped.
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Add the Server directory to sys.path so `modules` imports resolve
+server_root = Path(__file__).resolve().parent.parent
+if str(server_root) not in sys.path:
+    sys.path.insert(0, str(server_root))
+
+from modules.vector_store import user_namespace
+
+DEFAULT_CHECKPOINT = "./manifests/namespace_migration.json"
+
+
+class NamespaceMigration:
+    """Resumable copy of legacy vectors into per-user namespaces"""
+
+    def __init__(self, index, checkpoint_path: str = DEFAULT_CHECKPOINT, batch_size: int = 100,
+                 delete_source: bool = False, source_namespace: str = ""):
+        self.index = index
+        self.checkpoint_path = Path(checkpoint_path)
+        self.batch_size = batch_size
+        self.delete_source = delete_source
+        self.source_namespace = source_namespace
+        self.checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path, "r") as f:
+                return json.load(f)
+        return {"pagination_token": None, "batches": 0, "copied": 0, "skipped": 0,
+                "deleted": 0, "users": [], "done": False}
+
+    def _save_checkpoint(self):
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _migrate_page(self, ids: List[str]):
+        fetched = self.index.fetch(ids=ids, namespace=self.source_namespace).vectors
+        by_namespace: Dict[str, list] = {}
+        migrated_ids = []
+        users = set(self.checkpoint["users"])
+        for vector_id, vector in fetched.items():
+            metadata = dict(vector.metadata or {})
+            user_id = metadata.get("user_id")
+            if not user_id:
+                self.checkpoint["skipped"] += 1
+                continue
+            by_namespace.setdefault(user_namespace(user_id), []).append((vector_id, list(vector.values), metadata))
+            migrated_ids.append(vector_id)
+            users.add(user_id)
+
+        for namespace, vectors in by_namespace.items():
+            self.index.upsert(vectors=vectors, namespace=namespace)
+        self.checkpoint["copied"] += len(migrated_ids)
+        self.checkpoint["users"] = sorted(users)
+
+        if self.delete_source and migrated_ids:
+            self.index.delete(ids=migrated_ids, namespace=self.source_namespace)
+            self.checkpoint["deleted"] += len(migrated_ids)
+
+    def run(self, max_batches: Optional[int] = None) -> Dict[str, Any]:
+        """Migrate until the source is exhausted or max_batches batches have run"""
+        if self.checkpoint["done"]:
+            print("✅ Migration already complete according to checkpoint")
+            return self.checkpoint
+
+        batches_this_run = 0
+        while max_batches is None or batches_this_run < max_batches:
+            page = self.index.list_paginated(
+                namespace=self.source_namespace,
+                limit=self.batch_size,
+                pagination_token=self.checkpoint["pagination_token"]
+            )
+            ids = [vector.id for vector in page.vectors]
+            if ids:
+                self._migrate_page(ids)
+            next_token = page.pagination.next if page.pagination else None
+            self.checkpoint["pagination_token"] = next_token
+            self.checkpoint["batches"] += 1
+            self.checkpoint["done"] = next_token is None
+            self._save_checkpoint()
+            batches_this_run += 1
+            print(f"📦 Batch {self.checkpoint['batches']}: copied {self.checkpoint['copied']} vectors "
+                  f"for {len(self.checkpoint['users'])} users so far")
+            if self.checkpoint["done"]:
+                break
+
+        if self.checkpoint["done"]:
+            print(f"✅ Migration complete: {self.checkpoint['copied']} copied, "
+                  f"{self.checkpoint['skipped']} skipped (no user_id), {self.checkpoint['deleted']} deleted from source")
+        else:
+            print(f"⏸️  Paused after {batches_this_run} batches; rerun to resume")
+        return self.checkpoint
+
+
+def selftest(batch_size: int = 7) -> bool:
+    """Run a full migration against the in-memory index fake and check the result"""
+    import tempfile
+    from modules.in_memory_index import InMemoryIndex
+    from modules.vector_store import PineconeVectorStore
+
+    index = InMemoryIndex()
+    users = ["alice", "bob smith", "carol"]
+    legacy = []
+    for i in range(50):
+        user_id = users[i % len(users)]
+        values = [float(i == j) for j in range(8)]
+        legacy.append((f"legacy-{i:03d}", values, {"user_id": user_id, "text": f"chunk {i}"}))
+    legacy.append(("orphan", [1.0] * 8, {"text": "no owner"}))
+    index.upsert(vectors=legacy)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+        # Interrupt after two batches, then resume from the checkpoint
+        NamespaceMigration(index, checkpoint, batch_size, delete_source=True).run(max_batches=2)
+        result = NamespaceMigration(index, checkpoint, batch_size, delete_source=True).run()
+
+    store = PineconeVectorStore(index, legacy_fallback=False)
+    ok = result["done"] and result["copied"] == 50 and result["skipped"] == 1
+    for user_id in users:
+        matches = store.query(user_id, [1.0] * 8, top_k=100)
+        ok = ok and bool(matches) and all(match["metadata"]["user_id"] == user_id for match in matches)
+    ok = ok and set(index.namespaces[""]) == {"orphan"}
+
+    store.delete_user("alice")
+    ok = ok and not store.query("alice", [1.0] * 8, top_k=100)
+
+    print("✅ Self-test passed" if ok else "❌ Self-test failed")
+    return ok
+
+
+def _pinecone_index():
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    load_dotenv()
+    pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return pc.Index(os.getenv("PINECONE_INDEX_NAME", "pocketmdtpdfs"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy vectors into per-user Pinecone namespaces")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    run_parser = subparsers.add_parser("run", help="Run or resume the migration")
+    run_parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Path to the checkpoint file")
+    run_parser.add_argument("--batch-size", type=int, default=100, help="Vectors per batch")
+    run_parser.add_argument("--max-batches", type=int, help="Stop after this many batches")
+    run_parser.add_argument("--delete-source", action="store_true",
+                            help="Delete vectors from the default namespace once copied")
+
+    status_parser = subparsers.add_parser("status", help="Show checkpoint and namespace statistics")
+    status_parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Path to the checkpoint file")
+
+    subparsers.add_parser("selftest", help="Run the migration against an in-memory index fake")
+
+    args = parser.parse_args()
+
+    if not args.command:
+        parser.print_help()
+        return
+
+    if args.command == "selftest":
+        if not selftest():
+            sys.exit(1)
+    elif args.command == "run":
+        migration = NamespaceMigration(_pinecone_index(), args.checkpoint, args.batch_size, args.delete_source)
+        migration.run(max_batches=args.max_batches)
+    elif args.command == "status":
+        checkpoint = Path(args.checkpoint)
+        if checkpoint.exists():
+            print(checkpoint.read_text())
+        else:
+            print("No checkpoint found; migration has not started")
+        stats = _pinecone_index().describe_index_stats()
+        print(stats)
+
+
+if __name__ == "__main__":
+    main()